@@ -0,0 +1,215 @@
+'''
+Benchmarks of the geometry helpers, the sphere fit, the measurements and the CSV input/output.
+
+Runs with plain Python (no 3D Slicer) on synthetic landmark sets of 1, 1k and 100k cases:
+    python Benchmarks/benchmark_core.py -o results.json
+Every helper and measurement is timed once per case ("scalar", as in the interactive module) and on
+the whole stack of cases at once ("batch", as in the cohort evaluation). The results are written as JSON
+together with the commit and the library versions. Comparing against the results of another commit
+prints the slowdown of every benchmark and exits with status 1 if one exceeds the tolerance:
+    python Benchmarks/benchmark_core.py -o new.json --compare old.json --tolerance 0.25
+'''
+import argparse
+import csv
+import datetime
+import json
+import os
+import os.path as osp
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from BoneAngleMeterCore import helpers
+from BoneAngleMeterCore.measurements import MEASUREMENTS, measure_all_batch
+from BoneAngleMeterCore.measurement_logic import AntetorsionMeasurement
+from BoneAngleMeterCore.landmark import PointLandmark
+from Resources.cohort_cli import FIELDNAMES
+from Resources.csv_codec import CsvFormat, read_landmark_file, write_landmarks
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases, point_dicts
+
+SIZES = (1, 1000, 100000)
+
+def best_of(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def column(points, name):
+    return points[:, LANDMARK_NAMES.index(name)]
+
+def helper_arguments(points):
+    '''
+    Arguments of every helper function for a stack of cases: name -> (function, arguments with a leading case axis)
+    '''
+    femur_axis = column(points, "proximal femur midpoint") - column(points, "distal femur midpoint")
+    tibia_axis = column(points, "proximal tibia midpoint") - column(points, "distal tibia midpoint")
+    condylar = column(points, "lateral femur condyle") - column(points, "medial femur condyle")
+    cochlear = column(points, "lateral cochlea") - column(points, "medial cochlea")
+    head = points[:, [LANDMARK_NAMES.index(f"point on femur head {i}") for i in range(1, 6)]]
+    p = [column(points, name) for name in ("medial femur condyle", "lateral femur condyle", "femur neck")]
+    return {
+        "dot": (helpers.dot, (femur_axis, condylar)),
+        "vector_with_two_points": (helpers.vector_with_two_points, (p[0], p[1])),
+        "normalvector_of_three_points": (helpers.normalvector_of_three_points, (p[0], p[1], p[2])),
+        "normalvector_of_two_vectors": (helpers.normalvector_of_two_vectors, (femur_axis, condylar)),
+        "project_vector_to_plane_from_normal": (helpers.project_vector_to_plane_from_normal, (femur_axis, condylar)),
+        "project_vector_to_plane_from_2_vectors": (helpers.project_vector_to_plane_from_2_vectors, (condylar, cochlear, femur_axis)),
+        "angle": (helpers.angle, (condylar, cochlear)),
+        "angle_in_plane_with_normal": (helpers.angle_in_plane_with_normal, (tibia_axis, condylar, cochlear)),
+        "angle_in_plane_from_two_vectors": (helpers.angle_in_plane_from_two_vectors, (femur_axis, tibia_axis, condylar, cochlear)),
+        "fit_sphere_algebraic": (helpers.fit_sphere_algebraic, (head,)),
+        "fit_sphere": (helpers.fit_sphere, (head,)),
+    }
+
+def benchmark_helpers(points, repeats, max_scalar_cases):
+    for name, (function, arguments) in helper_arguments(points).items():
+        if len(points) <= max_scalar_cases:
+            cases = list(zip(*arguments))
+            yield "helpers", name, "scalar", best_of(lambda: [function(*case) for case in cases], repeats)
+        yield "helpers", name, "batch", best_of(lambda: function(*arguments), repeats)
+
+def benchmark_measurements(points, repeats, max_scalar_cases):
+    batch_dict = {name: points[:, i] for i, name in enumerate(LANDMARK_NAMES)}
+    cases = point_dicts(points) if len(points) <= max_scalar_cases else None
+    for measurement in MEASUREMENTS:
+        m = measurement()
+        m.set_side("right")
+        if cases is not None:
+            yield "measurements", m.name, "scalar", best_of(lambda: [m._measure(case) for case in cases], repeats)
+        yield "measurements", m.name, "batch", best_of(lambda: m.measure_batch(points, LANDMARK_NAMES), repeats)
+
+    m = AntetorsionMeasurement()
+    if cases is not None:
+        yield "measurements", "center_of_femur_head", "scalar", best_of(lambda: [m.center_of_femur_head(case) for case in cases], repeats)
+    yield "measurements", "center_of_femur_head", "batch", best_of(lambda: m.center_of_femur_head(batch_dict), repeats)
+
+def benchmark_register_landmarks(repeats):
+    def register():
+        landmarks = [PointLandmark(name) for name in LANDMARK_NAMES]
+        for measurement in MEASUREMENTS:
+            measurement().register_landmarks(landmarks)
+    yield "measurements", "register_landmarks (all)", "scalar", best_of(register, repeats)
+
+def write_landmark_files(points, directory):
+    # Same layout as "Export landmarks" with '.' as decimal point
+    paths = []
+    for i, case in enumerate(points):
+        path = osp.join(directory, f"case_{i:06d}_right.csv")
+        write_landmarks(path, LANDMARK_NAMES, case, CsvFormat(',', '.'))
+        paths.append(path)
+    return paths
+
+def write_measurement_file(results, path):
+    # Same layout as the output of the cohort CLI
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        for name, (angles, descriptions) in results.items():
+            for i, (value, description) in enumerate(zip(angles, descriptions)):
+                writer.writerow({'file': f"case_{i:06d}_right.csv", 'side': 'right', 'measurement': name,
+                                 'value': repr(float(value)), 'description': description})
+
+def read_measurement_file(path):
+    with open(path, 'r', newline='') as csvfile:
+        return [(row['measurement'], float(row['value'])) for row in csv.DictReader(csvfile)]
+
+def benchmark_csv(points, repeats):
+    results = measure_all_batch(points, LANDMARK_NAMES, "right")
+    with tempfile.TemporaryDirectory(prefix="BoneAngleMeterBenchmark") as directory:
+        yield "csv", "landmarks", "write", best_of(lambda: write_landmark_files(points, directory), repeats)
+        paths = write_landmark_files(points, directory)
+        yield "csv", "landmarks", "read", best_of(lambda: [read_landmark_file(path) for path in paths], repeats)
+        read_back = read_landmark_file(paths[-1])
+        assert np.allclose([read_back[name] for name in LANDMARK_NAMES], points[-1]), "landmark round trip changed the positions"
+
+        path = osp.join(directory, "measurements.csv")
+        yield "csv", "measurements", "write", best_of(lambda: write_measurement_file(results, path), repeats)
+        yield "csv", "measurements", "read", best_of(lambda: read_measurement_file(path), repeats)
+
+def run(sizes, repeats, max_scalar_cases, csv_sizes):
+    records = []
+    def record(n, group, name, mode, seconds):
+        records.append({"group": group, "name": name, "mode": mode, "cases": n, "seconds": seconds})
+        print(f"{group:13s} {name:40s} {mode:6s} {n:7d} {seconds*1000:11.3f} ms {seconds/n*1e6:10.2f} us/case")
+
+    for result in benchmark_register_landmarks(repeats):
+        record(1, *result)
+    for n in sizes:
+        points = synthetic_cases(n)
+        for result in benchmark_helpers(points, repeats, max_scalar_cases):
+            record(n, *result)
+        for result in benchmark_measurements(points, repeats, max_scalar_cases):
+            record(n, *result)
+        if n in csv_sizes:
+            # Writing 100k files takes a while, a single repetition is representative
+            for result in benchmark_csv(points, repeats if n < 10000 else 1):
+                record(n, *result)
+    return records
+
+def metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=osp.dirname(osp.abspath(__file__)),
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def compare(records, baseline_path, tolerance):
+    '''
+    Prints the ratio of every benchmark to the baseline. Returns the number of regressions.
+    '''
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r["group"], r["name"], r["mode"], r["cases"])
+    previous = {key(r): r["seconds"] for r in baseline["results"]}
+    print(f"\ncompared to {baseline['metadata'].get('commit')}:")
+    regressions = 0
+    for r in records:
+        if key(r) not in previous:
+            continue
+        ratio = r["seconds"] / previous[key(r)]
+        flag = ""
+        if ratio > 1 + tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        print(f"{r['group']:13s} {r['name']:40s} {r['mode']:6s} {r['cases']:7d} {ratio:7.2f}x{flag}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help="JSON file for the results")
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(SIZES), help="Numbers of cases (default: %(default)s)")
+    parser.add_argument('--csv-sizes', type=int, nargs='*', default=None,
+                        help="Numbers of cases for the CSV round trips (default: same as --sizes)")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--max-scalar-cases', type=int, default=1000,
+                        help="Largest number of cases that is also timed case by case (default: %(default)s)")
+    parser.add_argument('--compare', metavar='BASELINE', help="JSON results of an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    csv_sizes = args.sizes if args.csv_sizes is None else args.csv_sizes
+    records = run(args.sizes, args.repeats, args.max_scalar_cases, csv_sizes)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"metadata": metadata(), "results": records}, f, indent=1)
+    if args.compare and compare(records, args.compare, args.tolerance) > 0:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+'''
+Compares the CSV codec (Resources/csv_codec.py) with the former per-cell path, which parsed every value
+with locale.atof through csv.DictReader and formatted it with locale.str through csv.DictWriter.
+
+Timed are reading and writing of single-case landmark files and reading one landmark file holding
+all cases ("case" column), which the codec streams in blocks:
+    python Benchmarks/benchmark_csv.py --cases 1 1000 100000 -o csv.json
+With --locale (e.g. de_DE.UTF-8) the files use ';' and ',' as in a German locale.
+'''
+import argparse
+import csv
+import json
+import locale
+import os.path as osp
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from Resources.csv_codec import LANDMARK_FIELDS, locale_format, read_landmark_file, write_landmarks, iter_landmark_cases
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases
+from benchmark_core import best_of, metadata
+
+def per_cell_write(path, names, positions):
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=LANDMARK_FIELDS, delimiter=locale_format().delimiter, quoting=csv.QUOTE_MINIMAL)
+        writer.writeheader()
+        for name, position in zip(names, positions):
+            writer.writerow({"landmark name": name, "x": locale.str(position[0]),
+                             "y": locale.str(position[1]), "z": locale.str(position[2])})
+
+def per_cell_read(path):
+    with open(path, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=locale_format().delimiter, quoting=csv.QUOTE_MINIMAL)
+        return {row['landmark name']: (locale.atof(row['x']), locale.atof(row['y']), locale.atof(row['z'])) for row in reader}
+
+def per_cell_read_cases(path):
+    cases = {}
+    with open(path, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile, delimiter=locale_format().delimiter, quoting=csv.QUOTE_MINIMAL)
+        for row in reader:
+            cases.setdefault(row['case'], {})[row['landmark name']] = (locale.atof(row['x']), locale.atof(row['y']), locale.atof(row['z']))
+    return cases
+
+def write_cohort_file(path, points):
+    # One row per case and landmark, written with the codec's formatting
+    csv_format = locale_format()
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile, delimiter=csv_format.delimiter)
+        writer.writerow(['case'] + LANDMARK_FIELDS)
+        for i, case in enumerate(points):
+            values = np.char.replace(case.astype(str), '.', csv_format.decimal).tolist()
+            writer.writerows([str(i), name, *xyz] for name, xyz in zip(LANDMARK_NAMES, values))
+
+def benchmark(n, repeats, max_file_cases):
+    points = synthetic_cases(n)
+    with tempfile.TemporaryDirectory(prefix="BoneAngleMeterBenchmark") as directory:
+        n_files = min(n, max_file_cases)
+        paths = [osp.join(directory, f"case_{i:06d}.csv") for i in range(n_files)]
+        yield "landmark files", "write", "per cell", n_files, best_of(
+            lambda: [per_cell_write(path, LANDMARK_NAMES, case) for path, case in zip(paths, points)], repeats)
+        yield "landmark files", "write", "codec", n_files, best_of(
+            lambda: [write_landmarks(path, LANDMARK_NAMES, case) for path, case in zip(paths, points)], repeats)
+        yield "landmark files", "read", "per cell", n_files, best_of(lambda: [per_cell_read(path) for path in paths], repeats)
+        yield "landmark files", "read", "codec", n_files, best_of(lambda: [read_landmark_file(path) for path in paths], repeats)
+        read_back = read_landmark_file(paths[-1])
+        assert np.allclose([read_back[name] for name in LANDMARK_NAMES], points[n_files - 1])
+
+        path = osp.join(directory, "cohort.csv")
+        write_cohort_file(path, points)
+        yield "cohort file", "read", "per cell", n, best_of(lambda: per_cell_read_cases(path), repeats)
+        yield "cohort file", "read", "codec", n, best_of(lambda: sum(1 for case in iter_landmark_cases(path)), repeats)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help="JSON file for the results")
+    parser.add_argument('--cases', type=int, nargs='+', default=[1, 1000, 100000])
+    parser.add_argument('--max-file-cases', type=int, default=1000,
+                        help="Largest number of single-case files that are written (default: %(default)s)")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--locale', default='', help="Locale used for the files (default: the environment's)")
+    args = parser.parse_args(argv)
+    locale.setlocale(locale.LC_ALL, args.locale)
+
+    records = []
+    for n in args.cases:
+        results = list(benchmark(n, args.repeats, args.max_file_cases))
+        for group, operation, path, count, seconds in results:
+            records.append({"group": group, "name": operation, "mode": path, "cases": count, "seconds": seconds})
+            baseline = next(r[4] for r in results if r[:2] == (group, operation) and r[2] == "per cell")
+            print(f"{group:15s} {operation:6s} {path:9s} {count:7d} {seconds*1000:11.3f} ms {baseline/seconds:6.1f}x")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"metadata": dict(metadata(), locale=locale.setlocale(locale.LC_NUMERIC)), "results": records}, f, indent=1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+'''
+Cold import time of the Slicer-free core (BoneAngleMeterCore), measured in fresh interpreters.
+
+Every run starts a new Python process, imports numpy first and then the measurements, and reports both
+times, so the share of the core itself is visible. Exits with status 1 if the import pulls in Slicer, Qt
+or VTK, or if the median import time of the core exceeds --budget-ms:
+    python Benchmarks/benchmark_import.py --runs 10 --budget-ms 50 -o import.json
+'''
+import argparse
+import json
+import os.path as osp
+import subprocess
+import sys
+
+import numpy as np
+
+from benchmark_core import metadata
+
+MODULE_DIR = osp.dirname(osp.dirname(osp.abspath(__file__)))
+FORBIDDEN_MODULES = ("slicer", "qt", "ctk", "vtk")
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import numpy
+numpy_done = time.perf_counter()
+{statement}
+core_done = time.perf_counter()
+print(json.dumps({{"numpy": numpy_done - start, "core": core_done - numpy_done,
+                  "forbidden": [m for m in {forbidden!r} if m in sys.modules]}}))
+'''
+
+def cold_import(statement, runs):
+    results = []
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _PROBE.format(statement=statement, forbidden=FORBIDDEN_MODULES)],
+                                cwd=MODULE_DIR, capture_output=True, text=True, check=True).stdout
+        results.append(json.loads(output))
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help="JSON file for the results")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--statement', default="from BoneAngleMeterCore import MEASUREMENTS, measure_all_batch",
+                        help="Import statement that is timed (default: %(default)s)")
+    parser.add_argument('--budget-ms', type=float, default=None, help="Largest accepted median import time")
+    args = parser.parse_args(argv)
+
+    results = cold_import(args.statement, args.runs)
+    numpy_ms = np.median([r["numpy"] for r in results]) * 1000
+    core_ms = np.median([r["core"] for r in results]) * 1000
+    forbidden = sorted({m for r in results for m in r["forbidden"]})
+    print(f"numpy  {numpy_ms:8.1f} ms (median of {args.runs})")
+    print(f"core   {core_ms:8.1f} ms on top of numpy: {args.statement}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"metadata": metadata(), "statement": args.statement, "budget_ms": args.budget_ms,
+                       "runs": results}, f, indent=1)
+    status = 0
+    if forbidden:
+        print(f"The import pulls in {', '.join(forbidden)}", file=sys.stderr)
+        status = 1
+    if args.budget_ms is not None and core_ms > args.budget_ms:
+        print(f"Import time {core_ms:.1f} ms exceeds the budget of {args.budget_ms:.1f} ms", file=sys.stderr)
+        status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
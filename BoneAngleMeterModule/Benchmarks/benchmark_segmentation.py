@@ -0,0 +1,83 @@
+'''
+Compares the segment editor based thresholding with the NumPy threshold engine.
+
+Inside 3D Slicer both paths are timed on a synthetic volume and their masks are compared:
+    Slicer --no-main-window --python-script Benchmarks/benchmark_segmentation.py --size 512
+With plain Python only the engine is timed with different numbers of threads:
+    python Benchmarks/benchmark_segmentation.py --size 512
+'''
+import argparse
+import os
+import os.path as osp
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from Resources.threshold_engine import threshold_volume
+
+def synthetic_volume(size, seed=0):
+    '''
+    CT-like int16 volume: soft tissue background with a few bright cylindrical "bones"
+    '''
+    rng = np.random.default_rng(seed)
+    voxels = rng.normal(40, 30, size=(size, size, size)).astype(np.int16)
+    y, x = np.ogrid[:size, :size]
+    for cy, cx, r in ((0.4, 0.4, 0.08), (0.6, 0.6, 0.06), (0.5, 0.3, 0.05)):
+        voxels[:, (y - cy*size)**2 + (x - cx*size)**2 < (r*size)**2] += 1000
+    return voxels
+
+def best_of(function, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def benchmark_engine(voxels, lower, upper, repeats):
+    thread_counts = sorted({1, 2, 4, os.cpu_count() or 1})
+    for workers in thread_counts:
+        t, _ = best_of(lambda: threshold_volume(voxels, lower, upper, workers), repeats)
+        print(f"engine, {workers:3d} threads: {t*1000:9.1f} ms")
+
+def benchmark_slicer(voxels, lower, upper, repeats):
+    import slicer
+    from Resources.segmentation_logic import create_segmentation_node, threshold_with_segment_editor, threshold_with_engine
+
+    volume_node = slicer.util.addVolumeFromArray(voxels, name="Benchmark volume")
+    segmentation_node, segment_id = create_segmentation_node("Benchmark segmentation", volume_node)
+
+    t_editor, _ = best_of(lambda: threshold_with_segment_editor(segmentation_node, segment_id, volume_node, lower, upper), repeats)
+    mask_editor = slicer.util.arrayFromSegmentBinaryLabelmap(segmentation_node, segment_id, volume_node)
+    t_engine, _ = best_of(lambda: threshold_with_engine(segmentation_node, segment_id, volume_node, lower, upper), repeats)
+    mask_engine = slicer.util.arrayFromSegmentBinaryLabelmap(segmentation_node, segment_id, volume_node)
+
+    print(f"segment editor:   {t_editor*1000:9.1f} ms")
+    print(f"threshold engine: {t_engine*1000:9.1f} ms ({t_editor/t_engine:.1f}x)")
+    print(f"masks identical:  {np.array_equal(mask_editor != 0, mask_engine != 0)}")
+
+    slicer.mrmlScene.RemoveNode(segmentation_node)
+    slicer.mrmlScene.RemoveNode(volume_node)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=256, help="Edge length of the cubic test volume (default: %(default)s)")
+    parser.add_argument('--lower', type=int, default=300)
+    parser.add_argument('--upper', type=int, default=3000)
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args(argv)
+
+    voxels = synthetic_volume(args.size)
+    print(f"volume {voxels.shape}, {voxels.nbytes/1e6:.0f} MB")
+    benchmark_engine(voxels, args.lower, args.upper, args.repeats)
+    try:
+        import slicer
+    except ImportError:
+        return
+    benchmark_slicer(voxels, args.lower, args.upper, args.repeats)
+    slicer.util.exit(0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+'''
+Startup cost of the module inside 3D Slicer: the import of BoneAngleMeterModule.py, which Slicer does on
+every application start, and setup() of the module widget, which runs when the module is first opened.
+
+The import is broken down per imported module (cumulative and self time), setup() per source file:
+    Slicer --no-main-window --python-script Benchmarks/profile_startup.py -- --budget-ms 100 -o startup.json
+Exits with status 1 if the import takes longer than --budget-ms.
+'''
+import argparse
+import cProfile
+import importlib
+import json
+import os.path as osp
+import pstats
+import sys
+import time
+
+import qt, slicer
+
+sys.path.insert(0, osp.dirname(osp.abspath(__file__)))
+sys.path.insert(0, osp.dirname(osp.dirname(osp.abspath(__file__))))
+from benchmark_core import metadata
+
+PROJECT_PACKAGES = ("BoneAngleMeterModule", "Resources", "BoneAngleMeterCore")
+
+class ImportTimer:
+    '''
+    Meta path finder that times the execution of every module imported while it is installed
+    '''
+    def __init__(self):
+        self.cumulative = {}
+        self.self_time = {}
+        self._stack = []
+
+    def find_spec(self, name, path=None, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, 'exec_module'):
+                    spec.loader = _TimedLoader(spec.loader, self)
+                return spec
+        return None
+
+    def __enter__(self):
+        sys.meta_path.insert(0, self)
+        return self
+
+    def __exit__(self, *exc):
+        sys.meta_path.remove(self)
+
+class _TimedLoader:
+    def __init__(self, loader, timer):
+        self.loader = loader
+        self.timer = timer
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        timer = self.timer
+        timer._stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = timer._stack.pop()
+            if timer._stack:
+                timer._stack[-1] += elapsed
+            timer.cumulative[module.__name__] = elapsed
+            timer.self_time[module.__name__] = elapsed - children
+
+def forget_project_modules():
+    for name in list(sys.modules):
+        if name.split(".")[0] in PROJECT_PACKAGES:
+            del sys.modules[name]
+    importlib.invalidate_caches()
+
+def profile_import():
+    forget_project_modules()
+    with ImportTimer() as timer:
+        start = time.perf_counter()
+        module = importlib.import_module("BoneAngleMeterModule")
+        total = time.perf_counter() - start
+    return module, total, timer
+
+def profile_setup(module):
+    parent = slicer.qMRMLWidget()
+    parent.setLayout(qt.QVBoxLayout())
+    parent.setMRMLScene(slicer.mrmlScene)
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    widget = module.BoneAngleMeterModuleWidget(parent)
+    widget.setup()
+    profiler.disable()
+    total = time.perf_counter() - start
+    per_file = {}
+    for (filename, line, function), (cc, nc, tottime, cumtime, callers) in pstats.Stats(profiler).stats.items():
+        per_file[filename] = per_file.get(filename, 0.0) + tottime
+    widget.cleanup()
+    return total, per_file
+
+def print_table(title, rows, limit):
+    print(title)
+    for name, *times in sorted(rows, key=lambda row: -row[1])[:limit]:
+        print("  " + " ".join(f"{t*1000:9.2f}" for t in times) + f"  {name}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-o', '--output', help="JSON file for the results")
+    parser.add_argument('--budget-ms', type=float, default=None, help="Largest accepted import time")
+    parser.add_argument('--top', type=int, default=20, help="Rows per table (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    module, import_time, timer = profile_import()
+    print(f"import BoneAngleMeterModule: {import_time*1000:.1f} ms")
+    print_table("  cumul. ms   self ms  module",
+                [(name, timer.cumulative[name], timer.self_time[name]) for name in timer.cumulative], args.top)
+    results = {"metadata": metadata(), "budget_ms": args.budget_ms, "import": import_time,
+               "modules": {name: {"cumulative": timer.cumulative[name], "self": timer.self_time[name]}
+                           for name in timer.cumulative}}
+    setup_time, per_file = profile_setup(module)
+    print(f"BoneAngleMeterModuleWidget.setup(): {setup_time*1000:.1f} ms")
+    print_table("    self ms  file", list(per_file.items()), args.top)
+    results["setup"] = setup_time
+    results["setup_files"] = per_file
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1)
+    status = 0
+    if args.budget_ms is not None and import_time*1000 > args.budget_ms:
+        print(f"Import time {import_time*1000:.1f} ms exceeds the budget of {args.budget_ms:.1f} ms", file=sys.stderr)
+        status = 1
+    slicer.util.exit(status)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+'''
+Synthetic, anatomically plausible landmark sets for the benchmarks.
+
+The template is a right leg in RAS-like coordinates (mm): x points laterally, y along the anteroposterior
+axis and z cranially, with the centre of the femur head at the origin. Every case is the template scaled to
+a random body size, rotated by a few degrees and with every landmark displaced by placement noise. The femur
+head points lie on the head sphere, on its cranial and medial side where they can be placed in the CT.
+'''
+import numpy as np
+
+FEMUR_HEAD_RADIUS = 23.0
+
+TEMPLATE = {
+    "femur neck": (30.0, -8.0, -22.0),
+    "proximal femur midpoint": (45.0, 2.0, -90.0),
+    "distal femur midpoint": (42.0, 4.0, -360.0),
+    "medial femur condyle": (18.0, -22.0, -425.0),
+    "lateral femur condyle": (68.0, -20.0, -425.0),
+    "condylus medialis tibiae": (20.0, -25.0, -445.0),
+    "condylus lateralis tibiae": (66.0, -22.0, -445.0),
+    "lateral condyle articulation point tibia": (62.0, -2.0, -440.0),
+    "medial condyle articulation point tibia": (26.0, -2.0, -440.0),
+    "proximal tibia midpoint": (44.0, 2.0, -540.0),
+    "distal tibia midpoint": (42.0, 6.0, -800.0),
+    "medial cochlea": (30.0, 10.0, -808.0),
+    "lateral cochlea": (58.0, -6.0, -808.0),
+    "medial cochlea articulation point tibia": (33.0, 8.0, -812.0),
+    "lateral cochlea articulation point tibia": (55.0, -4.0, -812.0),
+    "medial talus": (28.0, 4.0, -830.0),
+    "lateral talus": (58.0, -8.0, -830.0),
+}
+
+# Directions of the femur head points from the head centre
+HEAD_DIRECTIONS = np.array([
+    (0.0, 0.0, 1.0),
+    (-0.7, 0.0, 0.7),
+    (-0.5, 0.6, 0.6),
+    (-0.5, -0.6, 0.6),
+    (-1.0, 0.0, 0.0),
+])
+
+LANDMARK_NAMES = tuple(TEMPLATE) + tuple(f"point on femur head {i}" for i in range(1, 6))
+
+def _rotations(rng, n, max_degrees):
+    # Rotation matrices about random axes by up to max_degrees (Rodrigues' formula)
+    axes = rng.normal(size=(n, 3))
+    axes /= np.linalg.norm(axes, axis=-1, keepdims=True)
+    angles = np.radians(rng.uniform(-max_degrees, max_degrees, size=n))
+    K = np.zeros((n, 3, 3))
+    K[:, 0, 1], K[:, 0, 2], K[:, 1, 2] = -axes[:, 2], axes[:, 1], -axes[:, 0]
+    K -= np.swapaxes(K, 1, 2)
+    s, c = np.sin(angles)[:, None, None], np.cos(angles)[:, None, None]
+    return np.eye(3) + s*K + (1 - c)*(K @ K)
+
+def synthetic_cases(n, seed=0, noise=1.5, max_rotation=8.0):
+    '''
+    Returns the landmark positions of n cases as array of shape (n, len(LANDMARK_NAMES), 3),
+    ordered like LANDMARK_NAMES along the second axis.
+    '''
+    rng = np.random.default_rng(seed)
+    directions = HEAD_DIRECTIONS / np.linalg.norm(HEAD_DIRECTIONS, axis=-1, keepdims=True)
+    template = np.concatenate([np.array(list(TEMPLATE.values())), FEMUR_HEAD_RADIUS*directions])
+    scale = rng.uniform(0.85, 1.15, size=(n, 1, 1))
+    points = (scale*template) @ np.swapaxes(_rotations(rng, n, max_rotation), 1, 2)
+    # Head points are placed on the bone surface, so they scatter much less than the other landmarks
+    scatter = np.full((len(template), 1), noise)
+    scatter[len(TEMPLATE):] = 0.3
+    points += scatter*rng.normal(size=points.shape)
+    return points
+
+def point_dicts(points, landmark_names=LANDMARK_NAMES):
+    '''
+    Splits a stack of cases into one dictionary of landmark positions per case
+    '''
+    return [{name: case[i] for i, name in enumerate(landmark_names)} for case in points]
@@ -0,0 +1,37 @@
+'''
+Geometry and measurement core of BoneAngleMeter. It depends on numpy only, so it can be imported in plain
+Python processes such as multiprocessing workers, without Slicer or Qt:
+
+    from BoneAngleMeterCore import MEASUREMENTS, LANDMARK_NAMES, measure_all_batch
+    results = measure_all_batch(points, LANDMARK_NAMES, "left")
+
+The Slicer side (markups landmarks, segmentation, widgets) lives in Resources and adapts to this package.
+The names below are imported from their submodules on first access, so importing a single submodule
+(e.g. instrumentation) does not load the measurements.
+'''
+import importlib
+
+_EXPORTS = {
+    "LANDMARK_DEFINITIONS": "landmark_definitions",
+    "LANDMARK_NAMES": "landmark_definitions",
+    "PointLandmark": "landmark",
+    "GeometryGraph": "geometry_graph",
+    "MeasurementSpec": "measurement_kernel",
+    "BaseMeasurement": "measurement_logic",
+    "SpecMeasurement": "measurement_logic",
+    "measurement_class": "measurement_logic",
+    "MEASUREMENTS": "measurements",
+    "measure_all_batch": "measurements",
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,38 @@
+from collections import namedtuple
+
+import numpy as np
+
+from BoneAngleMeterCore.helpers import fit_sphere_ransac
+from BoneAngleMeterCore.surface_index import SurfaceIndex
+
+FemurHeadFit = namedtuple('FemurHeadFit', ['center', 'radius', 'n_points', 'n_inliers', 'rms'])
+
+# Plausible femur head radii in mm
+FEMUR_HEAD_RADIUS_RANGE = (12.0, 35.0)
+
+def femur_head_from_surface(vertices, seed, search_radius=40.0, threshold=0.5, max_points=4000,
+                            iterations=256, radius_range=FEMUR_HEAD_RADIUS_RANGE, rng=0):
+    '''
+    Fits a sphere to the bone surface around a point on the femur head. The surface vertices (n, 3)
+    within search_radius of seed form the head region; at most max_points of them are used for the
+    robust fit, so neck, trochanter and acetabulum points end up as outliers. Inliers are vertices
+    within threshold (mm) of the sphere. Returns a FemurHeadFit with the number of region points,
+    the number of inliers and their rms distance to the sphere, or None if no sphere was found.
+    vertices can also be a SurfaceIndex, which finds the head region without looking at every vertex.
+    '''
+    seed = np.asarray(seed, dtype=float)
+    if isinstance(vertices, SurfaceIndex):
+        region = vertices.within(seed, search_radius)
+    else:
+        vertices = np.asarray(vertices, dtype=float)
+        # A slab around the seed first, so the full distance is only computed for a small part of the surface
+        region = vertices[np.abs(vertices[:, 0] - seed[0]) < search_radius]
+        region = region[np.einsum('ij,ij->i', region - seed, region - seed) < search_radius**2]
+    if len(region) > max_points:
+        region = region[np.random.default_rng(rng).choice(len(region), max_points, replace=False)]
+    result = fit_sphere_ransac(region, threshold, iterations, radius_range, rng)
+    if result is None:
+        return None
+    center, radius, inliers = result
+    residuals = np.linalg.norm(region[inliers] - center, axis=-1) - radius
+    return FemurHeadFit(center, float(radius), len(region), int(inliers.sum()), float(np.sqrt(np.mean(residuals**2))))
@@ -0,0 +1,109 @@
+import numpy as np
+
+from BoneAngleMeterCore.helpers import vector_with_two_points, fit_sphere, sphere_center_jacobian
+
+def _center_of_sphere(*points):
+    center, radius = fit_sphere(np.stack(points, axis=-2))
+    return center
+
+def _vector_gradients(gradient, i, j):
+    return -gradient, gradient
+
+def _center_of_sphere_gradients(gradient, *points):
+    points = np.stack(points, axis=-2)
+    center, radius = fit_sphere(points)
+    gradients = np.einsum('...i,...kij->...kj', gradient, sphere_center_jacobian(points, center, radius))
+    return tuple(gradients[..., k, :] for k in range(points.shape[-2]))
+
+# Intermediate geometry that is shared between measurements. Each node is computed from landmarks
+# and/or other nodes: name -> (input names, function of the inputs).
+GEOMETRY_NODES = {
+    "tibia axis": (("distal tibia midpoint", "proximal tibia midpoint"), vector_with_two_points),
+    "femur axis": (("distal femur midpoint", "proximal femur midpoint"), vector_with_two_points),
+    "cochlear vector": (("medial cochlea", "lateral cochlea"), vector_with_two_points),
+    "tibial condylar vector": (("condylus medialis tibiae", "condylus lateralis tibiae"), vector_with_two_points),
+    "femoral condylar vector": (("medial femur condyle", "lateral femur condyle"), vector_with_two_points),
+    "talar vector": (("medial talus", "lateral talus"), vector_with_two_points),
+    "femur head center": (tuple(f"point on femur head {i}" for i in range(1, 6)), _center_of_sphere),
+}
+
+# Backpropagation through the node functions: function -> function of the gradient of a scalar with respect
+# to the node value, followed by the inputs, that returns the gradients with respect to each input
+NODE_GRADIENTS = {
+    vector_with_two_points: _vector_gradients,
+    _center_of_sphere: _center_of_sphere_gradients,
+}
+
+def resolve(point_dict, name):
+    '''
+    Returns a landmark position or a geometry node from point_dict. Plain dictionaries only need to contain
+    the landmarks, nodes they do not contain are then computed on the fly. A GeometryGraph serves the nodes
+    from its cache.
+    '''
+    if name in point_dict or name not in GEOMETRY_NODES:
+        return point_dict[name]
+    inputs, function = GEOMETRY_NODES[name]
+    return function(*(resolve(point_dict, i) for i in inputs))
+
+def resolve_gradient(point_dict, name, gradient, landmark_names, out):
+    '''
+    Backpropagates the gradient (..., 3) of a scalar with respect to a landmark or geometry node to the
+    coordinates of the landmarks in landmark_names and adds it to out (..., len(landmark_names), 3).
+    Other entries of a plain point_dict, e.g. a femur head center given instead of its points, are
+    constants; the nodes of a GeometryGraph depend on its landmarks and take their inputs from its cache.
+    '''
+    if name in landmark_names:
+        out[..., landmark_names.index(name), :] += gradient
+    elif name in GEOMETRY_NODES and (isinstance(point_dict, GeometryGraph) or name not in point_dict):
+        inputs, function = GEOMETRY_NODES[name]
+        gradients = NODE_GRADIENTS[function](gradient, *(resolve(point_dict, i) for i in inputs))
+        for i, input_gradient in zip(inputs, gradients):
+            resolve_gradient(point_dict, i, input_gradient, landmark_names, out)
+
+class GeometryGraph:
+    '''
+    Memoizes landmark positions and geometry nodes of one side. Every cached value is keyed by the
+    revisions of the landmarks it depends on, so it is recomputed only after one of these landmarks moved.
+    Can be passed to measurements instead of a dictionary of landmark positions.
+    '''
+    def __init__(self, landmarks):
+        self.landmarks = {landmark.name: landmark for landmark in landmarks}
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+        self._leaves = {}
+
+    def leaves(self, name):
+        '''
+        Returns the names of all landmarks a node depends on
+        '''
+        if name not in self._leaves:
+            if name in GEOMETRY_NODES:
+                leaves = []
+                for i in GEOMETRY_NODES[name][0]:
+                    leaves.extend(l for l in self.leaves(i) if l not in leaves)
+                self._leaves[name] = tuple(leaves)
+            else:
+                self._leaves[name] = (name,)
+        return self._leaves[name]
+
+    def revision(self, name):
+        return tuple(self.landmarks[l].revision for l in self.leaves(name))
+
+    def __contains__(self, name):
+        return name in self.landmarks or name in GEOMETRY_NODES
+
+    def __getitem__(self, name):
+        revision = self.revision(name)
+        cached = self._cache.get(name)
+        if cached is not None and cached[0] == revision:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        if name in GEOMETRY_NODES:
+            inputs, function = GEOMETRY_NODES[name]
+            value = function(*(self[i] for i in inputs))
+        else:
+            value = self.landmarks[name].get_position()
+        self._cache[name] = (revision, value)
+        return value
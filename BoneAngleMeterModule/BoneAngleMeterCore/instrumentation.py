@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+class _Span:
+    __slots__ = ("tracer", "name", "fan_out", "_start")
+
+    def __init__(self, tracer, name, fan_out):
+        self.tracer = tracer
+        self.name = name
+        self.fan_out = fan_out
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.tracer._record(self.name, self._start, time.perf_counter_ns() - self._start, self.fan_out)
+        return False
+
+class _NullSpan:
+    # Returned while recording is off, discards everything
+    __slots__ = ()
+
+    @property
+    def fan_out(self):
+        return 0
+
+    @fan_out.setter
+    def fan_out(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class Tracer:
+    '''
+    Opt-in recorder of timed spans. Code paths are wrapped in "with TRACER.span(name) as span:" and may set
+    span.fan_out to the number of calls they trigger (callbacks, slice views, threads...). While enabled is
+    False span() returns a shared no-op object, so the instrumentation costs next to nothing.
+    The most recent max_spans spans are kept. They can be summarized as latency percentiles or exported
+    in the Chrome trace event format, which is read by chrome://tracing and https://ui.perfetto.dev.
+    '''
+    def __init__(self, max_spans=200000):
+        self.enabled = False
+        self._spans = deque(maxlen=max_spans) # (name, start ns, duration ns, thread id, fan-out)
+        self._origin = time.perf_counter_ns()
+
+    def span(self, name, fan_out=0):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, fan_out)
+
+    def _record(self, name, start, duration, fan_out):
+        # deque.append is atomic, spans can be recorded from worker threads
+        self._spans.append((name, start, duration, threading.get_ident(), fan_out))
+
+    def clear(self):
+        self._spans.clear()
+
+    def __len__(self):
+        return len(self._spans)
+
+    def summary(self):
+        '''
+        Returns one dictionary per span name with the count, the 50th/95th/99th percentile and maximum
+        of the duration in milliseconds, and the mean fan-out
+        '''
+        durations, fan_outs = {}, {}
+        for name, start, duration, thread, fan_out in list(self._spans):
+            durations.setdefault(name, []).append(duration)
+            fan_outs.setdefault(name, []).append(fan_out)
+        rows = []
+        for name in sorted(durations):
+            d = np.array(durations[name]) / 1e6
+            p50, p95, p99 = np.percentile(d, [50, 95, 99]).tolist()
+            rows.append({"name": name, "count": len(d), "p50": p50, "p95": p95, "p99": p99, "max": float(d.max()),
+                         "fan_out": float(np.mean(fan_outs[name]))})
+        return rows
+
+    def chrome_trace(self):
+        pid = os.getpid()
+        events = [{"name": name, "cat": name.split(".")[0], "ph": "X", "pid": pid, "tid": thread,
+                   "ts": (start - self._origin) / 1000, "dur": duration / 1000, "args": {"fan_out": fan_out}}
+                  for name, start, duration, thread, fan_out in list(self._spans)]
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.chrome_trace(), f)
+
+
+TRACER = Tracer()
@@ -0,0 +1,34 @@
+import numpy as np
+
+class PointLandmark:
+    '''
+    Landmark that only holds a position, with the interface the measurements use (name, placed, revision,
+    get_position and change callbacks). Stands in for the Slicer landmarks in scripts and workers.
+    '''
+    def __init__(self, name, position=None):
+        self.name = name
+        self.placed = False
+        self.revision = 0
+        self.position = None
+        self.change_callbacks = []
+        if position is not None:
+            self.define(*position, notify=False)
+
+    def add_change_callback(self, callback):
+        if callback not in self.change_callbacks:
+            self.change_callbacks.append(callback)
+
+    def remove_change_callback(self, callback):
+        if callback in self.change_callbacks:
+            self.change_callbacks.remove(callback)
+
+    def define(self, x, y, z, notify=True):
+        self.position = np.array([x, y, z], dtype=float)
+        self.placed = True
+        self.revision += 1
+        if notify:
+            for callback in list(self.change_callbacks):
+                callback()
+
+    def get_position(self):
+        return self.position
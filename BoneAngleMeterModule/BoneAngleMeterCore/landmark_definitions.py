@@ -0,0 +1,72 @@
+# Name, placement instructions and illustration of every landmark, in the order of the landmark tables.
+# Kept free of Slicer imports so that file formats and command line tools can use the names.
+LANDMARK_DEFINITIONS = [
+    ('distal tibia midpoint',
+     "Choose the most distal midpoint of the diaphysis in a circular tibia transversal plane.",
+     r"Resources/descriptions/disttibiamiddpoint.png"),
+    ('proximal tibia midpoint',
+     "Choose the point in the middle of the diaphysis at the height of the foramen nutricum.",
+     r"Resources/descriptions/proxtibiamidpoint.png"),
+    ('lateral cochlea',
+     "Choose the most cranial point on the cochlea tibiae lateralis.",
+     r"Resources/descriptions/lateralcochlea.png"),
+    ('medial cochlea',
+     "Choose the most cranial point on the cochlea tibiae medialis.",
+     r"Resources/descriptions/medialcochlea.png"),
+    ('condylus medialis tibiae',
+     "Choose the most caudal point on the convex condyle surface.",
+     r"Resources/descriptions/condylusmedtibiae.png"),
+    ('condylus lateralis tibiae',
+     "Choose the most caudal point on the convex condyle surface.",
+     r"Resources/descriptions/condyluslateralistibiae.png"),
+    ('lateral condyle articulation point tibia',
+     "Choose the lowest midpoint of the condylus tibialis lateralis articulation groove.",
+     r"Resources/descriptions/latcondylearticulationpoint.png"),
+    ('medial condyle articulation point tibia',
+     "Choose the lowest midpoint of the condylus tibialis medialis articulation groove.",
+     r"Resources/descriptions/medialcondylearticulationpoint.png"),
+    ('medial cochlea articulation point tibia',
+     "Choose the lowest midpoint of the cochlea tibialis medialis articulation groove.",
+     r"Resources/descriptions/medcochleaarticulationpoint.png"),
+    ('lateral cochlea articulation point tibia',
+     "Choose the lowest midpoint of the cochlea tibialis lateralis articulation groove.",
+     r"Resources/descriptions/lateralcochleaarticulationpoint.png"),
+    ('medial talus',
+     "Choose the most dorsal point on the trochlea tali.",
+     r"Resources/descriptions/medialtalus.png"),
+    ('lateral talus',
+     "Choose the most dorsal point on the trochlea tali.",
+     r"Resources/descriptions/lateraltalus.png"),
+    ('medial femur condyle',
+     "Choose the most caudal point on the convex condyle surface.",
+     r"Resources/descriptions/medfemurcondyle.png"),
+    ('lateral femur condyle',
+     "Choose the most caudal point on the convex condyle surface.",
+     r"Resources/descriptions/lateralfemurcondyle.png"),
+    ('proximal femur midpoint',
+     "Choose the point on one third of the height of the femur in the middle of the diaphysis.",
+     r"Resources/descriptions/proxfemurmidpoint.png"),
+    ('distal femur midpoint',
+     "Choose the point on two thirds of the height of the femur in the middle of the diaphysis",
+     r"Resources/descriptions/distfemurmidpoint.png"),
+    ('femur neck', 
+     "Choose the center of the proximal femoral metaphysis on the height of the highest elevation of the lesser trochanter.", 
+     r"Resources/descriptions/femurneck.png"),
+    ('point on femur head 1',
+     "Choose points along the capital bearing area on many different planes.",
+     r"Resources/descriptions/point on femur head.png"),
+    ('point on femur head 2',
+     "Choose points along the capital bearing area on many different planes.",
+     r"Resources/descriptions/point on femur head.png"),
+    ('point on femur head 3',
+     "Choose points along the capital bearing area on many different planes.",
+     r"Resources/descriptions/point on femur head.png"),
+    ('point on femur head 4',
+     "Choose points along the capital bearing area on many different planes.",
+     r"Resources/descriptions/point on femur head.png"),
+    ('point on femur head 5',
+     "Choose points along the capital bearing area on many different planes.",
+     r"Resources/descriptions/point on femur head.png")
+]
+
+LANDMARK_NAMES = tuple(name for name, description, image_path in LANDMARK_DEFINITIONS)
@@ -0,0 +1,148 @@
+'''
+Declarative definitions of plane angle measurements.
+
+A MeasurementSpec describes the angle between two vectors after both are projected onto the plane
+with the given normal, and the orientation of the pair about the normal:
+    name         display name of the measurement
+    landmarks    landmark names in the order in which they should be placed
+    normal       vector expression of the plane normal
+    vectors      two vector expressions (u, v); the orientation is the sign of (u x v) . normal
+    labels       descriptions for a positive and a non-positive orientation on the right side,
+                 swapped on the left side (see BaseMeasurement.LABELS)
+    offset       added to the angle in degrees
+    description  shown in the measurement widget
+
+Vector expressions are landmark or geometry node names (see GEOMETRY_NODES), ("vector", a, b) for the
+vector from point a to point b and ("cross", x, y) for the cross product of two vector expressions.
+compile_measurement turns a spec into a single function that works on single positions and on stacks.
+It gives the same angles as projecting both vectors and taking their angle with helpers.angle, including
+NaN for a vanishing projected vector or normal. compile_gradient adds the derivatives of the angle with
+respect to the landmark coordinates.
+'''
+from collections import namedtuple
+
+import numpy as np
+
+from BoneAngleMeterCore.geometry_graph import resolve, resolve_gradient
+
+MeasurementSpec = namedtuple('MeasurementSpec', ['name', 'landmarks', 'normal', 'vectors', 'labels', 'offset', 'description'],
+                             defaults=(0.0, ""))
+
+def _cross(u, v):
+    u0, u1, u2 = u[..., 0], u[..., 1], u[..., 2]
+    v0, v1, v2 = v[..., 0], v[..., 1], v[..., 2]
+    return np.stack([u1*v2 - u2*v1, u2*v0 - u0*v2, u0*v1 - u1*v0], axis=-1)
+
+def compile_vector(expression):
+    '''
+    Returns a function of a point dictionary (or GeometryGraph) that evaluates a vector expression
+    '''
+    if isinstance(expression, str):
+        return lambda point_dict: resolve(point_dict, expression)
+    operation, a, b = expression
+    get_a, get_b = compile_vector(a), compile_vector(b)
+    if operation == "vector":
+        return lambda point_dict: get_b(point_dict) - get_a(point_dict)
+    if operation == "cross":
+        return lambda point_dict: _cross(get_a(point_dict), get_b(point_dict))
+    raise ValueError(f"Unknown vector operation {operation!r}")
+
+def compile_vector_gradient(expression):
+    '''
+    Returns backpropagate(point_dict, gradient, landmark_names, out) for a vector expression, which adds
+    the derivatives of a scalar with respect to the landmark coordinates to out, given its gradient with
+    respect to the vector (see resolve_gradient)
+    '''
+    if isinstance(expression, str):
+        return lambda point_dict, gradient, names, out: resolve_gradient(point_dict, expression, gradient, names, out)
+    operation, a, b = expression
+    back_a, back_b = compile_vector_gradient(a), compile_vector_gradient(b)
+    if operation == "vector":
+        def vector(point_dict, gradient, names, out):
+            back_a(point_dict, -gradient, names, out)
+            back_b(point_dict, gradient, names, out)
+        return vector
+    if operation == "cross":
+        get_a, get_b = compile_vector(a), compile_vector(b)
+        def cross(point_dict, gradient, names, out):
+            # g.(da x b) = da.(b x g) and g.(a x db) = db.(g x a)
+            a, b = get_a(point_dict), get_b(point_dict)
+            back_a(point_dict, _cross(b, gradient), names, out)
+            back_b(point_dict, _cross(gradient, a), names, out)
+        return cross
+    raise ValueError(f"Unknown vector operation {operation!r}")
+
+def _plane_angle(n, u, v):
+    # Angle in degrees between u and v projected onto the plane with normal n, the orientation q and the
+    # dot products (nn, nu, nv, c) it is computed from
+    n0, n1, n2 = n[..., 0], n[..., 1], n[..., 2]
+    u0, u1, u2 = u[..., 0], u[..., 1], u[..., 2]
+    v0, v1, v2 = v[..., 0], v[..., 1], v[..., 2]
+    nn = n0*n0 + n1*n1 + n2*n2
+    nu = n0*u0 + n1*u1 + n2*u2
+    nv = n0*v0 + n1*v1 + n2*v2
+    # The projection onto the plane only removes multiples of n: the dot product of the projected
+    # vectors follows from the unprojected ones, and the triple product (the orientation) is unchanged.
+    # Their cross product is parallel to n, so its length is |q| / |n|.
+    c = u0*v0 + u1*v1 + u2*v2 - nu*nv/nn
+    q = n0*(u1*v2 - u2*v1) + n1*(u2*v0 - u0*v2) + n2*(u0*v1 - u1*v0)
+    a = np.degrees(np.arctan2(np.abs(q)/np.sqrt(nn), c))
+    # Like the arccos of 0/0 in helpers.angle, the angle is NaN if a projected vector vanishes
+    # (|u|^2 |n|^2 = (n.u)^2 by Cauchy-Schwarz), e.g. if two landmarks of a vector coincide
+    uu = u0*u0 + u1*u1 + u2*u2
+    vv = v0*v0 + v1*v1 + v2*v2
+    a = np.where((uu*nn <= nu*nu) | (vv*nn <= nv*nv), np.nan, a)[()]
+    return a, q, (nn, nu, nv, c)
+
+def compile_measurement(spec):
+    '''
+    Returns kernel(point_dict) -> (angle in degrees, orientation) for a MeasurementSpec
+    '''
+    get_normal = compile_vector(spec.normal)
+    get_u, get_v = (compile_vector(expression) for expression in spec.vectors)
+    offset = spec.offset
+
+    def kernel(point_dict):
+        a, q, terms = _plane_angle(get_normal(point_dict), get_u(point_dict), get_v(point_dict))
+        return a + offset, q
+
+    return kernel
+
+def compile_gradient(spec):
+    '''
+    Returns gradient(point_dict, landmark_names) -> (angle in degrees, derivatives of the angle in degrees
+    per mm with shape (..., len(landmark_names), 3)) for a MeasurementSpec. The angle atan2(|q| / |n|, c)
+    of the kernel is differentiated in closed form with respect to n, u and v, and these derivatives are
+    propagated back through the vector expressions and geometry nodes.
+    The angle is |signed angle|, which has a kink where q = 0 (a zero or straight angle). There the
+    derivatives of the side q > 0 are returned: they have the same length as those of the other side, so
+    error budgets stay continuous, while central differences would cancel to 0.
+    '''
+    expressions = (spec.normal,) + tuple(spec.vectors)
+    getters = [compile_vector(expression) for expression in expressions]
+    backpropagators = [compile_vector_gradient(expression) for expression in expressions]
+    offset = spec.offset
+
+    def gradient(point_dict, landmark_names):
+        n, u, v = (get(point_dict) for get in getters)
+        a, q, (nn, nu, nv, c) = _plane_angle(n, u, v)
+        # k = sign(q) / |n| and s = |q| / |n|, with the sign of q > 0 at q = 0
+        k = np.where(q < 0, -1.0, 1.0)/np.sqrt(nn)
+        s = k*q
+        # d atan2(s, c) = (c ds - s dc) / (s^2 + c^2)
+        with np.errstate(divide='ignore', invalid='ignore'): # s = c = 0 if a projected vector vanishes, a is NaN
+            scale = np.degrees(1.0)/(s*s + c*c)
+            ws, wc = scale*c, -scale*s
+        ws, wc = ws[..., np.newaxis], wc[..., np.newaxis]
+        k, s, nn, nu, nv = (x[..., np.newaxis] for x in (k, s, nn, nu, nv))
+        # q = n.(u x v) and c = u.v - (n.u)(n.v) / (n.n)
+        a_n = ws*(k*_cross(u, v) - s/nn*n) + wc*(2*nu*nv/nn*n - nv*u - nu*v)/nn
+        a_u = ws*k*_cross(v, n) + wc*(v - nv/nn*n)
+        a_v = ws*k*_cross(n, u) + wc*(u - nu/nn*n)
+        da = np.zeros(np.shape(a) + (len(landmark_names), 3))
+        for backpropagate, a_x in zip(backpropagators, (a_n, a_u, a_v)):
+            backpropagate(point_dict, a_x, landmark_names, da)
+        da[np.isnan(a)] = np.nan
+        return a + offset, da
+
+    return gradient
@@ -0,0 +1,378 @@
+from collections import ChainMap
+import numpy as np
+
+from BoneAngleMeterCore.geometry_graph import resolve
+from BoneAngleMeterCore.measurement_kernel import MeasurementSpec, compile_gradient, compile_measurement
+from BoneAngleMeterCore.instrumentation import TRACER
+
+# Step of the central differences in numerical_sensitivity(), used by measurements without an analytic
+# gradient. Their truncation error shrinks with step**2, the rounding error of the atan2 kernel grows with
+# eps*|angle|/step: about 4e-11 degrees/mm at 1e-3 mm but 4e-9 at 1e-5 mm, and the femur head fit, which
+# stops below 1e-9 mm, adds up to 1e-9/step. Close to a zero angle they are wrong altogether, because the
+# angle has a kink there.
+SENSITIVITY_STEP = 1e-3 # mm
+
+class BaseMeasurement:
+    '''
+    Base class for all measurements. Child classes need to implement the _measure method that takes a
+    dictionary of landmark positions and returns a float value and a string description. Calls to the
+    measurement should be done via (). The names of all landmarks used by _measure have to be listed in
+    LANDMARK_NAMES, in the order in which they should be placed.
+
+    Child classes can instead implement _evaluate, which returns the angle and the signed orientation
+    of the result, together with LABELS. LABELS holds the descriptions for a positive and a non-positive
+    orientation on the right side; on the left side they are swapped. Such measurements work on stacks of
+    landmark positions as well and can be evaluated for many cases at once with measure_batch.
+    Angles between two vectors in a plane are best defined by a MeasurementSpec, from which
+    measurement_class creates the class (see measurement_kernel.py).
+
+    Shared intermediate geometry (axes, condylar vectors, femur head center) should be looked up with
+    resolve(point_dict, node name), so it is computed only once when a GeometryGraph is set.
+
+    For measurements with _evaluate, sensitivity() returns the derivatives of the angle with respect to
+    the landmark coordinates and error_budget() propagates a placement uncertainty to the angle.
+    '''
+    LANDMARK_NAMES = ()
+    LABELS = None
+
+    def __init__(self, name):
+        self.name = name
+        self.side = None
+        self.landmarks = []
+        self.description = ""
+        self.geometry_graph = None
+        self._result = None
+        self._error_budget = None
+
+    def set_side(self, side):
+        self.side = side
+        self._result = None
+
+    def set_geometry_graph(self, geometry_graph):
+        self.geometry_graph = geometry_graph
+        self._result = None
+
+    def register_landmarks(self, landmarks):
+        # Register landmark objects. Whoever displays the result subscribes to the change callbacks of
+        # exactly these landmarks (see get_landmarks).
+        landmark_dict = {landmark.name: landmark for landmark in landmarks}
+        for name in self.LANDMARK_NAMES:
+            if name not in landmark_dict:
+                raise ValueError(f"Could not register landmark with name {name}")
+            self.landmarks.append(landmark_dict[name])
+
+    def get_landmarks(self):
+        return self.landmarks
+
+    def required_landmarks(self):
+        '''
+        Landmarks that have to be placed for a result
+        '''
+        return self.landmarks
+
+    def __call__(self):
+        # Reuse the last result as long as no landmark changed. The span's fan-out is the number of
+        # landmarks read, 0 if the result was reused.
+        with TRACER.span(f"{type(self).__name__}.__call__") as span:
+            revision = tuple(l.revision for l in self.landmarks)
+            if self._result is not None and self._result[0] == revision:
+                return self._result[1]
+            span.fan_out = len(self.landmarks)
+            self._result = (revision, self._compute())
+            return self._result[1]
+
+    def _compute(self):
+        # Check if all landmarks were placed
+        for landmark in self.required_landmarks():
+            if not landmark.placed:
+                return False, None, "Not all landmarks defined"
+        if self.geometry_graph is not None:
+            point_dict = self.geometry_graph
+        else:
+            point_dict = {l.name: l.get_position() for l in self.required_landmarks()}
+        angle, message = self._measure(point_dict)
+        return True, angle, message
+
+    def _measure(self, point_dict):
+        a, q = self._evaluate(point_dict)
+        return a, self._label(q)
+
+    def _evaluate(self, point_dict):
+        raise NotImplementedError(f"{type(self).__name__} must implement _measure or _evaluate")
+
+    def _label(self, q):
+        if self.side.lower() == "right":
+            positive, negative = self.LABELS
+        elif self.side.lower() == "left":
+            negative, positive = self.LABELS
+        else:
+            raise ValueError(f"Unknown side {self.side}")
+        if np.ndim(q) == 0:
+            return positive if q > 0 else negative
+        return np.where(q > 0, positive, negative)
+
+    def sensitivity(self, point_dict, landmark_names=None):
+        '''
+        Returns the derivatives of the angle with respect to the x, y and z coordinates of every landmark
+        in degrees per mm, as array of shape (len(landmark_names), 3). landmark_names defaults to
+        LANDMARK_NAMES. Measurements with an analytic gradient (_gradient) return it, the others
+        numerical_sensitivity.
+        '''
+        names = tuple(self.LANDMARK_NAMES if landmark_names is None else landmark_names)
+        return self._gradient(point_dict, names)
+
+    def _gradient(self, point_dict, landmark_names):
+        return self.numerical_sensitivity(point_dict, landmark_names)
+
+    def numerical_sensitivity(self, point_dict, landmark_names=None, step=SENSITIVITY_STEP):
+        '''
+        sensitivity by central differences of _evaluate. The shifts of all coordinates are evaluated in a
+        single batch, including the femur head sphere fit.
+        '''
+        names = self.LANDMARK_NAMES if landmark_names is None else landmark_names
+        base = np.array([point_dict[name] for name in names], dtype=float)
+        n = base.size
+        offsets = step*np.eye(n).reshape(n, *base.shape)
+        batch = np.concatenate([base + offsets, base - offsets])
+        a, q = self._evaluate({name: batch[:, i] for i, name in enumerate(names)})
+        return ((a[:n] - a[n:]) / (2*step)).reshape(base.shape)
+
+    def error_budget(self, point_dict, sigma, landmark_names=None):
+        '''
+        First order propagation of an independent placement error with standard deviation sigma (mm) per
+        coordinate. Returns the standard deviation of the angle in degrees and a dictionary with the part
+        of each landmark in degrees; their squares add up to the square of the total.
+        '''
+        names = self.LANDMARK_NAMES if landmark_names is None else landmark_names
+        parts = sigma*np.linalg.norm(self.sensitivity(point_dict, names), axis=-1)
+        return float(np.sqrt(np.sum(parts**2))), dict(zip(names, parts.tolist()))
+
+    def current_error_budget(self, sigma):
+        '''
+        error_budget of the current landmark positions, or None if not all landmarks are placed.
+        Reused as long as no landmark changed.
+        '''
+        revision = tuple(l.revision for l in self.landmarks)
+        if self._error_budget is not None and self._error_budget[:2] == (revision, sigma):
+            return self._error_budget[2]
+        landmarks = self.required_landmarks()
+        if not all(landmark.placed for landmark in landmarks):
+            return None
+        with TRACER.span(f"{type(self).__name__}.error_budget", len(landmarks)):
+            point_dict = {l.name: l.get_position() for l in landmarks}
+            budget = self.error_budget(point_dict, sigma, [l.name for l in landmarks])
+        self._error_budget = (revision, sigma, budget)
+        return budget
+
+    def measure_batch(self, points, landmark_names):
+        '''
+        Evaluates the measurement for many cases at once. points is an array of shape
+        (n_cases, n_landmarks, 3) whose second axis is ordered like landmark_names.
+        Returns an array of angles and an array of descriptions, both of shape (n_cases,).
+        '''
+        points = np.asarray(points, dtype=float)
+        point_dict = {name: points[:, i] for i, name in enumerate(landmark_names)}
+        a, q = self._evaluate(point_dict)
+        return a, self._label(q)
+
+class SpecMeasurement(BaseMeasurement):
+    '''
+    Measurement defined by a MeasurementSpec (see measurement_kernel.py). Subclasses only set SPEC;
+    LANDMARK_NAMES and LABELS are taken from it, _evaluate is its compiled kernel and _gradient its
+    compiled gradient.
+    '''
+    SPEC = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if cls.SPEC is not None:
+            cls.LANDMARK_NAMES = tuple(cls.SPEC.landmarks)
+            cls.LABELS = tuple(cls.SPEC.labels)
+            cls._kernel = staticmethod(compile_measurement(cls.SPEC))
+            cls._kernel_gradient = staticmethod(compile_gradient(cls.SPEC))
+
+    def __init__(self):
+        super().__init__(self.SPEC.name)
+        self.description = self.SPEC.description
+
+    def _evaluate(self, point_dict):
+        return self._kernel(point_dict)
+
+    def _gradient(self, point_dict, landmark_names):
+        a, derivatives = self._kernel_gradient(point_dict, landmark_names)
+        return derivatives
+
+def measurement_class(spec, class_name=None):
+    '''
+    Creates a measurement class from a MeasurementSpec, e.g. to add it to MEASUREMENTS.
+    The class name defaults to the spec name in CamelCase followed by "Measurement".
+    '''
+    if class_name is None:
+        class_name = "".join(word[:1].upper() + word[1:] for word in spec.name.split()) + "Measurement"
+    return type(class_name, (SpecMeasurement,), {"SPEC": spec, "__module__": __name__})
+
+TIBIA_TORSION = MeasurementSpec(
+    name="Tibia Torsion",
+    landmarks=(
+        "distal tibia midpoint",
+        "proximal tibia midpoint",
+        "medial cochlea",
+        "lateral cochlea",
+        "condylus medialis tibiae",
+        "condylus lateralis tibiae",
+    ),
+    normal="tibia axis",
+    vectors=("tibial condylar vector", "cochlear vector"),
+    labels=("Innenrotation", "Aussenrotation"),
+)
+
+VARUS_VALGUS_TIBIA = MeasurementSpec(
+    name="Varus Valgus Tibia",
+    landmarks=(
+        "distal tibia midpoint",
+        "proximal tibia midpoint",
+        "condylus medialis tibiae",
+        "condylus lateralis tibiae",
+        "lateral cochlea articulation point tibia",
+        "medial cochlea articulation point tibia",
+        "lateral condyle articulation point tibia",
+        "medial condyle articulation point tibia",
+    ),
+    normal=("cross", "tibia axis", "tibial condylar vector"),
+    vectors=(("vector", "lateral cochlea articulation point tibia", "medial cochlea articulation point tibia"),
+             ("vector", "lateral condyle articulation point tibia", "medial condyle articulation point tibia")),
+    labels=("Varus", "Valgus"),
+    description="TEST",
+)
+
+TIBIOTALAR_ROTATION = MeasurementSpec(
+    name="Tibiotalar Rotation",
+    landmarks=(
+        "distal tibia midpoint",
+        "proximal tibia midpoint",
+        "medial cochlea",
+        "lateral cochlea",
+        "medial talus",
+        "lateral talus",
+    ),
+    normal="tibia axis",
+    vectors=("cochlear vector", "talar vector"),
+    labels=("Innenrotation", "Aussenrotation"),
+)
+
+FEMOROTIBIAL_ROTATION = MeasurementSpec(
+    name="Femorotibial Rotation",
+    landmarks=(
+        "distal tibia midpoint",
+        "proximal tibia midpoint",
+        "medial femur condyle",
+        "lateral femur condyle",
+        "condylus medialis tibiae",
+        "condylus lateralis tibiae",
+    ),
+    normal="tibia axis",
+    vectors=("femoral condylar vector", "tibial condylar vector"),
+    labels=("Innenrotation", "Aussenrotation"),
+)
+
+VARUS_VALGUS_FEMUR = MeasurementSpec(
+    name="Varus Valgus Femur",
+    landmarks=(
+        "proximal femur midpoint",
+        "distal femur midpoint",
+        "medial femur condyle",
+        "lateral femur condyle",
+    ),
+    normal=("cross", ("vector", "proximal femur midpoint", "distal femur midpoint"), "femoral condylar vector"),
+    vectors=("femur axis", "femoral condylar vector"),
+    labels=("Varus", "Valgus"),
+    offset=-90.0,
+)
+
+ANTETORSION = MeasurementSpec(
+    name="Antetorsion",
+    landmarks=(
+        "point on femur head 1",
+        "point on femur head 2",
+        "point on femur head 3",
+        "point on femur head 4",
+        "point on femur head 5",
+        "distal femur midpoint",
+        "proximal femur midpoint",
+        "medial femur condyle",
+        "lateral femur condyle",
+        "femur neck",
+    ),
+    normal="femur axis",
+    vectors=("femoral condylar vector", ("vector", "femur head center", "femur neck")),
+    labels=("no Antetorsion", "Antetorsion"),
+)
+
+TibiaTorsionMeasurement = measurement_class(TIBIA_TORSION)
+VarusValgusTibiaMeasurement = measurement_class(VARUS_VALGUS_TIBIA)
+TibiotalarRotationMeasurement = measurement_class(TIBIOTALAR_ROTATION)
+FemorotibialRotationMeasurement = measurement_class(FEMOROTIBIAL_ROTATION)
+VarusValgusFemurMeasurement = measurement_class(VARUS_VALGUS_FEMUR)
+
+class AntetorsionMeasurement(SpecMeasurement):
+    SPEC = ANTETORSION
+    HEAD_POINT_NAMES = ANTETORSION.landmarks[:5]
+
+    def __init__(self):
+        super().__init__()
+        self.femur_head_center = None
+
+    def set_femur_head_center(self, center):
+        '''
+        Uses a femur head center from another source, e.g. fitted to the bone surface, instead of the
+        sphere fit to the head points. The head points are then not required. None switches back.
+        '''
+        self.femur_head_center = None if center is None else np.array(center, dtype=float)
+        self._result = None
+        self._error_budget = None
+
+    def required_landmarks(self):
+        if self.femur_head_center is None:
+            return self.landmarks
+        return [l for l in self.landmarks if l.name not in self.HEAD_POINT_NAMES]
+
+    def center_of_femur_head(self, point_dict):
+        if self.femur_head_center is not None:
+            return np.broadcast_to(self.femur_head_center, np.shape(point_dict["femur neck"]))
+        # Sphere fit to the femur head points, see GEOMETRY_NODES
+        return resolve(point_dict, "femur head center")
+
+    def _evaluate(self, point_dict):
+        if self.femur_head_center is not None:
+            # Values in front of the point dictionary take precedence over the computed node
+            point_dict = ChainMap({"femur head center": self.center_of_femur_head(point_dict)}, point_dict)
+        return self._kernel(point_dict)
+
+    def _gradient(self, point_dict, landmark_names):
+        if self.femur_head_center is not None:
+            # The given center does not depend on the head points
+            point_dict = ChainMap({"femur head center": self.center_of_femur_head(point_dict)}, point_dict)
+        return super()._gradient(point_dict, landmark_names)
+
+
+class ExampleMeasurement(BaseMeasurement):
+    '''
+    This class SHOULD NOT BE USED, it is just provided as a example that shows how
+    child classes should be implemented.
+    '''
+    LANDMARK_NAMES = ("landmark name",)
+
+    def __init__(self, display_name):
+        super().__init__(display_name)
+    
+    def _measure(self, point_dict):
+        p = point_dict['landmark name'] # access landmarks
+        m = 42 # calculate float measurement
+        
+        # Potentially return different descriptions for each side
+        if self.side.lower() == "right":
+            return m, "Some description"
+        elif self.side.lower() == "left":
+            return m, "Another description"
+        else:
+            raise ValueError(f"Unknown side {self.side}")
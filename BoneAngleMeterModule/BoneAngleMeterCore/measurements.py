@@ -0,0 +1,30 @@
+from BoneAngleMeterCore.measurement_logic import (
+    TibiaTorsionMeasurement,
+    VarusValgusTibiaMeasurement,
+    TibiotalarRotationMeasurement,
+    FemorotibialRotationMeasurement,
+    VarusValgusFemurMeasurement,
+    AntetorsionMeasurement,
+)
+
+MEASUREMENTS = [
+    TibiaTorsionMeasurement,
+    VarusValgusTibiaMeasurement,
+    TibiotalarRotationMeasurement,
+    FemorotibialRotationMeasurement,
+    VarusValgusFemurMeasurement,
+    AntetorsionMeasurement
+]
+
+def measure_all_batch(points, landmark_names, side):
+    '''
+    Evaluates all MEASUREMENTS for a stack of cases of one side. points has shape
+    (n_cases, n_landmarks, 3), ordered like landmark_names along the second axis.
+    Returns a dictionary that maps each measurement name to its (angles, descriptions) arrays.
+    '''
+    results = {}
+    for measurement in MEASUREMENTS:
+        m = measurement()
+        m.set_side(side)
+        results[m.name] = m.measure_batch(points, landmark_names)
+    return results
@@ -0,0 +1,72 @@
+import numpy as np
+
+# Edge length of the hash cells in mm, also the largest distance of nearest()
+SURFACE_INDEX_CELL_SIZE = 5.0
+
+_NEIGHBOURS = np.stack(np.meshgrid([-1, 0, 1], [-1, 0, 1], [-1, 0, 1], indexing='ij'), axis=-1).reshape(-1, 3)
+
+class SurfaceIndex:
+    '''
+    Voxel hash of surface vertices for fast nearest point queries, e.g. while a landmark is dragged.
+    The vertices are sorted by the cell they fall into, so the vertices of a cell are a contiguous slice
+    that is found with a binary search. nearest() only looks at the 27 cells around the query point and
+    therefore finds the nearest vertex within cell_size; farther vertices are ignored.
+    '''
+    def __init__(self, vertices, cell_size=SURFACE_INDEX_CELL_SIZE):
+        vertices = np.asarray(vertices, dtype=float).reshape(-1, 3)
+        self.cell_size = float(cell_size)
+        self._origin = vertices.min(axis=0) - cell_size if len(vertices) > 0 else np.zeros(3)
+        # One cell of margin on every side, so the neighbours of a cell inside the grid have valid keys
+        cells = np.floor((vertices - self._origin) / self.cell_size).astype(np.int64)
+        self._shape = cells.max(axis=0) + 2 if len(vertices) > 0 else np.ones(3, dtype=np.int64)
+        keys = self._keys(cells)
+        order = np.argsort(keys)
+        self.vertices = vertices[order]
+        self._keys_sorted = keys[order]
+
+    def __len__(self):
+        return len(self.vertices)
+
+    def _keys(self, cells):
+        return (cells[..., 0]*self._shape[1] + cells[..., 1])*self._shape[2] + cells[..., 2]
+
+    def _candidates(self, cells):
+        # Vertices of the given cells (m, 3), cells outside the grid are skipped
+        cells = cells[np.all((cells >= 0) & (cells < self._shape), axis=-1)]
+        keys = self._keys(cells)
+        starts = np.searchsorted(self._keys_sorted, keys, side='left')
+        stops = np.searchsorted(self._keys_sorted, keys, side='right')
+        lengths = stops - starts
+        # Concatenated ranges starts[i]:stops[i] without a Python loop
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return self.vertices[offsets + np.arange(lengths.sum())]
+
+    def nearest(self, point, max_distance=None):
+        '''
+        Returns the nearest vertex and its distance, or None if there is no vertex within max_distance
+        (at most cell_size, the default).
+        '''
+        point = np.asarray(point, dtype=float)
+        max_distance = self.cell_size if max_distance is None else min(max_distance, self.cell_size)
+        cell = np.floor((point - self._origin) / self.cell_size).astype(np.int64)
+        candidates = self._candidates(cell + _NEIGHBOURS)
+        if len(candidates) == 0:
+            return None
+        d2 = np.einsum('ij,ij->i', candidates - point, candidates - point)
+        i = np.argmin(d2)
+        distance = float(np.sqrt(d2[i]))
+        if distance > max_distance:
+            return None
+        return candidates[i], distance
+
+    def within(self, point, radius):
+        '''
+        Returns all vertices within radius of point
+        '''
+        point = np.asarray(point, dtype=float)
+        low = np.floor((point - radius - self._origin) / self.cell_size).astype(np.int64)
+        high = np.floor((point + radius - self._origin) / self.cell_size).astype(np.int64)
+        ranges = [np.arange(max(l, 0), min(h, s - 1) + 1) for l, h, s in zip(low, high, self._shape)]
+        cells = np.stack(np.meshgrid(*ranges, indexing='ij'), axis=-1).reshape(-1, 3)
+        candidates = self._candidates(cells)
+        return candidates[np.einsum('ij,ij->i', candidates - point, candidates - point) < radius**2]
@@ -1,18 +1,40 @@
 import qt, ctk, slicer
 from slicer.ScriptedLoadableModule import *
-from slicer.util import errorDisplay
+from slicer.util import errorDisplay, confirmYesNoDisplay
 
+import os
 import os.path as osp
-import csv
+import hashlib
 import numpy as np
 from copy import deepcopy
-import locale
-locale.setlocale(locale.LC_ALL, '')
+from collections import OrderedDict
 
-from Resources.measurements import MEASUREMENTS
-from Resources.landmarks import LANDMARKS
+# Slicer imports this file on every application start. Everything else (measurements, landmarks,
+# segmentation, CSV and journal) is imported where it is first used, once the module is opened.
+from Resources.observer_registry import OBSERVER_REGISTRY
+from BoneAngleMeterCore.instrumentation import TRACER
 
 MODULE_PATH = osp.dirname(__file__)
+PIXMAP_CACHE_SIZE = 16
+
+_pixmap_cache = OrderedDict()
+
+def cached_pixmap(path):
+    '''
+    Loads an image as QPixmap. The most recently used images are kept in a small LRU cache,
+    so images that are shared between landmarks are decoded only once.
+    '''
+    if path in _pixmap_cache:
+        _pixmap_cache.move_to_end(path)
+        return _pixmap_cache[path]
+    pixmap = qt.QPixmap(path)
+    if pixmap.isNull():
+        raise ValueError(f"Could not load image from file '{path}'")
+    _pixmap_cache[path] = pixmap
+    if len(_pixmap_cache) > PIXMAP_CACHE_SIZE:
+        _pixmap_cache.popitem(last=False)
+    return pixmap
+
 #
 # BoneAngleMeterModule
 #
@@ -43,6 +65,10 @@ class BoneAngleMeterModuleWidget(ScriptedLoadableModuleWidget):
     """
 
     SEGMENTATION_NODE_NAME = "Automatic Bone Segmentation Node"
+    PREVIEW_NODE_NAME = "Automatic Bone Segmentation Preview"
+    MAX_PARALLEL_SEGMENTATIONS = 2
+    JOURNAL_DIRECTORY_NAME = "BoneAngleMeter journals"
+    JOURNAL_SYNC_MS = 1000
 
     def setup(self):
         ScriptedLoadableModuleWidget.setup(self)
@@ -64,6 +90,11 @@ class BoneAngleMeterModuleWidget(ScriptedLoadableModuleWidget):
         segmentation_collapsible_button.text = "3D Segmentation"
         self.layout.addWidget(segmentation_collapsible_button)
         segmentation_form_layout = qt.QFormLayout(segmentation_collapsible_button)
+        # Volumes to segment. If none is checked, the only volume of the scene is used.
+        self.volume_selector = slicer.qMRMLCheckableNodeComboBox()
+        self.volume_selector.nodeTypes = ["vtkMRMLScalarVolumeNode"]
+        self.volume_selector.setMRMLScene(slicer.mrmlScene)
+        segmentation_form_layout.addRow("Volumes", self.volume_selector)
         self.apply_segmentation_button = qt.QPushButton("Apply")
         self.apply_segmentation_button.connect('clicked(bool)', self.onApplySegmentation)
         segmentation_form_layout.addRow("Segmentation", self.apply_segmentation_button)
@@ -84,85 +115,386 @@ class BoneAngleMeterModuleWidget(ScriptedLoadableModuleWidget):
         self.smoothing.setValue(0.5)
         segmentation_form_layout.addRow("Surface smoothing", self.smoothing)
 
+        # Masks and surfaces of previous runs are reused when the same parameters are applied again
+        self.cache_memory = qt.QSpinBox()
+        self.cache_memory.setRange(0, 65536)
+        self.cache_memory.setSuffix(" MB")
+        self.cache_memory.setValue(2048)
+        self.cache_disk = qt.QSpinBox()
+        self.cache_disk.setRange(0, 1048576)
+        self.cache_disk.setSuffix(" MB")
+        self.cache_disk.setValue(4096)
+        segmentation_form_layout.addRow("Cache memory", self.cache_memory)
+        segmentation_form_layout.addRow("Cache disk space", self.cache_disk)
+        # The cache and the job queue are created by the first Apply, so opening the module stays cheap
+        self.segmentation_cache = None
+        self.segmentation_queue = None
+        self.cache_memory.connect('valueChanged(int)', self.onCacheBudgetChanged)
+        self.cache_disk.connect('valueChanged(int)', self.onCacheBudgetChanged)
+
+        # Progressive mode shows a low resolution preview and computes the full resolution in the background,
+        # otherwise Apply segments the volumes synchronously
+        self.progressive_segmentation = qt.QCheckBox()
+        self.progressive_segmentation.setChecked(True)
+        segmentation_form_layout.addRow("Progressive preview", self.progressive_segmentation)
+        self.segmentation_jobs = []
+        self._bone_index = None
+        self.segmentation_timer = qt.QTimer()
+        self.segmentation_timer.setInterval(100)
+        self.segmentation_timer.connect('timeout()', self.onSegmentationJobPoll)
+        self.threshold_lower.connect('valueChanged(int)', self.onSegmentationParametersChanged)
+        self.threshold_upper.connect('valueChanged(int)', self.onSegmentationParametersChanged)
+        self.smoothing.connect('valueChanged(double)', self.onSegmentationParametersChanged)
+
         self.segmentation_status = qt.QLabel("no segmentation")
         segmentation_form_layout.addRow("Status", self.segmentation_status)     
 
+        # Diagnostics
+        diagnostics_collapsible_button = ctk.ctkCollapsibleButton()
+        diagnostics_collapsible_button.text = "Diagnostics"
+        diagnostics_collapsible_button.collapsed = True
+        self.layout.addWidget(diagnostics_collapsible_button)
+        diagnostics_form_layout = qt.QFormLayout(diagnostics_collapsible_button)
+        self.subscriptions_label = qt.QLabel()
+        diagnostics_form_layout.addRow("Live subscriptions", self.subscriptions_label)
+
+        # Opt-in latency recording of the interaction and segmentation hot paths
+        self.record_trace_checkbox = qt.QCheckBox()
+        self.record_trace_checkbox.setChecked(TRACER.enabled)
+        self.record_trace_checkbox.connect('toggled(bool)', self.onRecordTraceToggled)
+        diagnostics_form_layout.addRow("Record latency", self.record_trace_checkbox)
+        self.latency_table = qt.QTableWidget(0, 6)
+        self.latency_table.setHorizontalHeaderLabels(["Span", "Count", "p50 [ms]", "p95 [ms]", "p99 [ms]", "Fan-out"])
+        self.latency_table.setEditTriggers(qt.QAbstractItemView.NoEditTriggers)
+        self.latency_table.verticalHeader().setVisible(False)
+        diagnostics_form_layout.addRow(self.latency_table)
+        self.export_trace_button = qt.QPushButton("Export trace")
+        self.export_trace_button.connect('clicked(bool)', self.onExportTrace)
+        self.clear_trace_button = qt.QPushButton("Clear")
+        self.clear_trace_button.connect('clicked(bool)', self.onClearTrace)
+        trace_buttons = qt.QHBoxLayout()
+        trace_buttons.addWidget(self.export_trace_button)
+        trace_buttons.addWidget(self.clear_trace_button)
+        diagnostics_form_layout.addRow(trace_buttons)
+
+        self.refresh_diagnostics_button = qt.QPushButton("Refresh")
+        self.refresh_diagnostics_button.connect('clicked(bool)', self.updateDiagnostics)
+        diagnostics_form_layout.addRow(self.refresh_diagnostics_button)
+        self.updateDiagnostics()
+
         self.layout.addStretch(1)
 
-        # Dialogs
-        self.left_dialog = MeasurementsDialog('left', 
-            slicer.modules.markups.logic().AddNewFiducialNode("BoneAngleMeterFiducialsLeft"), self)
-        self.left_dialog.finished.connect(self.onDialogClose)
-        self.right_dialog = MeasurementsDialog('right', 
-            slicer.modules.markups.logic().AddNewFiducialNode("BoneAngleMeterFiducialsRight"), self)
-        self.right_dialog.finished.connect(self.onDialogClose)
+        # Dialogs are created when they are opened for the first time
+        self.dialogs = {}
+
+        # Landmark edits are journaled per case, buffered writes reach the disk at least once per second.
+        # Journals outlive the scene and Slicer until their landmarks are exported or discarded.
+        self.journal = None
+        self.case_volume_id = None
+        self.journal_path = None
+        self.journal_timer = qt.QTimer()
+        self.journal_timer.setInterval(self.JOURNAL_SYNC_MS)
+        self.journal_timer.connect('timeout()', self.onJournalTimer)
+        OBSERVER_REGISTRY.subscribe(self, "scene closed", slicer.mrmlScene, slicer.mrmlScene.EndCloseEvent,
+                                    self.onSceneClosed)
         
     def cleanup(self):
-        pass
+        for job in self.segmentation_jobs:
+            job.cancel()
+        self.segmentation_timer.stop()
+        if self.segmentation_queue is not None:
+            self.segmentation_queue.shutdown()
+        if self.segmentation_cache is not None:
+            self.segmentation_cache.clear()
+        for dialog in self.dialogs.values():
+            dialog.cleanup()
+        OBSERVER_REGISTRY.unsubscribe(self)
+        self.close_journal()
+
+    def onCacheBudgetChanged(self):
+        if self.segmentation_cache is None:
+            return
+        self.segmentation_cache.memory_budget = self.cache_memory.value * 1024**2
+        self.segmentation_cache.disk_budget = self.cache_disk.value * 1024**2
+
+    def get_dialog(self, side):
+        if side not in self.dialogs:
+            markups_node_id = slicer.modules.markups.logic().AddNewFiducialNode(f"BoneAngleMeterFiducials{side.capitalize()}")
+            self.dialogs[side] = MeasurementsDialog(side, markups_node_id, self)
+            self.dialogs[side].finished.connect(self.onDialogClose)
+        return self.dialogs[side]
+
+    def case_volume(self):
+        '''
+        Volume the landmarks are placed on, None if it is ambiguous: the checked volume or the only volume
+        of the scene, otherwise the one of them that is shown in the red slice view
+        '''
+        volume_nodes = self.volume_selector.checkedNodes()
+        if len(volume_nodes) == 0:
+            volume_nodes = slicer.util.getNodesByClass("vtkMRMLScalarVolumeNode")
+        if len(volume_nodes) == 1:
+            return volume_nodes[0]
+        layout_manager = slicer.app.layoutManager()
+        slice_widget = layout_manager.sliceWidget("Red") if layout_manager is not None else None
+        if slice_widget is None:
+            return None
+        background_id = slice_widget.sliceLogic().GetSliceCompositeNode().GetBackgroundVolumeID()
+        return next((node for node in volume_nodes if node.GetID() == background_id), None)
+
+    def bind_case(self):
+        '''
+        Binds the landmarks to the case_volume(), identified by its DICOM instances or its file, and opens
+        its journal. Called when a landmark dialog is shown; an ambiguous case keeps the current binding.
+        Returns session_journal().
+        '''
+        volume_node = self.case_volume()
+        if volume_node is not None and self.case_volume_id != volume_node.GetID():
+            from Resources.session_journal import JOURNAL_EXTENSION
+            storage_node = volume_node.GetStorageNode()
+            case = (volume_node.GetAttribute("DICOM.instanceUIDs")
+                    or (storage_node.GetFileName() if storage_node is not None else None)
+                    or volume_node.GetName())
+            directory = osp.join(slicer.app.temporaryPath, self.JOURNAL_DIRECTORY_NAME)
+            os.makedirs(directory, exist_ok=True)
+            path = osp.join(directory, hashlib.sha1(case.encode('utf-8')).hexdigest()[:16] + JOURNAL_EXTENSION)
+            self.close_journal()
+            self.case_volume_id = volume_node.GetID()
+            self.journal_path = path
+        return self.session_journal()
+
+    def session_journal(self):
+        '''
+        Journal of the landmark edits of the bound case (see bind_case), None if no case is bound.
+        A journal deleted after an export is started again by the next edit.
+        '''
+        if self.journal is None and self.journal_path is not None:
+            from Resources.session_journal import SessionJournal
+            self.journal = SessionJournal(self.journal_path, sync_interval=self.JOURNAL_SYNC_MS/1000)
+            self.journal_timer.start()
+        return self.journal
+
+    def close_journal(self, delete=False):
+        '''
+        Closes the journal of the bound case. A deleted journal is not offered for recovery again.
+        '''
+        self.journal_timer.stop()
+        if self.journal is not None:
+            if delete:
+                self.journal.delete()
+            else:
+                self.journal.close()
+        self.journal = None
+
+    def discard_journal(self, side):
+        '''
+        Forgets the journaled landmarks of a side once they are exported or their restore is declined.
+        Without landmarks of the other side the journal is deleted.
+        '''
+        if self.journal is None:
+            return
+        self.journal.discard(side)
+        if len(self.journal) == 0:
+            self.close_journal(delete=True)
+
+    def onJournalTimer(self):
+        if self.journal is not None:
+            self.journal.flush()
+
+    def onSceneClosed(self, caller, event):
+        # The journal stays on disk and is offered again when the case is opened; node IDs of the next
+        # case may repeat the old ones, so the case is bound anew
+        self.close_journal()
+        self.case_volume_id = None
+        self.journal_path = None
+        for dialog in self.dialogs.values():
+            dialog.recovered_journal_path = None
 
     def onDialogClose(self):
         self.left_button.setEnabled(True)
         self.right_button.setEnabled(True)
+        self.updateDiagnostics()
+
+    def updateDiagnostics(self):
+        self.subscriptions_label.setText(f"{OBSERVER_REGISTRY.live_subscriptions}")
+
+        summary = TRACER.summary()
+        self.latency_table.setRowCount(len(summary))
+        for row, span in enumerate(summary):
+            values = [span["name"], f"{span['count']}", f"{span['p50']:.2f}", f"{span['p95']:.2f}",
+                      f"{span['p99']:.2f}", f"{span['fan_out']:.1f}"]
+            for column, value in enumerate(values):
+                self.latency_table.setItem(row, column, qt.QTableWidgetItem(value))
+        self.latency_table.resizeColumnsToContents()
+
+    def onRecordTraceToggled(self, checked):
+        TRACER.enabled = checked
+
+    def onExportTrace(self):
+        file_name = qt.QFileDialog.getSaveFileName(None, 'Export trace', '', "Chrome trace (*.json)")
+        if file_name == "":
+            return
+        TRACER.export_chrome_trace(file_name)
+
+    def onClearTrace(self):
+        TRACER.clear()
+        self.updateDiagnostics()
 
     def onLeftDialogButton(self):
-        self.left_dialog.show()
+        self.get_dialog('left').show()
         self.left_button.setEnabled(False)
         self.right_button.setEnabled(False)
 
     def onRightDialogButton(self):
-        self.right_dialog.show()
+        self.get_dialog('right').show()
         self.left_button.setEnabled(False)
         self.right_button.setEnabled(False)
 
     def onApplySegmentation(self):
-        self.segmentation_status.setText("working...")
-
         # Get volume data
-        volume_nodes = slicer.util.getNodesByClass("vtkMRMLScalarVolumeNode")
+        volume_nodes = self.volume_selector.checkedNodes()
+        if len(volume_nodes) == 0:
+            volume_nodes = slicer.util.getNodesByClass("vtkMRMLScalarVolumeNode")
+            if len(volume_nodes) > 1:
+                self.segmentation_status.setText("Multiple volumes found. Select the volumes to segment.")
+                return
         if len(volume_nodes) == 0:
             self.segmentation_status.setText("No data found")
             return
-        if len(volume_nodes) > 1:
-            self.segmentation_status.setText("Multiple volumes found. Only one volume is supported currently.")
-            return
-        volume_node = volume_nodes[0]
-
-        # Create segmentation
-        segmentation_node = slicer.mrmlScene.GetNodeByID(self.SEGMENTATION_NODE_NAME)
-        if segmentation_node is not None:
-            slicer.mrmlScene.RemoveNode(segmentation_node)
-        segmentation_node = slicer.mrmlScene.AddNewNodeByClassWithID("vtkMRMLSegmentationNode", "", self.SEGMENTATION_NODE_NAME)
-        segmentation_node.CreateDefaultDisplayNodes() # only needed for display
-        segmentation_node.SetReferenceImageGeometryParameterFromVolumeNode(volume_node)
-        segmentation_node.SetName(self.SEGMENTATION_NODE_NAME)
-        segment_id = segmentation_node.GetSegmentation().AddEmptySegment("Bones")
-
-        # Create segment editor to get access to effects
-        segment_editor_widget = slicer.qMRMLSegmentEditorWidget()
-        segment_editor_widget.setMRMLScene(slicer.mrmlScene)
-        segment_editor_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentEditorNode")
-        segment_editor_widget.setMRMLSegmentEditorNode(segment_editor_node)
-        segment_editor_widget.setSegmentationNode(segmentation_node)
-        segment_editor_widget.setCurrentSegmentID(segment_id)
-        segment_editor_widget.setMasterVolumeNode(volume_node)
-
-        # Thresholding
-        segment_editor_widget.setActiveEffectByName("Threshold")
-        effect = segment_editor_widget.activeEffect()
-        effect.setParameter("MinimumThreshold", f"{self.threshold_lower.value}")
-        effect.setParameter("MaximumThreshold", f"{self.threshold_upper.value}")
-        effect.self().onApply()
-
-        # Clean up
-        segment_editor_widget = None
-        slicer.mrmlScene.RemoveNode(segment_editor_node)
-
-        # Smoothing
-        segmentation_node.GetSegmentation().SetConversionParameter("Smoothing factor",f"{self.smoothing.value}")
-
-        # Make segmentation results visible in 3D
-        segmentation_node.CreateClosedSurfaceRepresentation()
 
+        if self.segmentation_cache is None:
+            from Resources.segmentation_cache import SegmentationCache
+            from Resources.segmentation_logic import SegmentationQueue
+            self.segmentation_cache = SegmentationCache()
+            self.segmentation_queue = SegmentationQueue(self.MAX_PARALLEL_SEGMENTATIONS)
+            self.onCacheBudgetChanged()
+
+        # Jobs of the previous Apply are superseded
+        for job in self.segmentation_jobs:
+            job.cancel()
+        self.segmentation_jobs = []
+        lower, upper, smoothing = self._segmentation_parameters()
+        if not self.progressive_segmentation.checked:
+            self._segment_synchronously(volume_nodes, lower, upper, smoothing)
+            return
+        from Resources.segmentation_logic import SegmentationJob
+        with TRACER.span("segmentation.submit", len(volume_nodes)):
+            for volume_node in volume_nodes:
+                self._show_preview(volume_node, len(volume_nodes), lower, upper, smoothing)
+                name = self._node_name(self.SEGMENTATION_NODE_NAME, volume_node, len(volume_nodes))
+                job = SegmentationJob(volume_node, name, lower, upper, smoothing, cache=self.segmentation_cache)
+                job.preview_name = self._node_name(self.PREVIEW_NODE_NAME, volume_node, len(volume_nodes))
+                job.handled = False
+                self.segmentation_queue.submit(job)
+                self.segmentation_jobs.append(job)
+        self._update_segmentation_status()
+        self.segmentation_timer.start()
+
+    def _segment_synchronously(self, volume_nodes, lower, upper, smoothing):
+        # Without progressive preview the volumes are segmented one after the other on the UI thread
+        from Resources.segmentation_logic import segment_bones
+        lines = []
+        for volume_node in volume_nodes:
+            name = self._node_name(self.SEGMENTATION_NODE_NAME, volume_node, len(volume_nodes))
+            with TRACER.span("segmentation.synchronous"):
+                segmentation_node, segment_id, timings = segment_bones(volume_node, name, lower, upper, smoothing,
+                                                                       cache=self.segmentation_cache)
+            self._bone_index = None
+            self._show_segmentation(segmentation_node, segment_id)
+            text = f"ok ({sum(timings.values()):.1f} s)"
+            if len(volume_nodes) > 1:
+                text = f"{volume_node.GetName()}: {text}"
+            lines.append(text)
+        self.segmentation_status.setText("\n".join(lines))
+
+    def _segmentation_parameters(self):
+        return (self.threshold_lower.value, self.threshold_upper.value, self.smoothing.value)
+
+    @staticmethod
+    def _node_name(base_name, volume_node, n_volumes):
+        # With several volumes every volume gets its own nodes
+        if n_volumes == 1:
+            return base_name
+        return f"{base_name} - {volume_node.GetName()}"
+
+    def _show_preview(self, volume_node, n_volumes, lower, upper, smoothing):
+        # Low resolution preview as model node
+        from Resources.segmentation_logic import preview_surface
+        name = self._node_name(self.PREVIEW_NODE_NAME, volume_node, n_volumes)
+        with TRACER.span("segmentation.preview"):
+            surface = preview_surface(volume_node, lower, upper, smoothing)
+        preview_node = slicer.mrmlScene.GetFirstNodeByName(name)
+        if preview_node is None:
+            preview_node = slicer.modules.models.logic().AddModel(surface)
+            preview_node.SetName(name)
+            preview_node.GetDisplayNode().SetColor(241/255, 241/255, 145/255)
+            preview_node.GetDisplayNode().SetVisibility2D(False)
+        else:
+            preview_node.SetAndObservePolyData(surface)
+
+    def onSegmentationParametersChanged(self):
+        # Results of running jobs no longer match the side bar
+        for job in self.segmentation_jobs:
+            if not job.done():
+                job.cancel()
+
+    def onSegmentationJobPoll(self):
+        for job in self.segmentation_jobs:
+            if job.handled or not job.done():
+                continue
+            job.handled = True
+            if job.cancelled or job.parameters != self._segmentation_parameters():
+                job.stage = "parameters changed, press Apply"
+                continue
+            if job.error is not None:
+                job.stage = f"Error: {job.error}"
+                continue
+            segmentation_node, segment_id = job.apply()
+            self._bone_index = None
+            preview_node = slicer.mrmlScene.GetFirstNodeByName(job.preview_name)
+            if preview_node is not None:
+                slicer.mrmlScene.RemoveNode(preview_node)
+            self._show_segmentation(segmentation_node, segment_id)
+        self._update_segmentation_status()
+        if all(job.handled for job in self.segmentation_jobs):
+            self.segmentation_timer.stop()
+
+    def bone_surface_index(self):
+        '''
+        SurfaceIndex of the surface vertices of all automatic bone segmentations, None if there is none.
+        It is built once per finished segmentation.
+        '''
+        if self._bone_index is None:
+            from Resources.segmentation_logic import surface_vertices
+            from BoneAngleMeterCore.surface_index import SurfaceIndex
+            vertices = []
+            for node in slicer.util.getNodesByClass("vtkMRMLSegmentationNode"):
+                if not node.GetName().startswith(self.SEGMENTATION_NODE_NAME):
+                    continue
+                segmentation = node.GetSegmentation()
+                if segmentation.GetNumberOfSegments() > 0:
+                    vertices.append(surface_vertices(node, segmentation.GetNthSegmentID(0)))
+            if len(vertices) == 0:
+                return None
+            with TRACER.span("SurfaceIndex.build"):
+                self._bone_index = SurfaceIndex(np.concatenate(vertices))
+        return self._bone_index
+
+    def _update_segmentation_status(self):
+        # One line per volume with the stage and the time spent on it
+        lines = []
+        for job in self.segmentation_jobs:
+            if job.stage == "done":
+                text = f"ok ({sum(job.timings.values()):.1f} s)"
+            elif job.stage == "queued":
+                text = "queued"
+            else:
+                text = f"{job.stage} ({job.elapsed:.1f} s)"
+            if len(self.segmentation_jobs) > 1:
+                text = f"{job.volume_node.GetName()}: {text}"
+            lines.append(text)
+        self.segmentation_status.setText("\n".join(lines))
+
+    def _show_segmentation(self, segmentation_node, segment_id):
         # Center the 3d View on the scene
         layout_manager = slicer.app.layoutManager()
         three_d_Widget = layout_manager.threeDWidget(0)
@@ -174,12 +506,12 @@ class BoneAngleMeterModuleWidget(ScriptedLoadableModuleWidget):
         segmentation_node.GetDisplayNode().SetAllSegmentsVisibility2DFill(False)
         segmentation_node.GetSegmentation().GetSegment(segment_id).SetColor(241/255, 241/255, 145/255)
 
-        self.segmentation_status.setText("ok")
-
 class MeasurementsDialog(qt.QDialog):
     '''
     Dialog containing basically all GUI items. Contains a stack of measurements
     '''
+    FEMUR_HEAD_SEED = "point on femur head 1"
+
     def __init__(self, side, markup_node_id, base_widget):
         super().__init__()
 
@@ -213,24 +545,69 @@ class MeasurementsDialog(qt.QDialog):
         self.measurement_stack = qt.QStackedWidget(self)
         self.measurement_list.currentRowChanged.connect(self._change_row)
 
+        # Standard deviation of the landmark placement, propagated to the angles
+        self.placement_uncertainty = qt.QDoubleSpinBox()
+        self.placement_uncertainty.setRange(0, 10)
+        self.placement_uncertainty.setDecimals(1)
+        self.placement_uncertainty.setSingleStep(0.5)
+        self.placement_uncertainty.setValue(1.0)
+        self.placement_uncertainty.setSuffix(" mm")
+        self.placement_uncertainty.connect('valueChanged(double)', self._change_placement_uncertainty)
+
+        # Femur head center fitted to the bone surface around the first femur head point instead of
+        # the sphere through all five points
+        self.surface_femur_head = qt.QCheckBox("Femur head from segmentation")
+        self.surface_femur_head.connect('toggled(bool)', lambda checked: self._update_femur_head())
+        self.femur_head_status = qt.QLabel("")
+        self.femur_head_status.setWordWrap(True)
+
+        # Placed and dragged landmarks are moved to the nearest point of the bone surface
+        self.snap_to_bone = qt.QCheckBox("Snap landmarks to bone")
+        self.snap_to_bone.connect('toggled(bool)', self._change_snap_to_bone)
+
+        from BoneAngleMeterCore import MEASUREMENTS, GeometryGraph
+        from BoneAngleMeterCore.measurement_logic import AntetorsionMeasurement
+        from Resources.landmarks import LANDMARKS
+        from Resources.landmark_logic import observe_revisions
+
         # Create deep-copy of all landmarks for this side
         self.landmarks = deepcopy(LANDMARKS)
         for landmark in self.landmarks:
             landmark.set_markups_node_id(self.markup_node_id)
+        observe_revisions(self, self.landmarks)
+        self.geometry_graph = GeometryGraph(self.landmarks)
+        self.recovered_journal_path = None
+        self._recover_landmarks()
+        for landmark in self.landmarks:
+            landmark.add_edit_callback(self._journal_edit)
 
-        # Create all measurements
+        # Create all measurements. Their widgets are built when they are shown for the first time,
+        # until then the stack holds empty placeholders.
+        self.measurements = []
+        self.measurement_widgets = []
         for measurement in MEASUREMENTS:
             m = measurement()
             m.set_side(self.side)
+            m.set_geometry_graph(self.geometry_graph)
             m.register_landmarks(self.landmarks)
-            self.measurement_stack.addWidget(MeasurementWidget(m))
+            self.measurements.append(m)
+            self.measurement_widgets.append(None)
+            self.measurement_stack.addWidget(qt.QWidget())
             self.measurement_list.addItem(m.name)
+        self.antetorsion = next(m for m in self.measurements if isinstance(m, AntetorsionMeasurement))
+        self.femur_head_seed = next(l for l in self.landmarks if l.name == self.FEMUR_HEAD_SEED)
+        self.femur_head_seed.add_change_callback(self._update_femur_head)
         
         left_sublayout = qt.QGridLayout()
         left_sublayout.addWidget(self.measurement_list, 0, 0, 1, 2)
         left_sublayout.addWidget(self.import_landmarks_button, 1, 0)
         left_sublayout.addWidget(self.export_landmarks_button, 1, 1)
         left_sublayout.addWidget(self.export_measurements_button, 2, 0, 1,)
+        left_sublayout.addWidget(qt.QLabel("Placement uncertainty"), 3, 0)
+        left_sublayout.addWidget(self.placement_uncertainty, 3, 1)
+        left_sublayout.addWidget(self.surface_femur_head, 4, 0, 1, 2)
+        left_sublayout.addWidget(self.femur_head_status, 5, 0, 1, 2)
+        left_sublayout.addWidget(self.snap_to_bone, 6, 0, 1, 2)
 
         layout = qt.QHBoxLayout()
         layout.addLayout(left_sublayout)
@@ -238,72 +615,159 @@ class MeasurementsDialog(qt.QDialog):
 
         self.setLayout(layout)
 
+    def _recover_landmarks(self):
+        # Offers the landmarks of the last session of the case, once per case
+        from Resources.landmark_logic import define_landmarks
+        journal = self.base_widget.bind_case()
+        if journal is None or journal.path == self.recovered_journal_path:
+            return
+        self.recovered_journal_path = journal.path
+        landmark_dict = {lm.name: lm for lm in self.landmarks}
+        recovered = [(landmark_dict[name], tuple(position)) for name, position
+                     in journal.positions(self.side).items() if name in landmark_dict]
+        if len(recovered) > 0:
+            if confirmYesNoDisplay(f"Restore {len(recovered)} {self.side} landmarks of the last session of this case?"):
+                define_landmarks(recovered)
+            else:
+                self.base_widget.discard_journal(self.side)
+
+    def _journal_edit(self, landmark):
+        journal = self.base_widget.session_journal()
+        if journal is not None:
+            journal.append(self.side, landmark.name, landmark.get_position())
+
     def _export_landmarks(self):
         file_name = qt.QFileDialog.getSaveFileName(self, 'Export landmarks', '',"CSV File (*.csv)")
         if file_name == "": 
             return
-        with open(file_name, 'w+', newline='') as csvfile:
-            fieldnames = ['landmark name', 'x', 'y', 'z']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';' 
-                                    if locale.localeconv()['decimal_point'] == "," else ",", quoting=csv.QUOTE_MINIMAL)
-            writer.writeheader()
-            for landmark in self.landmarks:
-                if landmark.placed:
-                    position = landmark.get_position()
-                    writer.writerow({"landmark name": landmark.name, 
-                                     "x": locale.str(position[0]), 
-                                     "y": locale.str(position[1]), 
-                                     "z": locale.str(position[2])})
-
+        from Resources.csv_codec import write_landmarks, user_locale_format
+        placed = [landmark for landmark in self.landmarks if landmark.placed]
+        write_landmarks(file_name, [landmark.name for landmark in placed], [landmark.get_position() for landmark in placed],
+                        user_locale_format())
+        self.base_widget.discard_journal(self.side)
 
     def _import_landmarks(self):
         file_name = qt.QFileDialog.getOpenFileName(self, 'Import landmarks', '',"CSV File (*.csv)")
         if file_name == "":
             return
+        from Resources.csv_codec import read_landmark_file
+        from Resources.landmark_logic import define_landmarks
         landmark_dict = {lm.name: lm for lm in self.landmarks}
-        with open(file_name, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile, delimiter=';', quoting=csv.QUOTE_MINIMAL)
-            for row in reader:
-                try:
-                    name = row['landmark name']
-                    x = locale.atof(row['x'])
-                    y = locale.atof(row['y'])
-                    z = locale.atof(row['z'])
-                except Exception as e:
-                    errorDisplay("Invalid file. Must contain columns: 'landmark name', 'x', 'y', 'z'")
-                    return
-                if name not in landmark_dict.keys():
-                    errorDisplay(f"Unknown landmark {name}")
-                    return
-                landmark_dict[name].define(x, y, z)
-        # force update
-        self.measurement_stack.currentWidget().disable() 
-        self.measurement_stack.currentWidget().enable()
+
+        # Validate the whole file before anything is changed
+        try:
+            point_dict = read_landmark_file(file_name)
+        except Exception as e:
+            point_dict = None
+        if point_dict is None:
+            errorDisplay("Invalid file. Must contain columns: 'landmark name', 'x', 'y', 'z'")
+            return
+        positions = []
+        for name, position in point_dict.items():
+            if name not in landmark_dict.keys():
+                errorDisplay(f"Unknown landmark {name}")
+                return
+            positions.append((landmark_dict[name], tuple(position)))
+
+        # Define all landmarks in one go, the current measurement is updated once when it is enabled again
+        current_widget = self.measurement_widgets[self.measurement_stack.currentIndex]
+        if current_widget is not None:
+            current_widget.disable()
+        define_landmarks(positions)
+        if current_widget is not None:
+            current_widget.enable()
 
     def _export_measurements(self):
         file_name = qt.QFileDialog.getSaveFileName(self, 'Export measurements', '',"CSV File (*.csv)")
         if file_name == "":
             return
 
-        with open(file_name, 'w+', newline='') as csvfile:
-            fieldnames = ['measurement', 'value', 'description']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, delimiter=';' 
-                                    if locale.localeconv()['decimal_point'] == "," else ",", quoting=csv.QUOTE_MINIMAL)
-            writer.writeheader()
-            for i in range(self.measurement_stack.count):
-                measurement = self.measurement_stack.widget(i).measurement
-                result_ready, result_value, result_string = measurement()
-                if result_ready:
-                    writer.writerow({"measurement": measurement.name, 
-                                     "value": locale.str(result_value), 
-                                     "description": result_string})
+        names, values, descriptions = [], [], []
+        for measurement in self.measurements:
+            result_ready, result_value, result_string = measurement()
+            if result_ready:
+                names.append(measurement.name)
+                values.append(result_value)
+                descriptions.append(result_string)
+        from Resources.csv_codec import write_measurements, user_locale_format
+        write_measurements(file_name, names, values, descriptions, user_locale_format())
         
 
+    def _measurement_widget(self, i):
+        '''
+        Returns the widget of the i-th measurement, replacing its placeholder on first use
+        '''
+        if self.measurement_widgets[i] is None:
+            placeholder = self.measurement_stack.widget(i)
+            self.measurement_widgets[i] = MeasurementWidget(self.measurements[i])
+            self.measurement_widgets[i].placement_uncertainty = self.placement_uncertainty.value
+            self.measurement_stack.insertWidget(i, self.measurement_widgets[i])
+            self.measurement_stack.removeWidget(placeholder)
+            placeholder.deleteLater()
+        return self.measurement_widgets[i]
+
+    def _update_femur_head(self):
+        center = None
+        if self.surface_femur_head.checked:
+            surface_index = self.base_widget.bone_surface_index()
+            if surface_index is None:
+                self.femur_head_status.setText("No bone segmentation, using the femur head points")
+            elif not self.femur_head_seed.placed:
+                self.femur_head_status.setText(f"Place '{self.FEMUR_HEAD_SEED}' on the femur head")
+            else:
+                from BoneAngleMeterCore.femur_head import femur_head_from_surface
+                with TRACER.span("MeasurementsDialog.femur_head_fit"):
+                    fit = femur_head_from_surface(surface_index, self.femur_head_seed.get_position())
+                if fit is None:
+                    self.femur_head_status.setText("No sphere found, using the femur head points")
+                else:
+                    center = fit.center
+                    self.femur_head_status.setText(f"r = {fit.radius:.1f} mm, {fit.n_inliers}/{fit.n_points} "
+                                                   f"surface points, rms {fit.rms:.2f} mm")
+        else:
+            self.femur_head_status.setText("")
+        self.antetorsion.set_femur_head_center(center)
+        current_widget = self.measurement_widgets[self.measurement_stack.currentIndex]
+        if current_widget is not None:
+            current_widget.update_measurement()
+
+    def _change_snap_to_bone(self, checked):
+        # The index is built here rather than during the first drag
+        if checked and self.base_widget.bone_surface_index() is None:
+            errorDisplay("No bone segmentation. Apply the 3D segmentation first.")
+            self.snap_to_bone.setChecked(False)
+            return
+        for landmark in self.landmarks:
+            landmark.set_snap(self._snap_to_bone if checked else None)
+
+    def _snap_to_bone(self, position):
+        surface_index = self.base_widget.bone_surface_index()
+        if surface_index is None:
+            return None
+        nearest = surface_index.nearest(position)
+        return None if nearest is None else nearest[0]
+
+    def _change_placement_uncertainty(self, value):
+        for widget in self.measurement_widgets:
+            if widget is not None:
+                widget.placement_uncertainty = value
+                widget.update_measurement()
+
     def _change_row(self, i):
-        self.measurement_stack.currentWidget().disable()
-        self.measurement_stack.setCurrentIndex(i)
+        old_widget = self.measurement_widgets[self.measurement_stack.currentIndex]
+        if old_widget is not None:
+            old_widget.disable()
+        self.measurement_stack.setCurrentWidget(self._measurement_widget(i))
         self.measurement_stack.currentWidget().enable()
 
+    def cleanup(self):
+        '''
+        Removes the observers of the dialog and its landmarks when the module is closed
+        '''
+        for landmark in self.landmarks:
+            OBSERVER_REGISTRY.unsubscribe(landmark)
+        OBSERVER_REGISTRY.unsubscribe(self)
+
     # Override default events
     def showEvent(self, event):
         selectionNode = slicer.app.applicationLogic().GetSelectionNode()
@@ -313,11 +777,19 @@ class MeasurementsDialog(qt.QDialog):
         if self.measurement_list.currentRow == -1 and self.measurement_list.count > 0:
             self.measurement_list.setCurrentRow(0)
 
-        self.measurement_stack.currentWidget().enable()
+        # A different case may have been loaded while the dialog was closed
+        self._recover_landmarks()
+
+        # The segmentation may have changed while the dialog was closed
+        if self.surface_femur_head.checked:
+            self._update_femur_head()
+        self._measurement_widget(self.measurement_stack.currentIndex).enable()
         event.accept()
 
     def closeEvent(self, event):
-        self.measurement_stack.currentWidget().disable()
+        current_widget = self.measurement_widgets[self.measurement_stack.currentIndex]
+        if current_widget is not None:
+            current_widget.disable()
         event.accept()
         self.accept() # set result code and emit finished signal
 
@@ -331,6 +803,7 @@ class MeasurementWidget(qt.QWidget):
 
         self.measurement = measurement
         self.enabled = False
+        self.placement_uncertainty = 1.0 # mm
 
         self.landmark_stack = qt.QStackedWidget(self)
         self.landmark_list = qt.QListWidget()
@@ -355,11 +828,14 @@ class MeasurementWidget(qt.QWidget):
         self.description_label = qt.QLabel(self.measurement.description)
         self.description_label.setWordWrap(True)
         self.measurement_label = qt.QLabel(f"Not available")
+        self.sensitivity_label = qt.QLabel("")
+        self.sensitivity_label.setWordWrap(True)
         
         layout = qt.QFormLayout()
         layout.addRow(self.name_label)
         layout.addRow("<b>Description</b>", self.description_label)
         layout.addRow("<b>Result</b>", self.measurement_label)
+        layout.addRow("<b>Uncertainty</b>", self.sensitivity_label)
         layout.addRow(self.landmark_group_box)
 
         self.setLayout(layout)
@@ -372,8 +848,11 @@ class MeasurementWidget(qt.QWidget):
         self.prev_shortcut.activated.connect(self._prev_row)
         self.prev_shortcut.setContext(qt.Qt.ApplicationShortcut)
 
+        # Landmark pages are built when they are shown for the first time
+        self.landmark_widgets = []
         for landmark in self.measurement.get_landmarks():
-            self.landmark_stack.addWidget(LandmarkWidget(landmark))
+            self.landmark_widgets.append(None)
+            self.landmark_stack.addWidget(qt.QWidget())
             self.landmark_list.addItem(landmark.name)
             landmark.add_change_callback(self.update_measurement)
 
@@ -392,8 +871,8 @@ class MeasurementWidget(qt.QWidget):
         for landmark in self.measurement.landmarks:
             landmark.show()
         
-        current_landmark_widget = self.landmark_stack.currentWidget()
-        current_landmark_widget.landmark.start_interaction()
+        current_landmark = self.measurement.landmarks[self.landmark_stack.currentIndex]
+        current_landmark.start_interaction()
                    
         self.next_shortcut.setEnabled(True)
         self.prev_shortcut.setEnabled(True)
@@ -411,17 +890,35 @@ class MeasurementWidget(qt.QWidget):
 
     def update_measurement(self):
         if self.enabled:
-            try:
-                result_ready, result_value, result_string = self.measurement()
-                if result_ready:
-                    self.measurement_label.setText(f"{result_value:.2f}\N{DEGREE SIGN} {result_string}")
-                    self.measurement_label.setStyleSheet("QLabel { background-color : green}")
-                else:
-                    self.measurement_label.setText(result_string)
-                    self.measurement_label.setStyleSheet("QLabel { background-color : orange}")
-            except Exception as e:
-                self.measurement_label.setText(f"Error executing measurement: {e}")
-                self.measurement_label.setStyleSheet("QLabel { background-color : red}")
+            with TRACER.span("MeasurementWidget.update_measurement", 1):
+                try:
+                    result_ready, result_value, result_string = self.measurement()
+                    if result_ready:
+                        self.measurement_label.setText(f"{result_value:.2f}\N{DEGREE SIGN} {result_string}")
+                        self.measurement_label.setStyleSheet("QLabel { background-color : green}")
+                        self._update_sensitivity()
+                    else:
+                        self.sensitivity_label.setText("")
+                        self.measurement_label.setText(result_string)
+                        self.measurement_label.setStyleSheet("QLabel { background-color : orange}")
+                except Exception as e:
+                    self.measurement_label.setText(f"Error executing measurement: {e}")
+                    self.measurement_label.setStyleSheet("QLabel { background-color : red}")
+
+    def _update_sensitivity(self):
+        # Propagated uncertainty of the angle and the landmark with the largest share of it
+        try:
+            budget = self.measurement.current_error_budget(self.placement_uncertainty)
+        except NotImplementedError:
+            budget = None
+        if budget is None:
+            self.sensitivity_label.setText("")
+            return
+        total, parts = budget
+        dominant = max(parts, key=parts.get)
+        share = parts[dominant]**2 / total**2 if total > 0 else 0.0
+        self.sensitivity_label.setText(f"\N{PLUS-MINUS SIGN}{total:.2f}\N{DEGREE SIGN} for \N{PLUS-MINUS SIGN}{self.placement_uncertainty:.1f} mm "
+                                       f"per landmark, mostly from '{dominant}' ({share:.0%})")
 
     # Internal callbacks
     def _next_row(self):
@@ -434,12 +931,24 @@ class MeasurementWidget(qt.QWidget):
             # Emit signal currentRowChanged
             self.landmark_list.setCurrentRow(self.landmark_list.currentRow - 1)
 
+    def _landmark_widget(self, i):
+        '''
+        Returns the page of the i-th landmark, replacing its placeholder on first use
+        '''
+        if self.landmark_widgets[i] is None:
+            placeholder = self.landmark_stack.widget(i)
+            self.landmark_widgets[i] = LandmarkWidget(self.measurement.landmarks[i])
+            self.landmark_stack.insertWidget(i, self.landmark_widgets[i])
+            self.landmark_stack.removeWidget(placeholder)
+            placeholder.deleteLater()
+        return self.landmark_widgets[i]
+
     def _change_row(self, i):
-        old_landmark_widget = self.landmark_stack.currentWidget()
-        old_landmark_widget.landmark.stop_interaction()
-        self.landmark_stack.setCurrentIndex(i)
-        new_landmark_widget = self.landmark_stack.currentWidget()
-        new_landmark_widget.landmark.start_interaction()
+        old_landmark = self.measurement.landmarks[self.landmark_stack.currentIndex]
+        old_landmark.stop_interaction()
+        self.landmark_stack.setCurrentWidget(self._landmark_widget(i))
+        new_landmark = self.measurement.landmarks[i]
+        new_landmark.start_interaction()
 
 class LandmarkWidget(qt.QWidget):
     '''
@@ -456,10 +965,7 @@ class LandmarkWidget(qt.QWidget):
         self.description_label.setWordWrap(True)
         if self.landmark.image_path != "":
             path = osp.join(MODULE_PATH, self.landmark.image_path)
-            pixmap = qt.QPixmap(path)
-            if pixmap.isNull():
-                raise ValueError(f"Could not load image from file '{path}'")
-            self.image = ResizableImage(pixmap)
+            self.image = ResizableImage(cached_pixmap(path))
         else:
             self.image = None
 
@@ -477,12 +983,26 @@ class ResizableImage(qt.QLabel):
     Widget that displays an image and keeps the aspect ratio when rescaled.
     Inspired by:
     https://stackoverflow.com/questions/8211982/qt-resizing-a-qlabel-containing-a-qpixmap-while-keeping-its-aspect-ratio/
+
+    Scaled pixmaps are taken from a pyramid of pre-scaled halves of the image. While the widget is being
+    resized the image is scaled with fast transformation, the smooth version follows once resizing stopped.
+    Recently used sizes are kept in a small LRU cache.
     """
+    SCALED_CACHE_SIZE = 8
+    SMOOTH_DELAY_MS = 150
+    MIN_PYRAMID_SIZE = 64
+
     def __init__(self, pixmap) -> None:
         super().__init__()
         self.setMinimumSize(1, 1)
         self.setScaledContents(False)
         self.raw_pixmap = pixmap
+        self._pyramid = None
+        self._scaled_cache = OrderedDict()
+        self._smooth_timer = qt.QTimer(self)
+        self._smooth_timer.setSingleShot(True)
+        self._smooth_timer.setInterval(self.SMOOTH_DELAY_MS)
+        self._smooth_timer.timeout.connect(self._smooth_rescale)
         self.setPixmap(self.scaledPixmap())
 
     def heightForWidth(self, width):
@@ -492,9 +1012,40 @@ class ResizableImage(qt.QLabel):
         w = self.width
         return qt.QSize(w, self.heightForWidth(w))
 
-    def scaledPixmap(self):
-        return self.raw_pixmap.scaled(self.size, qt.Qt.KeepAspectRatio, qt.Qt.SmoothTransformation)
+    def _source_pixmap(self, size):
+        # Smallest pyramid level that is still at least as large as the requested size
+        if self._pyramid is None:
+            self._pyramid = [self.raw_pixmap]
+            while min(self._pyramid[-1].width(), self._pyramid[-1].height()) >= 2*self.MIN_PYRAMID_SIZE:
+                level = self._pyramid[-1]
+                self._pyramid.append(level.scaled(level.width()//2, level.height()//2, qt.Qt.KeepAspectRatio, qt.Qt.SmoothTransformation))
+        for level in reversed(self._pyramid):
+            if level.width() >= size.width() or level.height() >= size.height():
+                return level
+        return self.raw_pixmap
+
+    def scaledPixmap(self, transformation=qt.Qt.SmoothTransformation):
+        size = self.size
+        key = (size.width(), size.height())
+        if key in self._scaled_cache:
+            self._scaled_cache.move_to_end(key)
+            return self._scaled_cache[key]
+        scaled = self._source_pixmap(size).scaled(size, qt.Qt.KeepAspectRatio, transformation)
+        if transformation == qt.Qt.SmoothTransformation:
+            self._scaled_cache[key] = scaled
+            if len(self._scaled_cache) > self.SCALED_CACHE_SIZE:
+                self._scaled_cache.popitem(last=False)
+        return scaled
+
+    def _smooth_rescale(self):
+        self.setPixmap(self.scaledPixmap())
 
     def resizeEvent(self, event):
-        self.setPixmap(self.scaledPixmap())
+        size = self.size
+        if (size.width(), size.height()) in self._scaled_cache:
+            self.setPixmap(self.scaledPixmap())
+        else:
+            # Cheap preview while resizing, smooth rescale once the size settled
+            self.setPixmap(self.scaledPixmap(qt.Qt.FastTransformation))
+            self._smooth_timer.start()
         event.accept()
\ No newline at end of file
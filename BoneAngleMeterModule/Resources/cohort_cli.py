@@ -0,0 +1,228 @@
+'''
+Headless scoring of landmark files without 3D Slicer.
+
+Reads every landmark CSV (as written by "Export landmarks") below a directory, infers the side
+from the file path and evaluates all MEASUREMENTS on a process pool. Results are streamed to a
+single CSV file, with the absolute path of each file. CSV files that are no landmark files get a single
+"Skipped" row. Re-running the same command after an interruption continues where it stopped.
+
+Usage (from the BoneAngleMeterModule directory):
+    python -m Resources.cohort_cli <directory> -o results.csv -j 64
+A landmark archive (see Resources.landmark_archive) can be given instead of the directory. Its cases are
+evaluated in one process with the batch code path of the measurements:
+    python -m Resources.cohort_cli cohort.lma -o results.csv
+'''
+import argparse
+import csv
+import multiprocessing
+import os
+import os.path as osp
+import re
+import sys
+
+import numpy as np
+
+from BoneAngleMeterCore.measurements import MEASUREMENTS
+from Resources.csv_codec import read_landmark_file
+
+FIELDNAMES = ['file', 'side', 'measurement', 'value', 'description']
+SIDE_PATTERNS = {
+    'left': re.compile(r'(^|[^a-z])(left|links)([^a-z]|$)'),
+    'right': re.compile(r'(^|[^a-z])(right|rechts)([^a-z]|$)'),
+}
+
+def infer_side(path, default=None):
+    '''
+    Returns 'left' or 'right' based on the file name, falling back to the parent directories
+    and finally to default.
+    '''
+    parts = osp.normpath(path).lower().split(os.sep)
+    for part in reversed(parts):
+        found = [side for side, pattern in SIDE_PATTERNS.items() if pattern.search(part)]
+        if len(found) == 1:
+            return found[0]
+    return default
+
+def find_landmark_files(root, output_path=None):
+    '''
+    Yields the paths of all CSV files below root, joined to root as given, except the output file
+    '''
+    output_path = osp.abspath(output_path) if output_path is not None else None
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = osp.join(directory, filename)
+            if filename.lower().endswith('.csv') and osp.abspath(path) != output_path:
+                yield path
+
+
+_measurements = {}
+
+def _init_worker():
+    # One set of measurement objects per side and worker process
+    for side in ('left', 'right'):
+        _measurements[side] = []
+        for measurement in MEASUREMENTS:
+            m = measurement()
+            m.set_side(side)
+            _measurements[side].append(m)
+
+def score_file(job):
+    '''
+    Evaluates all measurements for one landmark file. The side is inferred from the path as found below
+    the root, the rows name the file by its absolute path. Returns the absolute path and the result rows.
+    '''
+    path, default_side = job
+    side = infer_side(path, default_side)
+    key = osp.abspath(path)
+    try:
+        point_dict = read_landmark_file(path)
+    except Exception as e:
+        return key, [{'file': key, 'side': side, 'measurement': '', 'value': '', 'description': f"Invalid file: {e}"}]
+    if point_dict is None:
+        # Recorded, so a resumed run does not read the file again
+        return key, [{'file': key, 'side': side or '', 'measurement': '', 'value': '',
+                      'description': "Skipped: no landmark file"}]
+    if side is None:
+        return key, [{'file': key, 'side': '', 'measurement': '', 'value': '', 'description': "Unknown side"}]
+
+    rows = []
+    for m in _measurements[side]:
+        try:
+            if any(name not in point_dict for name in m.LANDMARK_NAMES):
+                value, description = '', "Not all landmarks defined"
+            else:
+                points = np.array([[point_dict[name] for name in m.LANDMARK_NAMES]], dtype=float)
+                angles, descriptions = m.measure_batch(points, m.LANDMARK_NAMES)
+                value, description = repr(float(angles[0])), str(descriptions[0])
+        except Exception as e:
+            value, description = '', f"Error executing measurement: {e}"
+        rows.append({'file': key, 'side': side, 'measurement': m.name, 'value': value, 'description': description})
+    return key, rows
+
+def resume_output(output_path):
+    '''
+    Returns the set of files that are already complete in an existing output file. Rows of a file are
+    always written as one block, so an interrupted run can only leave the last block incomplete.
+    That block is cut off, so the file is processed again.
+    '''
+    done = set()
+    if not osp.exists(output_path):
+        return done
+    valid_end = 0
+    with open(output_path, 'r', newline='') as f:
+        header = f.readline()
+        if not header.endswith('\n'):
+            os.truncate(output_path, 0)
+            return done
+        valid_end = f.tell()
+        current_file, current_rows, block_end = None, [], valid_end
+        while True:
+            line = f.readline()
+            if not line.endswith('\n'):
+                break
+            row = next(csv.reader([line]))
+            if row[0] != current_file:
+                if current_file is not None and _is_complete(current_rows):
+                    done.add(current_file)
+                    valid_end = block_end
+                current_file, current_rows = row[0], []
+            current_rows.append(row)
+            block_end = f.tell()
+        if current_file is not None and _is_complete(current_rows):
+            done.add(current_file)
+            valid_end = block_end
+    os.truncate(output_path, valid_end)
+    return done
+
+def _is_complete(rows):
+    # A file produces one row per measurement or a single row without measurement for an error or a skip
+    if len(rows) == 1 and rows[0][2] == '':
+        return True
+    return len(rows) == len(MEASUREMENTS)
+
+def run(root, output_path, workers=None, default_side=None, chunksize=16):
+    # Files are compared by absolute path, so 'data' and './data' (or relative rows of older runs) match
+    done = {osp.abspath(path) for path in resume_output(output_path)}
+    jobs = [(path, default_side) for path in find_landmark_files(root, output_path) if osp.abspath(path) not in done]
+
+    write_header = not osp.exists(output_path) or osp.getsize(output_path) == 0
+    n_files = 0
+    with open(output_path, 'a', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, quoting=csv.QUOTE_MINIMAL)
+        if write_header:
+            writer.writeheader()
+        with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+            for path, rows in pool.imap_unordered(score_file, jobs, chunksize=chunksize):
+                if len(rows) > 0:
+                    writer.writerows(rows)
+                    csvfile.flush()
+                n_files += 1
+    return len(done), n_files
+
+def score_archive(archive_path, output_path, default_side=None):
+    '''
+    Evaluates all measurements for the cases of a landmark archive. Each measurement is computed at once
+    for all cases of a side that have its landmarks placed. Returns the numbers of skipped and processed cases.
+    '''
+    from Resources.landmark_archive import LandmarkArchive # imports this module
+
+    done = resume_output(output_path)
+    write_header = not osp.exists(output_path) or osp.getsize(output_path) == 0
+    with LandmarkArchive(archive_path) as archive:
+        placed = archive.placed
+        sides = np.where(archive.sides == "", default_side or "", archive.sides)
+        todo = np.array([case_id not in done for case_id in archive.case_ids], dtype=bool)
+
+        results = {} # (case, measurement name) -> (value, description)
+        for side in ('left', 'right'):
+            cases = np.flatnonzero(todo & (sides == side))
+            if len(cases) == 0:
+                continue
+            for measurement in MEASUREMENTS:
+                m = measurement()
+                m.set_side(side)
+                if any(name not in archive.landmark_names for name in m.LANDMARK_NAMES):
+                    continue
+                columns = [archive.landmark_index(name) for name in m.LANDMARK_NAMES]
+                complete = cases[placed[cases][:, columns].all(axis=1)]
+                if len(complete) == 0:
+                    continue
+                angles, descriptions = m.measure_batch(archive.points[complete], archive.landmark_names)
+                for case, angle, description in zip(complete, angles, descriptions):
+                    results[case, m.name] = (repr(float(angle)), str(description))
+
+        with open(output_path, 'a', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES, quoting=csv.QUOTE_MINIMAL)
+            if write_header:
+                writer.writeheader()
+            for case in np.flatnonzero(todo):
+                case_id = archive.case_ids[case]
+                if sides[case] == "":
+                    writer.writerow({'file': case_id, 'side': '', 'measurement': '', 'value': '', 'description': "Unknown side"})
+                    continue
+                for measurement in MEASUREMENTS:
+                    name = measurement().name
+                    value, description = results.get((case, name), ('', "Not all landmarks defined"))
+                    writer.writerow({'file': case_id, 'side': sides[case], 'measurement': name, 'value': value,
+                                     'description': description})
+    return len(done), int(todo.sum())
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate all bone angle measurements for a directory of landmark files.")
+    parser.add_argument('directory', help="Directory that is searched recursively for landmark CSV files, or a landmark archive")
+    parser.add_argument('-o', '--output', default='measurements.csv', help="Combined results file (default: %(default)s)")
+    parser.add_argument('-j', '--workers', type=int, default=os.cpu_count(), help="Number of worker processes (default: all cores)")
+    parser.add_argument('--side', choices=['left', 'right'], default=None,
+                        help="Side used when it cannot be inferred from the file path")
+    parser.add_argument('--chunksize', type=int, default=16, help="Files handed to a worker at once (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if osp.isfile(args.directory):
+        skipped, processed = score_archive(args.directory, args.output, args.side)
+    else:
+        skipped, processed = run(args.directory, args.output, args.workers, args.side, args.chunksize)
+    print(f"{processed} files processed, {skipped} files already done", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
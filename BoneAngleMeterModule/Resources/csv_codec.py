@@ -0,0 +1,188 @@
+'''
+Reading and writing of landmark and measurement CSV files.
+
+The exporter follows the locale: ';' as delimiter and ',' as decimal point where the decimal point is a
+comma, ',' and '.' elsewhere. Readers sniff both separators once per file from the header and the first
+rows, and convert whole columns to floats at once instead of calling locale.atof per cell. Large files
+(e.g. many cases in one file) can be streamed in blocks of rows with iter_columns and iter_landmark_cases.
+'''
+import csv
+import io
+import locale
+from collections import namedtuple
+from itertools import islice
+
+import numpy as np
+
+CsvFormat = namedtuple('CsvFormat', ['delimiter', 'decimal'])
+
+LANDMARK_FIELDS = ['landmark name', 'x', 'y', 'z']
+MEASUREMENT_FIELDS = ['measurement', 'value', 'description']
+BLOCK_ROWS = 65536
+SNIFF_ROWS = 32
+
+def _format_for(decimal_point):
+    return CsvFormat(';', ',') if decimal_point == ',' else CsvFormat(',', '.')
+
+def locale_format():
+    '''
+    Format of the exporter for the current locale of the process
+    '''
+    return _format_for(locale.localeconv()['decimal_point'])
+
+def user_locale_format():
+    '''
+    Format of the exporter for the user's locale as Qt reports it (the system locale, which the C locale
+    of the process need not follow). Does not call setlocale, which would change the number formatting of
+    all threads. Without Qt the format of the current locale is used.
+    '''
+    try:
+        import qt
+    except ImportError:
+        return locale_format()
+    # toString returns a str, unlike decimalPoint, whose QChar the Python wrapping may not convert
+    return _format_for(',' if ',' in qt.QLocale.system().toString(0.5) else '.')
+
+def sniff_delimiter(header):
+    counts = {delimiter: header.count(delimiter) for delimiter in (';', ',', '\t')}
+    delimiter = max(counts, key=counts.get)
+    return delimiter if counts[delimiter] > 0 else ','
+
+def sniff_decimal(delimiter, rows, numeric_columns):
+    # With ',' as delimiter the decimal point can only be '.'. With ';' the exporter writes ',' unless
+    # the numbers show a '.' and no ','.
+    if delimiter == ',':
+        return '.'
+    seen = set()
+    for row in rows:
+        for i in numeric_columns:
+            if i < len(row):
+                seen.update(c for c in row[i] if c in ',.')
+    return '.' if seen == {'.'} else ','
+
+def parse_floats(strings, decimal='.'):
+    '''
+    Converts a sequence of number strings to a float array
+    '''
+    if decimal != '.':
+        strings = [s.replace(decimal, '.') for s in strings]
+    return np.array(strings, dtype=float).reshape(len(strings))
+
+def format_floats(values, decimal='.'):
+    '''
+    Shortest round-trip representations of the values with the given decimal point
+    '''
+    strings = np.asarray(values, dtype=float).astype(str)
+    if decimal != '.':
+        strings = np.char.replace(strings, '.', decimal)
+    return strings.tolist()
+
+class _Reader:
+    # csv.reader for an open text file whose format is sniffed from the header and the first rows
+    def __init__(self, csvfile, numeric_fields=()):
+        header = csvfile.readline()
+        delimiter = sniff_delimiter(header)
+        self.fields = next(csv.reader([header], delimiter=delimiter)) if header.strip() else []
+        self.rows = csv.reader(csvfile, delimiter=delimiter, quoting=csv.QUOTE_MINIMAL)
+        numeric_columns = [self.fields.index(f) for f in numeric_fields if f in self.fields]
+        self._sniffed = list(islice(self.rows, SNIFF_ROWS))
+        self.csv_format = CsvFormat(delimiter, sniff_decimal(delimiter, self._sniffed, numeric_columns))
+
+    def blocks(self, block_rows):
+        pending, self._sniffed = self._sniffed, []
+        while True:
+            rows = pending + list(islice(self.rows, max(0, block_rows - len(pending))))
+            pending = []
+            if not rows:
+                return
+            rows = [row for row in rows if row] # skip empty lines
+            if rows:
+                yield rows
+
+def _columns(fields, block, numeric_fields, decimal):
+    columns = {}
+    for i, field in enumerate(fields):
+        values = [row[i] if i < len(row) else '' for row in block]
+        columns[field] = parse_floats(values, decimal) if field in numeric_fields else values
+    return columns
+
+def iter_columns(path, numeric_fields=(), block_rows=BLOCK_ROWS):
+    '''
+    Streams a CSV file as dictionaries of columns with up to block_rows rows each. The numeric fields are
+    float arrays, all other columns lists of strings.
+    '''
+    with open(path, 'r', newline='') as csvfile:
+        reader = _Reader(csvfile, numeric_fields)
+        for block in reader.blocks(block_rows):
+            yield _columns(reader.fields, block, numeric_fields, reader.csv_format.decimal)
+
+def read_columns(path, numeric_fields=()):
+    '''
+    Reads a whole CSV file as dictionary of columns, see iter_columns
+    '''
+    with open(path, 'r', newline='') as csvfile:
+        reader = _Reader(csvfile, numeric_fields)
+        block = [row for block in reader.blocks(BLOCK_ROWS) for row in block]
+        return _columns(reader.fields, block, numeric_fields, reader.csv_format.decimal)
+
+def read_landmark_file(path):
+    '''
+    Reads a landmark CSV and returns a dictionary of landmark names and positions (in file order),
+    or None if the file is not a landmark file. Raises ValueError for missing columns or invalid numbers.
+    '''
+    with open(path, 'r', newline='') as csvfile:
+        reader = _Reader(csvfile, LANDMARK_FIELDS[1:])
+        if 'landmark name' not in reader.fields:
+            return None
+        if any(f not in reader.fields for f in LANDMARK_FIELDS):
+            raise ValueError(f"Must contain columns: {', '.join(repr(f) for f in LANDMARK_FIELDS)}")
+        block = [row for block in reader.blocks(BLOCK_ROWS) for row in block]
+        columns = _columns(reader.fields, block, LANDMARK_FIELDS[1:], reader.csv_format.decimal)
+    positions = np.stack([columns['x'], columns['y'], columns['z']], axis=-1)
+    return dict(zip(columns['landmark name'], positions))
+
+def iter_landmark_cases(path, case_field='case', block_rows=BLOCK_ROWS):
+    '''
+    Streams a landmark file that holds many cases, one row per landmark and case, with the case in
+    case_field. Yields (case, dictionary of landmark positions) for every run of rows of the same case.
+    Without case_field the whole file is one case with case None.
+    '''
+    case, point_dict = None, {}
+    for columns in iter_columns(path, LANDMARK_FIELDS[1:], block_rows):
+        positions = np.stack([columns['x'], columns['y'], columns['z']], axis=-1)
+        cases = columns.get(case_field, [None]*len(positions))
+        for row_case, name, position in zip(cases, columns['landmark name'], positions):
+            if row_case != case and point_dict:
+                yield case, point_dict
+                point_dict = {}
+            case = row_case
+            point_dict[name] = position
+    if point_dict:
+        yield case, point_dict
+
+def write_landmarks(csvfile, names, positions, csv_format=None):
+    '''
+    Writes landmark names and positions (n, 3) to a file path or an open text file. The format defaults
+    to the one of the current locale, see locale_format.
+    '''
+    csv_format = csv_format or locale_format()
+    positions = np.asarray(positions, dtype=float).reshape(-1, 3)
+    rows = [[name, *xyz] for name, xyz in zip(names, format_floats(positions, csv_format.decimal))]
+    _write(csvfile, LANDMARK_FIELDS, rows, csv_format)
+
+def write_measurements(csvfile, names, values, descriptions, csv_format=None):
+    '''
+    Writes measurement names, values and descriptions to a file path or an open text file
+    '''
+    csv_format = csv_format or locale_format()
+    rows = [[name, value, description] for name, value, description
+            in zip(names, format_floats(values, csv_format.decimal), descriptions)]
+    _write(csvfile, MEASUREMENT_FIELDS, rows, csv_format)
+
+def _write(csvfile, fields, rows, csv_format):
+    if not isinstance(csvfile, io.TextIOBase):
+        with open(csvfile, 'w', newline='') as f:
+            return _write(f, fields, rows, csv_format)
+    writer = csv.writer(csvfile, delimiter=csv_format.delimiter, quoting=csv.QUOTE_MINIMAL)
+    writer.writerow(fields)
+    writer.writerows(rows)
@@ -0,0 +1,225 @@
+'''
+Binary archive of the landmarks of many cases.
+
+Layout (little endian), every block starts at a multiple of 64 bytes:
+    header       magic, version, coordinate item size, number of landmarks and cases, block offsets
+    names        landmark names, UTF-8, separated by newlines
+    case ids     case identifiers (e.g. the relative path of the source CSV), UTF-8, separated by newlines
+    sides        uint8 per case: 0 unknown, 1 left, 2 right
+    placed       bitmap of placed landmarks, (cases, ceil(landmarks/8)) bytes, see numpy.packbits
+    coordinates  float32 or float64 array of shape (cases, landmarks, 3), NaN where not placed
+
+LandmarkArchive memory-maps the file, so slicing the coordinates of a cohort does not read or copy
+anything else. Conversion from and to landmark CSV files (as written by "Export landmarks"):
+    python -m Resources.landmark_archive to-archive <directory> -o cohort.lma
+    python -m Resources.landmark_archive to-csv cohort.lma -o <directory>
+'''
+import argparse
+import os
+import os.path as osp
+import struct
+import sys
+
+import numpy as np
+
+from BoneAngleMeterCore.landmark_definitions import LANDMARK_NAMES
+from Resources.cohort_cli import infer_side, find_landmark_files
+from Resources.csv_codec import CsvFormat, read_landmark_file, write_landmarks
+
+ARCHIVE_MAGIC = b"BAMLMARK"
+ARCHIVE_VERSION = 1
+ARCHIVE_EXTENSION = ".lma"
+SIDES = ("", "left", "right")
+_HEADER = struct.Struct("<8sHHIQQQQQQ")
+_ALIGNMENT = 64
+
+def _aligned(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+def write_archive(path, points, placed=None, case_ids=None, sides=None, landmark_names=LANDMARK_NAMES, dtype=np.float32):
+    '''
+    Writes an archive. points has shape (n_cases, n_landmarks, 3), ordered like landmark_names along the
+    second axis. placed is a boolean array (n_cases, n_landmarks), by default all finite points are placed.
+    case_ids and sides ('left', 'right' or None) hold one entry per case.
+    '''
+    points = np.asarray(points, dtype=dtype)
+    n_cases, n_landmarks = points.shape[:2]
+    if points.shape != (n_cases, len(landmark_names), 3):
+        raise ValueError(f"Expected points of shape (cases, {len(landmark_names)}, 3), got {points.shape}")
+    if placed is None:
+        placed = np.isfinite(points).all(axis=-1)
+    placed = np.asarray(placed, dtype=bool)
+    points = np.where(placed[..., np.newaxis], points, np.nan).astype(dtype)
+    if case_ids is None:
+        case_ids = [str(i) for i in range(n_cases)]
+    if sides is None:
+        sides = [None] * n_cases
+    if any("\n" in name for name in list(landmark_names) + list(case_ids)):
+        raise ValueError("Landmark names and case ids must not contain line breaks")
+
+    blocks = [
+        "\n".join(landmark_names).encode('utf-8'),
+        "\n".join(case_ids).encode('utf-8'),
+        np.array([SIDES.index(side or "") for side in sides], dtype=np.uint8).tobytes(),
+        np.packbits(placed, axis=-1).tobytes(),
+        points.tobytes(),
+    ]
+    offsets = []
+    offset = _HEADER.size
+    for block in blocks:
+        offset = _aligned(offset)
+        offsets.append(offset)
+        offset += len(block)
+
+    with open(path, 'wb') as f:
+        f.write(_HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION, points.dtype.itemsize, n_landmarks, n_cases, *offsets))
+        for offset, block in zip(offsets, blocks):
+            f.write(b"\0" * (offset - f.tell()))
+            f.write(block)
+
+class LandmarkArchive:
+    '''
+    Read access to an archive. points is a read-only memory map of shape (n_cases, n_landmarks, 3);
+    point_dict() returns per-landmark views of it, which can be passed to the measurements directly.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or header[:8] != ARCHIVE_MAGIC:
+                raise ValueError(f"{path} is not a landmark archive")
+            (magic, version, itemsize, n_landmarks, n_cases,
+             names_offset, case_ids_offset, sides_offset, placed_offset, points_offset) = _HEADER.unpack(header)
+            if version != ARCHIVE_VERSION:
+                raise ValueError(f"Unsupported landmark archive version {version}")
+            f.seek(names_offset)
+            names = f.read(case_ids_offset - names_offset).rstrip(b"\0").decode('utf-8')
+            case_ids = f.read(sides_offset - case_ids_offset).rstrip(b"\0").decode('utf-8')
+        self.landmark_names = tuple(names.split("\n")) if n_landmarks > 0 else ()
+        self.case_ids = case_ids.split("\n") if n_cases > 0 else []
+        self.n_cases = n_cases
+        dtype = {4: np.float32, 8: np.float64}[itemsize]
+        if n_cases > 0:
+            self._sides = np.memmap(path, dtype=np.uint8, mode='r', offset=sides_offset, shape=(n_cases,))
+            self._placed = np.memmap(path, dtype=np.uint8, mode='r', offset=placed_offset,
+                                     shape=(n_cases, -(-n_landmarks // 8)))
+            self.points = np.memmap(path, dtype=dtype, mode='r', offset=points_offset, shape=(n_cases, n_landmarks, 3))
+        else:
+            self._sides = np.zeros(0, dtype=np.uint8)
+            self._placed = np.zeros((0, -(-n_landmarks // 8)), dtype=np.uint8)
+            self.points = np.zeros((0, n_landmarks, 3), dtype=dtype)
+
+    def __len__(self):
+        return self.n_cases
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        # The memory maps are closed once no array refers to them any more
+        self.points = self._placed = self._sides = None
+
+    @property
+    def sides(self):
+        return np.array(SIDES, dtype=object)[self._sides]
+
+    @property
+    def placed(self):
+        return np.unpackbits(self._placed, axis=-1, count=len(self.landmark_names)).astype(bool)
+
+    def landmark_index(self, name):
+        return self.landmark_names.index(name)
+
+    def point_dict(self, cases=slice(None)):
+        '''
+        Dictionary of landmark names and (cases, 3) arrays. Slices of cases are views of the memory map.
+        '''
+        return {name: self.points[cases, i] for i, name in enumerate(self.landmark_names)}
+
+    def case(self, i):
+        '''
+        Returns the case id, the side and a dictionary of the positions of the placed landmarks of case i
+        '''
+        placed = np.unpackbits(self._placed[i], count=len(self.landmark_names)).astype(bool)
+        positions = {name: np.array(self.points[i, j], dtype=float)
+                     for j, name in enumerate(self.landmark_names) if placed[j]}
+        return self.case_ids[i], SIDES[self._sides[i]] or None, positions
+
+def csv_to_archive(root, archive_path, default_side=None, landmark_names=LANDMARK_NAMES, dtype=np.float32):
+    '''
+    Collects all landmark CSV files below root into an archive. The case ids are the file paths relative
+    to root without extension. Files that are no landmark files, cannot be read or contain unknown
+    landmarks are skipped, like cohort_cli does. Returns the number of cases and a list of the skipped
+    files as (path, reason) tuples.
+    '''
+    index = {name: i for i, name in enumerate(landmark_names)}
+    points, case_ids, sides, skipped = [], [], [], []
+    for path in find_landmark_files(root, archive_path):
+        try:
+            point_dict = read_landmark_file(path)
+        except Exception as e:
+            skipped.append((path, f"Invalid file: {e}"))
+            continue
+        if point_dict is None:
+            skipped.append((path, "no landmark file"))
+            continue
+        unknown = set(point_dict) - set(index)
+        if unknown:
+            skipped.append((path, f"unknown landmarks {sorted(unknown)}"))
+            continue
+        case = np.full((len(landmark_names), 3), np.nan)
+        for name, position in point_dict.items():
+            case[index[name]] = position
+        points.append(case)
+        case_ids.append(osp.splitext(osp.relpath(path, root))[0].replace(os.sep, "/"))
+        sides.append(infer_side(path, default_side))
+    points = np.array(points).reshape(-1, len(landmark_names), 3)
+    write_archive(archive_path, points, case_ids=case_ids, sides=sides, landmark_names=landmark_names, dtype=dtype)
+    return len(points), skipped
+
+def archive_to_csv(archive_path, directory, delimiter=','):
+    '''
+    Writes one landmark CSV per case to directory/<case id>.csv. With ';' as delimiter ',' is used as
+    decimal point, like "Export landmarks" does in such locales. Returns the written paths.
+    '''
+    csv_format = CsvFormat(delimiter, ',' if delimiter == ';' else '.')
+    paths = []
+    with LandmarkArchive(archive_path) as archive:
+        for i in range(len(archive)):
+            case_id, side, positions = archive.case(i)
+            path = osp.join(directory, *case_id.split("/")) + ".csv"
+            os.makedirs(osp.dirname(path), exist_ok=True)
+            write_landmarks(path, list(positions), list(positions.values()), csv_format)
+            paths.append(path)
+    return paths
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    to_archive = commands.add_parser('to-archive', help="Collect landmark CSV files into an archive")
+    to_archive.add_argument('directory')
+    to_archive.add_argument('-o', '--output', required=True, help="Archive file")
+    to_archive.add_argument('--side', choices=['left', 'right'], default=None,
+                            help="Side of files without 'left'/'right' in their path")
+    to_archive.add_argument('--float64', action='store_true', help="Store double instead of single precision")
+    to_csv = commands.add_parser('to-csv', help="Write the cases of an archive as landmark CSV files")
+    to_csv.add_argument('archive')
+    to_csv.add_argument('-o', '--output', required=True, help="Output directory")
+    to_csv.add_argument('--delimiter', choices=[',', ';'], default=',')
+    args = parser.parse_args(argv)
+
+    if args.command == 'to-archive':
+        n_cases, skipped = csv_to_archive(args.directory, args.output, args.side,
+                                          dtype=np.float64 if args.float64 else np.float32)
+        for path, reason in skipped:
+            print(f"Skipped {path}: {reason}", file=sys.stderr)
+        print(f"{n_cases} cases written to {args.output}, {len(skipped)} files skipped", file=sys.stderr)
+    else:
+        paths = archive_to_csv(args.archive, args.output, args.delimiter)
+        print(f"{len(paths)} files written to {args.output}", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -1,29 +1,108 @@
 import numpy as np
 import os.path as osp
+import logging
+import qt
 import slicer
+import vtk
+
+from Resources.observer_registry import CallbackList, OBSERVER_REGISTRY
+from BoneAngleMeterCore.instrumentation import TRACER
+
+class CoalescingScheduler:
+    '''
+    Merges bursts of calls into a single call per frame. schedule() only remembers the latest arguments,
+    the callback runs with them when the frame timer fires or when flush() is called.
+    Counts received and executed calls, the difference is the number of merged calls.
+    '''
+    def __init__(self, callback, interval_ms=16):
+        self.callback = callback
+        self.received = 0
+        self.executed = 0
+        self._pending = None
+        self._timer = qt.QTimer()
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self.flush)
+
+    @property
+    def merged(self):
+        return self.received - self.executed - (1 if self._pending is not None else 0)
+
+    def schedule(self, *args):
+        self.received += 1
+        self._pending = args
+        if not self._timer.isActive():
+            self._timer.start()
+
+    def flush(self):
+        self._timer.stop()
+        if self._pending is None:
+            return
+        args = self._pending
+        self._pending = None
+        self.executed += 1
+        self.callback(*args)
+
+    def cancel(self):
+        self._timer.stop()
+        self._pending = None
 
 class SimpleLandmark:
+    '''
+    Landmark backed by a point of a markups node. Adapts the markups node to the landmark interface of
+    the measurements in BoneAngleMeterCore (see PointLandmark).
+    '''
     def __init__(self, name, description="", image_path=""):
         self.name = name
         self.placed = False
-        self.change_callbacks = []
+        self.revision = 0 # incremented on every change of the position, used to invalidate cached geometry
+        self.change_callbacks = CallbackList(OBSERVER_REGISTRY)
+        self.edit_callbacks = CallbackList(OBSERVER_REGISTRY) # called with the landmark when an edit is complete
         self.description = description
         self.image_path = image_path
 
         # Internal members
         self._markups_node = None
         self._id = None
-        self._private_observers = []
+        self._change_scheduler = None
+        self._snap = None
+        self._snapping = False
+        self._revision_position = None
 
     def set_markups_node_id(self, id):
+        '''
+        Binds the landmark to a markups node. See observe_revisions for changes of the point that are
+        made outside of this class.
+        '''
         self._markups_node = slicer.mrmlScene.GetNodeByID(id)
 
         # Set automatic glyph style
         self._markups_node.GetDisplayNode().SetGlyphType(self._markups_node.GetDisplayNode().ThickCross2D)
         self._markups_node.GetDisplayNode().SetGlyphScale(2.5)
 
+        # Point modifications during dragging are merged to one update per frame
+        self._change_scheduler = CoalescingScheduler(self._changed_callback)
+
     def add_change_callback(self, callback):
-        self.change_callbacks.append(callback)
+        self.change_callbacks.add(callback)
+
+    def remove_change_callback(self, callback):
+        self.change_callbacks.remove(callback)
+
+    def add_edit_callback(self, callback):
+        '''
+        Registers a callback for completed edits: placement, define() and the end of dragging, but not
+        every intermediate position of a drag
+        '''
+        self.edit_callbacks.add(callback)
+
+    def set_snap(self, snap):
+        '''
+        snap maps a position to the position the landmark should be moved to when it is placed or
+        dragged (e.g. the nearest point of the bone surface), or to None to leave it where it is.
+        None turns snapping off.
+        '''
+        self._snap = snap
 
     def show(self):
         if self._id is not None:
@@ -39,46 +118,65 @@ class SimpleLandmark:
             self._markups_node.SetNthFiducialLocked(self._id, False)
             self._markups_node.SetNthFiducialSelected(self._id, True)
             self.center_in_slices()
-            self._private_observers.append(self._markups_node.AddObserver(slicer.vtkMRMLMarkupsNode.PointModifiedEvent, 
-                                                                         lambda caller, event: self._changed_callback(caller)))
+            OBSERVER_REGISTRY.subscribe(self, "modified", self._markups_node, slicer.vtkMRMLMarkupsNode.PointModifiedEvent,
+                                        lambda caller, event: self._point_modified(caller))
+            OBSERVER_REGISTRY.subscribe(self, "interaction ended", self._markups_node, slicer.vtkMRMLMarkupsNode.PointEndInteractionEvent,
+                                        lambda caller, event: self._interaction_ended())
         else:
             slicer.modules.markups.logic().StartPlaceMode(0)
-            self._private_observers.append(self._markups_node.AddObserver(slicer.vtkMRMLMarkupsNode.PointAddedEvent, 
-                                                                         lambda caller, event: self._added_callback()))
-            self._private_observers.append(self._markups_node.AddObserver(slicer.vtkMRMLMarkupsNode.PointPositionDefinedEvent, 
-                                                                         lambda caller, event: self._defined_callback()))
+            OBSERVER_REGISTRY.subscribe(self, "added", self._markups_node, slicer.vtkMRMLMarkupsNode.PointAddedEvent,
+                                        lambda caller, event: self._added_callback())
+            OBSERVER_REGISTRY.subscribe(self, "defined", self._markups_node, slicer.vtkMRMLMarkupsNode.PointPositionDefinedEvent,
+                                        lambda caller, event: self._defined_callback())
 
     def stop_interaction(self):
+        if self._change_scheduler is not None:
+            self._change_scheduler.flush()
         if self.placed:
             self._markups_node.SetNthFiducialLocked(self._id, True)
             self._markups_node.SetNthFiducialSelected(self._id, False)
         
-        # Turn off placement mode and remove observers
-        for observer in self._private_observers:
-            self._markups_node.RemoveObserver(observer)
+        # Turn off placement mode and remove the observers of the interaction
+        for name in ("modified", "interaction ended", "added", "defined"):
+            OBSERVER_REGISTRY.unsubscribe(self, name)
 
         interaction_node = slicer.mrmlScene.GetNodeByID("vtkMRMLInteractionNodeSingleton")
         interaction_node.SwitchToViewTransformMode()
         interaction_node.SetPlaceModePersistence(0)                                                       
 
     def center_in_slices(self, excluded_slice_nodes=None):
-        position_RAS = [0.0, 0.0, 0.0]
-        self._markups_node.GetNthFiducialPosition(self._id, position_RAS)
+        with TRACER.span("SimpleLandmark.center_in_slices") as span:
+            position_RAS = [0.0, 0.0, 0.0]
+            self._markups_node.GetNthFiducialPosition(self._id, position_RAS)
 
-        if excluded_slice_nodes is None:
-            slicer.vtkMRMLSliceNode.JumpAllSlices(slicer.mrmlScene, *position_RAS, slicer.vtkMRMLSliceNode.CenteredJumpSlice)
+            if excluded_slice_nodes is None:
+                slicer.vtkMRMLSliceNode.JumpAllSlices(slicer.mrmlScene, *position_RAS, slicer.vtkMRMLSliceNode.CenteredJumpSlice)
+                if TRACER.enabled:
+                    span.fan_out = slicer.mrmlScene.GetNumberOfNodesByClass("vtkMRMLSliceNode")
+            else:
+                slice_nodes = slicer.util.getNodesByClass("vtkMRMLSliceNode")
+                for slice_node in slice_nodes:
+                    if slice_node.GetName() not in excluded_slice_nodes:
+                        slice_node.SetJumpModeToCentered()
+                        slice_node.JumpSlice(*position_RAS)
+                        span.fan_out += 1
+
+    def define(self, x, y, z, notify=True):
+        '''
+        Places the landmark at the given position, or moves it there if it was already placed.
+        With notify=False the change callbacks are not called, see define_landmarks.
+        '''
+        if self.placed:
+            self._markups_node.SetNthFiducialPosition(self._id, x, y, z)
         else:
-            slice_nodes = slicer.util.getNodesByClass("vtkMRMLSliceNode")
-            for slice_node in slice_nodes:
-                if slice_node.GetName() not in excluded_slice_nodes:
-                    slice_node.SetJumpModeToCentered()
-                    slice_node.JumpSlice(*position_RAS)
-
-    def define(self, x, y, z):
-        self._markups_node.AddFiducial(x, y, z, self.name)
-        self._id = self._markups_node.GetNumberOfFiducials() - 1
-        self.placed = True
-        self._changed_callback()
+            self._markups_node.AddFiducial(x, y, z, self.name)
+            self._id = self._markups_node.GetNumberOfFiducials() - 1
+            self.placed = True
+        if notify:
+            self._changed_callback()
+        else:
+            self._update_revision()
+        self.edit_callbacks(self)
 
     def get_position(self):
         if self._id is None or not self.placed:
@@ -87,6 +185,35 @@ class SimpleLandmark:
         self._markups_node.GetNthFiducialPosition(self._id, xyz_buffer)
         return np.array(xyz_buffer)
 
+    def _update_revision(self):
+        '''
+        Increments the revision if the point is not where it was at the last revision. The markups node
+        also reports changes of the label, visibility, lock and selection of the point.
+        '''
+        position = self.get_position()
+        if not np.array_equal(position, self._revision_position):
+            self._revision_position = position
+            self.revision += 1
+
+    def _point_modified(self, caller):
+        # Moves made by _snap_to_surface are not changes of their own
+        if not self._snapping:
+            self._change_scheduler.schedule(caller)
+
+    def _snap_to_surface(self):
+        if self._snap is None:
+            return
+        with TRACER.span("SimpleLandmark.snap"):
+            position = self.get_position()
+            snapped = self._snap(position)
+            if snapped is None or np.allclose(snapped, position):
+                return
+            self._snapping = True
+            try:
+                self._markups_node.SetNthFiducialPosition(self._id, *snapped)
+            finally:
+                self._snapping = False
+
     def _added_callback(self):
         '''
         Called when a point is added (but not necessarily placed). Takes care of giving the right label to the newly added point
@@ -100,20 +227,86 @@ class SimpleLandmark:
         '''
         self._id = self._markups_node.GetNumberOfFiducials()-1
         self.placed = True
+        self._snap_to_surface()
         self.stop_interaction()
         self._changed_callback()
+        self.edit_callbacks(self)
         self.start_interaction()
 
+    def _interaction_ended(self):
+        '''
+        Called when dragging of the point ended. Applies the last pending change immediately.
+        '''
+        self._change_scheduler.flush()
+        self.edit_callbacks(self)
+        scheduler = self._change_scheduler
+        logging.debug(f"Landmark '{self.name}': {scheduler.received} point modifications, "
+                      f"{scheduler.executed} updates, {scheduler.merged} merged")
+
     def _changed_callback(self, caller=None):
         '''
         Called when a point is changed (including defined). Triggers updates to all dependent measurements
         '''
-        if caller is not None:
-            calling_node = caller.GetAttribute("Markups.MovingInSliceView")
-        else:
-            calling_node = None
-        self.center_in_slices([calling_node])
+        with TRACER.span("SimpleLandmark._changed_callback") as span:
+            self._update_revision()
+            if caller is not None:
+                self._snap_to_surface()
+                calling_node = caller.GetAttribute("Markups.MovingInSliceView")
+            else:
+                calling_node = None
+            self.center_in_slices([calling_node])
+
+            callbacks = list(self.change_callbacks)
+            span.fan_out = len(callbacks)
+            for cb in callbacks:
+                cb()
+
+class _PointRevisions:
+    '''
+    PointModifiedEvent observer of one markups node that updates the revision of the landmark of the
+    modified point. The index of the point is the call data of the event.
+    '''
+    def __init__(self, landmarks):
+        self.landmarks = landmarks
+
+    @vtk.calldata_type(vtk.VTK_INT)
+    def point_modified(self, caller, event, index):
+        for landmark in self.landmarks:
+            if landmark._id == index:
+                landmark._update_revision()
+
+def observe_revisions(owner, landmarks):
+    '''
+    Keeps the revisions of the landmarks up to date when their points are also moved outside of
+    SimpleLandmark (Markups module, undo, scene loading). Subscribes one observer per markups node
+    under owner, OBSERVER_REGISTRY.unsubscribe(owner) removes them.
+    '''
+    by_node = {}
+    for landmark in landmarks:
+        by_node.setdefault(landmark._markups_node.GetID(), (landmark._markups_node, []))[1].append(landmark)
+    for node_id, (node, node_landmarks) in by_node.items():
+        OBSERVER_REGISTRY.subscribe(owner, f"revisions {node_id}", node, slicer.vtkMRMLMarkupsNode.PointModifiedEvent,
+                                    _PointRevisions(node_landmarks).point_modified)
 
-        for cb in self.change_callbacks:
-            cb()
+def define_landmarks(positions):
+    '''
+    Defines many landmarks at once. positions is a list of (landmark, (x, y, z)) tuples. All points are added
+    within one modify block of their markups nodes and the slices are not moved. Afterwards every change
+    callback of the defined landmarks is called once, even if it is registered for several of them.
+    '''
+    markups_nodes = []
+    for landmark, position in positions:
+        if all(node is not landmark._markups_node for node, _ in markups_nodes):
+            markups_nodes.append((landmark._markups_node, landmark._markups_node.StartModify()))
+    try:
+        for landmark, (x, y, z) in positions:
+            landmark.define(x, y, z, notify=False)
+    finally:
+        for node, was_modifying in markups_nodes:
+            node.EndModify(was_modifying)
 
+    callbacks = CallbackList()
+    for landmark, position in positions:
+        for callback in landmark.change_callbacks:
+            callbacks.add(callback)
+    callbacks()
\ No newline at end of file
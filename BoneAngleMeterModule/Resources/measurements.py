@@ -1,10 +0,0 @@
-from Resources.measurement_logic import *
-
-MEASUREMENTS = [
-    TibiaTorsionMeasurement,
-    VarusValgusTibiaMeasurement,
-    TibiotalarRotationMeasurement,
-    FemorotibialRotationMeasurement,
-    VarusValgusFemurMeasurement,
-    AntetorsionMeasurement
-]
@@ -0,0 +1,101 @@
+import weakref
+from collections import OrderedDict
+
+class CallbackList:
+    '''
+    List of callbacks without duplicates. Bound methods are held by weak reference, so a deleted widget
+    neither stays alive nor keeps being called. Other callables are held by strong reference.
+    Calling the list calls all live callbacks in the order in which they were added.
+    If a registry is given, the callbacks are included in its subscription count.
+    '''
+    def __init__(self, registry=None):
+        self._callbacks = OrderedDict()
+        self._registry = registry
+        if registry is not None:
+            registry._callback_lists.add(self)
+
+    @staticmethod
+    def _key(callback):
+        if hasattr(callback, '__self__') and hasattr(callback, '__func__'):
+            return (id(callback.__self__), callback.__func__)
+        return (id(callback), None)
+
+    def add(self, callback):
+        '''
+        Adds a callback. Returns False if it was already registered.
+        '''
+        key = self._key(callback)
+        if key in self._callbacks:
+            return False
+        if key[1] is not None:
+            self._callbacks[key] = weakref.WeakMethod(callback, lambda ref: self._callbacks.pop(key, None))
+        else:
+            self._callbacks[key] = lambda: callback
+        return True
+
+    def remove(self, callback):
+        '''
+        Removes a callback. Returns False if it was not registered.
+        '''
+        return self._callbacks.pop(self._key(callback), None) is not None
+
+    def clear(self):
+        self._callbacks.clear()
+
+    def __len__(self):
+        return sum(1 for ref in self._callbacks.values() if ref() is not None)
+
+    def __iter__(self):
+        for ref in list(self._callbacks.values()):
+            callback = ref()
+            if callback is not None:
+                yield callback
+
+    def __call__(self, *args):
+        for callback in self:
+            callback(*args)
+
+    def __deepcopy__(self, memo):
+        # Copies start without subscribers, callbacks belong to the original object
+        return CallbackList(self._registry)
+
+
+class ObserverRegistry:
+    '''
+    Keeps track of VTK observers. Every observer is registered under an owner and a name; subscribing
+    the same (owner, name) twice keeps the first observer, unsubscribing removes it from the observed
+    object. live_subscriptions counts the observers and all callbacks of the registered CallbackLists.
+    '''
+    def __init__(self):
+        self._observers = {}
+        self._callback_lists = weakref.WeakSet()
+
+    def subscribe(self, owner, name, vtk_object, event, callback):
+        key = (id(owner), name)
+        if key not in self._observers:
+            self._observers[key] = (vtk_object, vtk_object.AddObserver(event, callback))
+        return key
+
+    def unsubscribe(self, owner, name=None):
+        '''
+        Removes the observer with the given name, or all observers of the owner if no name is given
+        '''
+        if name is not None:
+            keys = [(id(owner), name)]
+        else:
+            keys = [key for key in self._observers if key[0] == id(owner)]
+        for key in keys:
+            observer = self._observers.pop(key, None)
+            if observer is not None:
+                vtk_object, tag = observer
+                vtk_object.RemoveObserver(tag)
+
+    def is_subscribed(self, owner, name):
+        return (id(owner), name) in self._observers
+
+    @property
+    def live_subscriptions(self):
+        return len(self._observers) + sum(len(callbacks) for callbacks in self._callback_lists)
+
+
+OBSERVER_REGISTRY = ObserverRegistry()
@@ -0,0 +1,192 @@
+import hashlib
+import os
+import os.path as osp
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from Resources.threshold_engine import threshold_volume
+
+class _PendingMask:
+    '''
+    Result of a mask that is being computed outside the lock of the cache
+    '''
+    def __init__(self):
+        self._done = threading.Event()
+        self._mask = None
+        self._error = None
+
+    def set_result(self, mask):
+        self._mask = mask
+        self._done.set()
+
+    def set_error(self, error):
+        self._error = error
+        self._done.set()
+
+    def result(self):
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+        return self._mask
+
+class SegmentationCache:
+    '''
+    LRU cache for threshold masks and surfaces of the bone segmentation.
+
+    Masks are keyed by (volume key, lower, upper), surfaces by (mask key, converter, smoothing factor). The
+    volume key has to change whenever the voxels change, the converter names the method that built the
+    surface from the mask. Entries are held in memory up to memory_budget bytes; masks
+    that are evicted from memory are bit-packed and written to cache_dir as long as disk_budget bytes allow.
+
+    A mask for a new threshold range that lies inside a cached range is derived from the cached mask by
+    re-testing only the image rows that contain its voxels, otherwise the volume is thresholded again.
+    The cache can be shared between the UI thread and background segmentation jobs; the volume is
+    thresholded outside the lock, so jobs for different volumes or ranges do not wait for each other.
+    '''
+    INCREMENTAL_ROW_FRACTION = 0.25
+    def __init__(self, memory_budget=2*1024**3, disk_budget=0, cache_dir=None):
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict() # key -> (value, number of bytes)
+        self._disk = OrderedDict() # mask key -> (file path, number of bytes, shape)
+        self._pending = {} # mask key -> _PendingMask of the job that computes it
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def surface_key(mask_key, converter, smoothing):
+        return ("surface", mask_key, converter, round(float(smoothing), 6))
+
+    def mask(self, volume_key, voxels, lower, upper, workers=None):
+        '''
+        Returns the mask key and the binary mask (uint8) of lower <= voxels <= upper.
+        The lock is only held for the lookup and the insert. A job that asks for a mask that another
+        job is computing waits for that result instead of thresholding the volume a second time.
+        '''
+        key = ("mask", volume_key, lower, upper)
+        with self._lock:
+            mask = self._get(key)
+            if mask is not None:
+                self.hits += 1
+                return key, mask
+            pending = self._pending.get(key)
+            computing = pending is None
+            if computing:
+                self.misses += 1
+                pending = self._pending[key] = _PendingMask()
+                superset = self._cached_superset(volume_key, lower, upper)
+            else:
+                self.hits += 1
+        if not computing:
+            return key, pending.result()
+
+        try:
+            mask = self._threshold(voxels, lower, upper, superset, workers)
+        except BaseException as error:
+            with self._lock:
+                del self._pending[key]
+            pending.set_error(error)
+            raise
+        with self._lock:
+            self._put(key, mask, mask.nbytes)
+            del self._pending[key]
+        pending.set_result(mask)
+        return key, mask
+
+    def surface(self, mask_key, converter, smoothing):
+        '''
+        Returns the cached surface for the mask, converter and smoothing factor, or None
+        '''
+        with self._lock:
+            surface = self._get(self.surface_key(mask_key, converter, smoothing))
+            if surface is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return surface
+
+    def store_surface(self, mask_key, converter, smoothing, surface, nbytes):
+        with self._lock:
+            self._put(self.surface_key(mask_key, converter, smoothing), surface, nbytes)
+
+    def clear(self):
+        with self._lock:
+            for path, nbytes, shape in self._disk.values():
+                if osp.exists(path):
+                    os.remove(path)
+            self._memory.clear()
+            self._disk.clear()
+
+    @property
+    def memory_usage(self):
+        return sum(nbytes for value, nbytes in self._memory.values())
+
+    @property
+    def disk_usage(self):
+        return sum(nbytes for path, nbytes, shape in self._disk.values())
+
+    # Internal helpers
+    def _threshold(self, voxels, lower, upper, superset, workers):
+        if superset is not None:
+            # Only voxels inside the cached range can be inside the narrower one, so only the
+            # image rows that contain some of them are thresholded again. If most rows are affected
+            # the parallel full threshold is faster.
+            row_length = voxels.shape[-1]
+            superset_rows = superset.reshape(-1, row_length)
+            rows = np.flatnonzero(superset_rows.any(axis=1))
+            if len(rows) < self.INCREMENTAL_ROW_FRACTION*len(superset_rows):
+                values = voxels.reshape(-1, row_length)[rows]
+                mask = np.zeros(voxels.shape, dtype=np.uint8)
+                mask.reshape(-1, row_length)[rows] = (values >= lower) & (values <= upper) & (superset_rows[rows] != 0)
+                return mask
+        return threshold_volume(voxels, lower, upper, workers)
+
+    def _cached_superset(self, volume_key, lower, upper):
+        # Smallest cached mask in memory whose range contains [lower, upper]
+        best, best_width = None, None
+        for key, (value, nbytes) in self._memory.items():
+            if key[0] == "mask" and key[1] == volume_key and key[2] <= lower and upper <= key[3]:
+                width = key[3] - key[2]
+                if best is None or width < best_width:
+                    best, best_width = value, width
+        return best
+
+    def _get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return self._memory[key][0]
+        if key in self._disk:
+            path, nbytes, shape = self._disk.pop(key)
+            mask = np.unpackbits(np.load(path), count=int(np.prod(shape))).reshape(shape)
+            os.remove(path)
+            self._put(key, mask, mask.nbytes)
+            return mask
+        return None
+
+    def _put(self, key, value, nbytes):
+        self._memory[key] = (value, nbytes)
+        self._memory.move_to_end(key)
+        while self.memory_usage > self.memory_budget and len(self._memory) > 1:
+            old_key, (old_value, old_nbytes) = self._memory.popitem(last=False)
+            if isinstance(old_value, np.ndarray):
+                self._spill(old_key, old_value)
+
+    def _spill(self, key, mask):
+        packed = np.packbits(mask.reshape(-1) != 0)
+        if self.disk_budget <= 0 or packed.nbytes > self.disk_budget:
+            return
+        if self.cache_dir is None:
+            self.cache_dir = tempfile.mkdtemp(prefix="BoneAngleMeterSegmentationCache")
+        # hash() of the key changes between sessions and can collide, the digest of its repr does neither
+        path = osp.join(self.cache_dir, f"mask_{hashlib.sha1(repr(key).encode('utf-8')).hexdigest()}.npy")
+        np.save(path, packed)
+        self._disk[key] = (path, packed.nbytes, mask.shape)
+        while self.disk_usage > self.disk_budget:
+            old_path, old_nbytes, old_shape = self._disk.popitem(last=False)[1]
+            if osp.exists(old_path):
+                os.remove(old_path)
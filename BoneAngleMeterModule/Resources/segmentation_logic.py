@@ -0,0 +1,328 @@
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import slicer
+import vtk
+from vtk.util import numpy_support
+
+from Resources.threshold_engine import threshold_volume
+from BoneAngleMeterCore.instrumentation import TRACER
+
+PREVIEW_VOXELS = 128**3
+
+# Converters of the cached surfaces. The labelmap to closed surface conversion of Slicer and
+# surface_from_mask give different surfaces (e.g. Slicer may decimate), so they are cached separately.
+SLICER_CONVERSION = "slicer"
+VTK_PIPELINE = "surface_from_mask"
+
+def create_segmentation_node(name, volume_node, segment_name="Bones"):
+    '''
+    Replaces the segmentation node with the given ID/name by a new one with a single empty segment.
+    Returns the node and the segment ID.
+    '''
+    segmentation_node = slicer.mrmlScene.GetNodeByID(name)
+    if segmentation_node is not None:
+        slicer.mrmlScene.RemoveNode(segmentation_node)
+    segmentation_node = slicer.mrmlScene.AddNewNodeByClassWithID("vtkMRMLSegmentationNode", "", name)
+    segmentation_node.CreateDefaultDisplayNodes() # only needed for display
+    segmentation_node.SetReferenceImageGeometryParameterFromVolumeNode(volume_node)
+    segmentation_node.SetName(name)
+    segment_id = segmentation_node.GetSegmentation().AddEmptySegment(segment_name)
+    return segmentation_node, segment_id
+
+def threshold_with_segment_editor(segmentation_node, segment_id, volume_node, lower, upper):
+    '''
+    Thresholds the volume by driving the "Threshold" effect of a temporary segment editor
+    '''
+    # Create segment editor to get access to effects
+    segment_editor_widget = slicer.qMRMLSegmentEditorWidget()
+    segment_editor_widget.setMRMLScene(slicer.mrmlScene)
+    segment_editor_node = slicer.mrmlScene.AddNewNodeByClass("vtkMRMLSegmentEditorNode")
+    segment_editor_widget.setMRMLSegmentEditorNode(segment_editor_node)
+    segment_editor_widget.setSegmentationNode(segmentation_node)
+    segment_editor_widget.setCurrentSegmentID(segment_id)
+    segment_editor_widget.setMasterVolumeNode(volume_node)
+
+    # Thresholding
+    segment_editor_widget.setActiveEffectByName("Threshold")
+    effect = segment_editor_widget.activeEffect()
+    effect.setParameter("MinimumThreshold", f"{lower}")
+    effect.setParameter("MaximumThreshold", f"{upper}")
+    effect.self().onApply()
+
+    # Clean up
+    segment_editor_widget = None
+    slicer.mrmlScene.RemoveNode(segment_editor_node)
+
+def threshold_with_engine(segmentation_node, segment_id, volume_node, lower, upper, workers=None):
+    '''
+    Thresholds the voxel array directly with threshold_volume and writes the mask as labelmap of the segment
+    '''
+    voxels = slicer.util.arrayFromVolume(volume_node)
+    mask = threshold_volume(voxels, lower, upper, workers)
+    slicer.util.updateSegmentBinaryLabelmapFromArray(mask, segmentation_node, segment_id, volume_node)
+    return mask
+
+def volume_cache_key(volume_node):
+    '''
+    Identifies the voxels of a volume node, changes whenever the image data is modified
+    '''
+    return (volume_node.GetID(), volume_node.GetImageData().GetMTime())
+
+def create_surface(segmentation_node, smoothing):
+    segmentation_node.GetSegmentation().SetConversionParameter("Smoothing factor", f"{smoothing}")
+    segmentation_node.CreateClosedSurfaceRepresentation()
+
+def get_surface(segmentation_node, segment_id):
+    '''
+    Returns a copy of the closed surface of the segment
+    '''
+    name = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+    surface = vtk.vtkPolyData()
+    surface.DeepCopy(segmentation_node.GetSegmentation().GetSegment(segment_id).GetRepresentation(name))
+    return surface
+
+def surface_vertices(segmentation_node, segment_id):
+    '''
+    Returns the vertices of the closed surface of the segment as (n, 3) array in RAS coordinates
+    '''
+    name = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+    surface = segmentation_node.GetSegmentation().GetSegment(segment_id).GetRepresentation(name)
+    if surface is None or surface.GetPoints() is None:
+        return np.zeros((0, 3))
+    return numpy_support.vtk_to_numpy(surface.GetPoints().GetData()).astype(float)
+
+def set_surface(segmentation_node, segment_id, surface, smoothing):
+    '''
+    Uses a copy of a previously computed surface as closed surface of the segment instead of converting the labelmap
+    '''
+    segmentation_node.GetSegmentation().SetConversionParameter("Smoothing factor", f"{smoothing}")
+    name = slicer.vtkSegmentationConverter.GetSegmentationClosedSurfaceRepresentationName()
+    surface_copy = vtk.vtkPolyData()
+    surface_copy.DeepCopy(surface)
+    segmentation_node.GetSegmentation().GetSegment(segment_id).AddRepresentation(name, surface_copy)
+    segmentation_node.CreateClosedSurfaceRepresentation()
+
+def segment_bones(volume_node, name, lower, upper, smoothing, use_segment_editor=False, workers=None, cache=None):
+    '''
+    Creates the segmentation node name with a thresholded bone segment and its closed surface on the calling
+    thread. Apply uses it when progressive preview is off, otherwise it runs a SegmentationJob.
+    If a SegmentationCache is given, masks and surfaces are taken from it or added to it.
+    Returns the segmentation node, the segment ID and the durations of the stages in seconds.
+    '''
+    timings = {}
+    start = time.perf_counter()
+    segmentation_node, segment_id = create_segmentation_node(name, volume_node)
+    timings["create node"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    mask_key = None
+    if use_segment_editor:
+        threshold_with_segment_editor(segmentation_node, segment_id, volume_node, lower, upper)
+    elif cache is not None:
+        voxels = slicer.util.arrayFromVolume(volume_node)
+        mask_key, mask = cache.mask(volume_cache_key(volume_node), voxels, lower, upper, workers)
+        slicer.util.updateSegmentBinaryLabelmapFromArray(mask, segmentation_node, segment_id, volume_node)
+    else:
+        threshold_with_engine(segmentation_node, segment_id, volume_node, lower, upper, workers)
+    timings["threshold"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    surface = cache.surface(mask_key, SLICER_CONVERSION, smoothing) if mask_key is not None else None
+    if surface is not None:
+        set_surface(segmentation_node, segment_id, surface, smoothing)
+    else:
+        create_surface(segmentation_node, smoothing)
+        if mask_key is not None:
+            surface = get_surface(segmentation_node, segment_id)
+            cache.store_surface(mask_key, SLICER_CONVERSION, smoothing, surface, surface.GetActualMemorySize()*1024)
+    timings["surface"] = time.perf_counter() - start
+    return segmentation_node, segment_id, timings
+
+def ijk_to_ras_matrix(volume_node):
+    matrix = vtk.vtkMatrix4x4()
+    volume_node.GetIJKToRASMatrix(matrix)
+    return np.array([[matrix.GetElement(i, j) for j in range(4)] for i in range(4)])
+
+def surface_from_mask(mask, ijk_to_ras, smoothing):
+    '''
+    Builds a closed surface from a binary mask (k, j, i index order) with plain VTK filters, following the
+    labelmap to closed surface conversion of Slicer (flying edges, windowed sinc smoothing with pass band
+    10^(-4 * smoothing)). Does not touch the scene, so it can run outside the UI thread.
+    Returns the surface in RAS coordinates.
+    '''
+    padded = np.pad(mask, 1) # closes surfaces at the volume border
+    image = vtk.vtkImageData()
+    image.SetDimensions(padded.shape[::-1])
+    image.SetOrigin(-1, -1, -1)
+    image.GetPointData().SetScalars(numpy_support.numpy_to_vtk(padded.reshape(-1), deep=False, array_type=vtk.VTK_UNSIGNED_CHAR))
+
+    surface_filter = vtk.vtkDiscreteFlyingEdges3D()
+    surface_filter.SetInputData(image)
+    surface_filter.SetValue(0, 1)
+    surface_filter.ComputeGradientsOff()
+    surface_filter.ComputeNormalsOff()
+    output = surface_filter.GetOutputPort()
+
+    if smoothing > 0:
+        smoother = vtk.vtkWindowedSincPolyDataFilter()
+        smoother.SetInputConnection(output)
+        smoother.SetNumberOfIterations(20)
+        smoother.SetPassBand(math.pow(10.0, -4.0*smoothing))
+        smoother.BoundarySmoothingOff()
+        smoother.FeatureEdgeSmoothingOff()
+        smoother.NonManifoldSmoothingOn()
+        smoother.NormalizeCoordinatesOn()
+        output = smoother.GetOutputPort()
+
+    transform = vtk.vtkTransform()
+    transform.SetMatrix(ijk_to_ras.reshape(-1))
+    transform_filter = vtk.vtkTransformPolyDataFilter()
+    transform_filter.SetInputConnection(output)
+    transform_filter.SetTransform(transform)
+
+    normals = vtk.vtkPolyDataNormals()
+    normals.SetInputConnection(transform_filter.GetOutputPort())
+    normals.ConsistencyOn()
+    normals.AutoOrientNormalsOn()
+    normals.SplittingOff()
+    normals.Update()
+
+    surface = vtk.vtkPolyData()
+    surface.DeepCopy(normals.GetOutput())
+    return surface
+
+def preview_surface(volume_node, lower, upper, smoothing):
+    '''
+    Surface of a strided copy of the volume with at most about PREVIEW_VOXELS voxels
+    '''
+    voxels = slicer.util.arrayFromVolume(volume_node)
+    stride = max(1, math.ceil((voxels.size / PREVIEW_VOXELS)**(1/3)))
+    mask = threshold_volume(voxels[::stride, ::stride, ::stride], lower, upper)
+    ijk_to_ras = ijk_to_ras_matrix(volume_node) @ np.diag([stride, stride, stride, 1])
+    return surface_from_mask(mask, ijk_to_ras, smoothing)
+
+class SegmentationJob:
+    '''
+    Computes the full resolution bone mask and surface of a volume in a background thread, or on the
+    executor passed to start(). The job is created and applied on the UI thread: the constructor takes what is
+    needed from the scene, apply() creates the segmentation node once done() is true. A cancelled job stops
+    after its current stage. stage and elapsed describe the progress.
+    '''
+    def __init__(self, volume_node, name, lower, upper, smoothing, cache=None, workers=None):
+        self.volume_node = volume_node
+        self.name = name
+        self.parameters = (lower, upper, smoothing)
+        self.cache = cache
+        self.workers = workers
+        self.timings = {}
+        self.error = None
+        self.mask_key = None
+        self.mask = None
+        self.surface = None
+        # arrayFromVolume is a view of the image data, which the UI thread may modify or free while the
+        # job runs. The copy also keeps the voxels consistent with the volume key taken here.
+        self._voxels = slicer.util.arrayFromVolume(volume_node).copy()
+        self._ijk_to_ras = ijk_to_ras_matrix(volume_node)
+        self._volume_key = volume_cache_key(volume_node)
+        self.stage = "queued"
+        self._started = None
+        self._finished = None
+        self._cancelled = threading.Event()
+        self._done = threading.Event()
+
+    def start(self, executor=None):
+        if executor is not None:
+            executor.submit(self._run)
+        else:
+            threading.Thread(target=self._run, daemon=True).start()
+
+    @property
+    def elapsed(self):
+        if self._started is None:
+            return 0.0
+        return (self._finished or time.perf_counter()) - self._started
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def _run(self):
+        lower, upper, smoothing = self.parameters
+        self._started = time.perf_counter()
+        try:
+            if self.cancelled:
+                return
+            self.stage = "thresholding"
+            start = time.perf_counter()
+            with TRACER.span("segmentation.threshold", self.workers or 0):
+                if self.cache is not None:
+                    self.mask_key, self.mask = self.cache.mask(self._volume_key, self._voxels, lower, upper, self.workers)
+                else:
+                    self.mask = threshold_volume(self._voxels, lower, upper, self.workers)
+            self.timings["threshold"] = time.perf_counter() - start
+            if self.cancelled:
+                return
+
+            self.stage = "building surface"
+            start = time.perf_counter()
+            with TRACER.span("segmentation.surface"):
+                if self.mask_key is not None:
+                    self.surface = self.cache.surface(self.mask_key, VTK_PIPELINE, smoothing)
+                if self.surface is None:
+                    self.surface = surface_from_mask(self.mask, self._ijk_to_ras, smoothing)
+                    if self.mask_key is not None:
+                        self.cache.store_surface(self.mask_key, VTK_PIPELINE, smoothing, self.surface,
+                                                 self.surface.GetActualMemorySize()*1024)
+            self.timings["surface"] = time.perf_counter() - start
+            self.stage = "computed"
+        except Exception as e:
+            self.error = e
+            self.stage = "failed"
+        finally:
+            self._finished = time.perf_counter()
+            self._done.set()
+
+    def apply(self):
+        '''
+        Creates the segmentation node from the results. Returns the node and the segment ID.
+        '''
+        lower, upper, smoothing = self.parameters
+        start = time.perf_counter()
+        with TRACER.span("segmentation.apply"):
+            segmentation_node, segment_id = create_segmentation_node(self.name, self.volume_node)
+            slicer.util.updateSegmentBinaryLabelmapFromArray(self.mask, segmentation_node, segment_id, self.volume_node)
+            set_surface(segmentation_node, segment_id, self.surface, smoothing)
+        self.timings["apply"] = time.perf_counter() - start
+        self.stage = "done"
+        return segmentation_node, segment_id
+
+class SegmentationQueue:
+    '''
+    Runs SegmentationJobs on a bounded pool of worker threads. The CPU cores are split between the
+    parallel jobs for their thresholding.
+    '''
+    def __init__(self, max_parallel_jobs=2):
+        self.max_parallel_jobs = max_parallel_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_parallel_jobs)
+
+    @property
+    def workers_per_job(self):
+        return max(1, (os.cpu_count() or 1) // self.max_parallel_jobs)
+
+    def submit(self, job):
+        job.workers = self.workers_per_job
+        job.start(self._executor)
+        return job
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
\ No newline at end of file
@@ -0,0 +1,173 @@
+'''
+Append-only journal of landmark edits, so a reading session survives a crash.
+
+Layout (little endian):
+    header   magic, version, length of the names block, landmark names (UTF-8, separated by newlines)
+    records  fixed size records: landmark index, side (1 left, 2 right), x, y, z (float64), time (float64)
+
+Records are collected in memory and written and fsynced at most sync_interval seconds apart. A record
+that was only partly written is dropped when the journal is opened again. When the journal holds many
+more records than landmarks, it is rewritten with the latest record of every landmark. Once the session
+ended cleanly, i.e. the scene was closed or all landmarks were exported, the journal is deleted.
+'''
+import os
+import struct
+import time
+
+import numpy as np
+
+from BoneAngleMeterCore.landmark_definitions import LANDMARK_NAMES
+
+JOURNAL_MAGIC = b"BAMJRNL\0"
+JOURNAL_VERSION = 1
+JOURNAL_EXTENSION = ".bamj"
+JOURNAL_SIDES = ("", "left", "right")
+_HEADER = struct.Struct("<8sHI")
+_RECORD = np.dtype([('landmark', '<u1'), ('side', '<u1'), ('position', '<f8', (3,)), ('time', '<f8')])
+
+def _header(landmark_names):
+    names = "\n".join(landmark_names).encode('utf-8')
+    return _HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(names)) + names
+
+def read_journal(path):
+    '''
+    Returns the landmark names and the complete records of a journal, or None if the file is no journal
+    '''
+    with open(path, 'rb') as f:
+        data = f.read()
+    if len(data) < _HEADER.size or data[:8] != JOURNAL_MAGIC:
+        return None
+    magic, version, names_length = _HEADER.unpack_from(data)
+    if version != JOURNAL_VERSION or len(data) < _HEADER.size + names_length:
+        return None
+    start = _HEADER.size + names_length
+    landmark_names = tuple(data[_HEADER.size:start].decode('utf-8').split("\n"))
+    n_records = (len(data) - start) // _RECORD.itemsize
+    return landmark_names, np.frombuffer(data, dtype=_RECORD, count=n_records, offset=start)
+
+class SessionJournal:
+    '''
+    Journal of one case. append() records an edit; positions() returns the latest position of every
+    landmark of a side, which is what a recovery needs.
+    '''
+    COMPACT_MIN_RECORDS = 256
+
+    def __init__(self, path, sync_interval=1.0, landmark_names=LANDMARK_NAMES):
+        self.path = path
+        self.sync_interval = sync_interval
+        self.landmark_names = tuple(landmark_names)
+        self._index = {name: i for i, name in enumerate(self.landmark_names)}
+        self._latest = {} # (side, name): (position, time)
+        self._n_records = 0
+        self._buffer = bytearray()
+        self._last_sync = time.monotonic()
+        self._file = None
+
+        journal = read_journal(path) if os.path.exists(path) else None
+        if journal is not None:
+            names, records = journal
+            # Only the last record of every landmark matters, found without looping over all records
+            keys = records['side'].astype(np.int64)*256 + records['landmark']
+            keys, last = np.unique(keys[::-1], return_index=True)
+            for record in records[len(records) - 1 - last]:
+                name = names[record['landmark']] if record['landmark'] < len(names) else None
+                side = JOURNAL_SIDES[record['side']] if record['side'] < len(JOURNAL_SIDES) else None
+                if name in self._index and side:
+                    self._latest[(side, name)] = (record['position'].copy(), float(record['time']))
+            self._n_records = len(records)
+        # Starts a new file if there was none, drops partly written records, converts other name lists
+        # and compacts journals that were not compacted before the session ended
+        if (journal is None or names != self.landmark_names
+                or os.path.getsize(path) != len(_header(names)) + len(records)*_RECORD.itemsize
+                or self._needs_compaction()):
+            self.compact()
+        else:
+            self._file = open(path, 'ab')
+
+    def __len__(self):
+        return self._n_records
+
+    def positions(self, side):
+        '''
+        Dictionary of the latest positions of the landmarks of the given side
+        '''
+        return {name: position for (s, name), (position, t) in self._latest.items() if s == side}
+
+    def append(self, side, name, position, timestamp=None):
+        '''
+        Records an edit. Unchanged positions are skipped. The record reaches the disk with the next
+        flush, which happens here if the last one is more than sync_interval seconds ago.
+        '''
+        position = np.asarray(position, dtype=float)
+        latest = self._latest.get((side, name))
+        if latest is not None and np.array_equal(latest[0], position):
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        record = np.array([(self._index[name], JOURNAL_SIDES.index(side), position, timestamp)], dtype=_RECORD)
+        self._buffer += record.tobytes()
+        self._latest[(side, name)] = (position, timestamp)
+        self._n_records += 1
+        if time.monotonic() - self._last_sync >= self.sync_interval:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes and fsyncs the buffered records and compacts the journal if it grew too much
+        '''
+        self._last_sync = time.monotonic()
+        if not self._buffer:
+            return
+        self._file.write(self._buffer)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer = bytearray()
+        if self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self):
+        return self._n_records > max(self.COMPACT_MIN_RECORDS, 4*len(self._latest))
+
+    def discard(self, side):
+        '''
+        Forgets all records of a side
+        '''
+        self._latest = {key: value for key, value in self._latest.items() if key[0] != side}
+        self.compact()
+
+    def compact(self):
+        '''
+        Rewrites the journal with the latest record of every landmark. The new file replaces the old one
+        atomically, so a crash leaves one of them intact.
+        '''
+        if self._file is not None:
+            self._file.close()
+        latest = sorted(self._latest.items(), key=lambda item: item[1][1])
+        records = np.array([(self._index[name], JOURNAL_SIDES.index(side), position, t)
+                            for (side, name), (position, t) in latest], dtype=_RECORD)
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, 'wb') as f:
+            f.write(_header(self.landmark_names))
+            f.write(records.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        self._buffer = bytearray()
+        self._n_records = len(records)
+        self._file = open(self.path, 'ab')
+
+    def close(self):
+        if self._file is not None:
+            self.flush()
+            self._file.close()
+            self._file = None
+
+    def delete(self):
+        '''
+        Closes the journal without writing the buffered records and removes its file
+        '''
+        self._buffer = bytearray()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,83 @@
+'''
+Tests of the headless cohort scoring. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "CohortCliTest.py"
+'''
+import csv
+import os
+import os.path as osp
+import sys
+import tempfile
+import unittest
+
+MODULE_DIR = osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__))))
+sys.path.insert(0, MODULE_DIR)
+sys.path.insert(0, osp.join(MODULE_DIR, "Benchmarks"))
+from BoneAngleMeterCore.measurements import MEASUREMENTS
+from Resources import cohort_cli
+from Resources.csv_codec import CsvFormat, write_landmarks
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases
+
+def read_rows(path):
+    with open(path, newline='') as f:
+        return list(csv.DictReader(f))
+
+class CohortCliTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = osp.join(self.directory.name, "cohort")
+        points = synthetic_cases(3)
+        files = [osp.join("links", "case1.csv"), osp.join("rechts", "case2.csv"), "case3_left.csv"]
+        for path, case in zip(files, points):
+            os.makedirs(osp.dirname(osp.join(self.root, path)), exist_ok=True)
+            write_landmarks(osp.join(self.root, path), LANDMARK_NAMES, case, CsvFormat(';', ','))
+        with open(osp.join(self.root, "notes.csv"), 'w') as f:
+            f.write("patient,comment\n1,none\n")
+        self.output = osp.join(self.directory.name, "results.csv")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_infer_side(self):
+        self.assertEqual(cohort_cli.infer_side(osp.join("links", "case.csv")), "left")
+        self.assertEqual(cohort_cli.infer_side(osp.join("left", "case_rechts.csv")), "right")
+        self.assertEqual(cohort_cli.infer_side("Right-knee.csv"), "right")
+        self.assertEqual(cohort_cli.infer_side("bright.csv"), None)
+        self.assertEqual(cohort_cli.infer_side("left_right.csv", "left"), "left")
+
+    def test_score(self):
+        cohort_cli.run(self.root, self.output, workers=1)
+        rows = read_rows(self.output)
+        files = {row['file'] for row in rows}
+        self.assertEqual(len(files), 4)
+        self.assertTrue(all(osp.isabs(f) for f in files))
+        sides = {osp.basename(row['file']): row['side'] for row in rows}
+        self.assertEqual(sides, {"case1.csv": "left", "case2.csv": "right", "case3_left.csv": "left",
+                                 "notes.csv": ""})
+        skipped = [row for row in rows if osp.basename(row['file']) == "notes.csv"]
+        self.assertEqual(len(skipped), 1)
+        self.assertTrue(skipped[0]['description'].startswith("Skipped"))
+        self.assertEqual(len(rows), 3*len(MEASUREMENTS) + 1)
+        self.assertTrue(all(float(row['value']) > 0 for row in rows if row['measurement'] == "Tibia Torsion"))
+
+    def test_resume(self):
+        cohort_cli.run(self.root, self.output, workers=1)
+        complete = read_rows(self.output)
+        # An interruption in the middle of the last block
+        with open(self.output, 'rb+') as f:
+            f.truncate(osp.getsize(self.output) - 10)
+        done, processed = cohort_cli.run(self.root, self.output, workers=1)
+        self.assertEqual((done, processed), (3, 1))
+        self.assertEqual(read_rows(self.output), complete)
+        # The same root spelled differently, nothing is read again
+        cwd = os.getcwd()
+        os.chdir(self.directory.name)
+        try:
+            done, processed = cohort_cli.run(osp.join(".", "cohort"), self.output, workers=1)
+        finally:
+            os.chdir(cwd)
+        self.assertEqual((done, processed), (4, 0))
+        self.assertEqual(read_rows(self.output), complete)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+'''
+Tests of the CSV reading and writing. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "CsvCodecTest.py"
+'''
+import io
+import locale
+import os.path as osp
+import sys
+import tempfile
+import types
+import unittest
+from unittest import mock
+
+import numpy as np
+
+MODULE_DIR = osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__))))
+sys.path.insert(0, MODULE_DIR)
+sys.path.insert(0, osp.join(MODULE_DIR, "Benchmarks"))
+from Resources.csv_codec import (CsvFormat, iter_landmark_cases, locale_format, read_columns, read_landmark_file,
+                                 sniff_decimal, sniff_delimiter, user_locale_format, write_landmarks, write_measurements)
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases
+
+FORMATS = (CsvFormat(';', ','), CsvFormat(',', '.'))
+
+def fake_qt(number):
+    # qt module whose system locale formats 0.5 as number
+    system_locale = types.SimpleNamespace(toString=lambda value: number)
+    return types.SimpleNamespace(QLocale=types.SimpleNamespace(system=lambda: system_locale))
+
+class CsvCodecTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = osp.join(self.directory.name, "landmarks.csv")
+        self.points = synthetic_cases(1)[0]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, text):
+        with open(self.path, 'w', newline='') as f:
+            f.write(text)
+
+    def test_sniff_delimiter(self):
+        self.assertEqual(sniff_delimiter("landmark name;x;y;z\r\n"), ';')
+        self.assertEqual(sniff_delimiter("landmark name,x,y,z\r\n"), ',')
+        self.assertEqual(sniff_delimiter("landmark name\tx\ty\tz\n"), '\t')
+        self.assertEqual(sniff_delimiter("landmark name\n"), ',')
+
+    def test_sniff_decimal(self):
+        self.assertEqual(sniff_decimal(',', [["a", "1.5"]], [1]), '.')
+        self.assertEqual(sniff_decimal(';', [["a", "1,5"], ["b", "2"]], [1]), ',')
+        self.assertEqual(sniff_decimal(';', [["a", "1.5"], ["b", "-2.25e-05"]], [1]), '.')
+        self.assertEqual(sniff_decimal(';', [["a.b", "1"], ["c", "2"]], [1]), ',') # only numeric columns count
+        self.assertEqual(sniff_decimal(';', [["a", "1,5"], ["b", "2.5"]], [1]), ',')
+        self.assertEqual(sniff_decimal(';', [["a"]], [1]), ',')
+
+    def test_landmark_round_trip(self):
+        for csv_format in FORMATS:
+            with self.subTest(csv_format=csv_format):
+                write_landmarks(self.path, LANDMARK_NAMES, self.points, csv_format)
+                with open(self.path, newline='') as f:
+                    self.assertEqual(f.readline(), csv_format.delimiter.join(["landmark name", "x", "y", "z"]) + "\r\n")
+                point_dict = read_landmark_file(self.path)
+                self.assertEqual(list(point_dict), list(LANDMARK_NAMES))
+                np.testing.assert_array_equal(np.array(list(point_dict.values())), self.points)
+
+    def test_measurement_round_trip(self):
+        values = [12.345678901234567, -0.5, 1e-7, 30.0]
+        descriptions = ["internal; torsion", "valgus, slight", 'quoted "text"', ""]
+        for csv_format in FORMATS:
+            with self.subTest(csv_format=csv_format):
+                f = io.StringIO(newline='')
+                write_measurements(f, ["a", "b", "c", "d"], values, descriptions, csv_format)
+                with open(self.path, 'w', newline='') as out:
+                    out.write(f.getvalue())
+                columns = read_columns(self.path, ["value"])
+                self.assertEqual(columns["measurement"], ["a", "b", "c", "d"])
+                self.assertEqual(columns["value"].tolist(), values)
+                self.assertEqual(columns["description"], descriptions)
+
+    def test_baseline_files(self):
+        # As written by the exporter of the original module: locale.str, '%.12g', for a German and an English locale
+        self.write("landmark name;x;y;z\r\n"
+                   "femur neck;12,3456789012;-3;100,5\r\n"
+                   "lateral talus;-0,000123456789012;4,5e-05;7\r\n")
+        np.testing.assert_array_equal(read_landmark_file(self.path)["lateral talus"], [-0.000123456789012, 4.5e-05, 7])
+        self.assertEqual(read_landmark_file(self.path)["femur neck"].tolist(), [12.3456789012, -3, 100.5])
+        self.write("landmark name,x,y,z\r\n"
+                   "femur neck,12.3456789012,-3,100.5\r\n")
+        self.assertEqual(read_landmark_file(self.path)["femur neck"].tolist(), [12.3456789012, -3, 100.5])
+        # Integer coordinates only, no decimal point to sniff
+        self.write("landmark name;x;y;z\r\nfemur neck;12;-3;100\r\n")
+        self.assertEqual(read_landmark_file(self.path)["femur neck"].tolist(), [12, -3, 100])
+
+    def test_other_files(self):
+        self.write("patient,comment\r\n1,none\r\n")
+        self.assertIsNone(read_landmark_file(self.path))
+        self.write("landmark name,x,y\r\na,1,2\r\n")
+        with self.assertRaises(ValueError):
+            read_landmark_file(self.path)
+        self.write("landmark name,x,y,z\r\na,1,two,3\r\n")
+        with self.assertRaises(ValueError):
+            read_landmark_file(self.path)
+
+    def test_landmark_cases_in_blocks(self):
+        points = synthetic_cases(3)
+        self.write("case;landmark name;x;y;z\r\n" + "".join(
+            f"{case};{name};" + ";".join(repr(float(v)).replace('.', ',') for v in position) + "\r\n"
+            for case in range(3) for name, position in zip(LANDMARK_NAMES, points[case])))
+        cases = list(iter_landmark_cases(self.path, block_rows=5))
+        self.assertEqual([case for case, point_dict in cases], ["0", "1", "2"])
+        for (case, point_dict), expected in zip(cases, points):
+            np.testing.assert_array_equal(np.array(list(point_dict.values())), expected)
+
+    def test_user_locale_format(self):
+        current = locale.setlocale(locale.LC_NUMERIC)
+        with mock.patch.dict(sys.modules, {"qt": fake_qt("0,5")}):
+            self.assertEqual(user_locale_format(), CsvFormat(';', ','))
+        with mock.patch.dict(sys.modules, {"qt": fake_qt("0.5")}):
+            self.assertEqual(user_locale_format(), CsvFormat(',', '.'))
+        with mock.patch.dict(sys.modules, {"qt": None}): # import fails
+            self.assertEqual(user_locale_format(), locale_format())
+        self.assertEqual(locale.setlocale(locale.LC_NUMERIC), current)
+        with mock.patch.object(locale, "setlocale", side_effect=AssertionError("setlocale called")):
+            with mock.patch.dict(sys.modules, {"qt": fake_qt("0,5")}):
+                user_locale_format()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+'''
+Tests of the landmark archive. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "LandmarkArchiveTest.py"
+'''
+import os
+import os.path as osp
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+MODULE_DIR = osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__))))
+sys.path.insert(0, MODULE_DIR)
+sys.path.insert(0, osp.join(MODULE_DIR, "Benchmarks"))
+from Resources.csv_codec import CsvFormat, read_landmark_file, write_landmarks
+from Resources.landmark_archive import LandmarkArchive, archive_to_csv, csv_to_archive, write_archive
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases
+
+class LandmarkArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = osp.join(self.directory.name, "cohort.lma")
+        self.points = synthetic_cases(7)
+        self.placed = np.random.default_rng(0).random(self.points.shape[:2]) < 0.8
+        self.case_ids = [f"case {i}" for i in range(len(self.points))]
+        self.sides = ["left", "right", None, "left", None, "right", "right"]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_archive(self, landmark_names, dtype):
+        n_landmarks = len(landmark_names)
+        points, placed = self.points[:, :n_landmarks], self.placed[:, :n_landmarks]
+        write_archive(self.path, points, placed, self.case_ids, self.sides, landmark_names, dtype)
+        with LandmarkArchive(self.path) as archive:
+            self.assertEqual(len(archive), len(points))
+            self.assertEqual(archive.landmark_names, tuple(landmark_names))
+            self.assertEqual(archive.case_ids, self.case_ids)
+            self.assertEqual(list(archive.sides), [side or "" for side in self.sides])
+            np.testing.assert_array_equal(archive.placed, placed)
+            self.assertIsInstance(archive.points, np.memmap)
+            self.assertEqual(archive.points.dtype, dtype)
+            self.assertEqual(archive.points.offset % 64, 0)
+            np.testing.assert_array_equal(archive.points, np.where(placed[..., np.newaxis], points.astype(dtype), np.nan))
+
+            # Slices of cases are read-only views of the memory map
+            point_dict = archive.point_dict(slice(2, 5))
+            self.assertEqual(list(point_dict), list(landmark_names))
+            for i, name in enumerate(landmark_names):
+                view = point_dict[name]
+                self.assertEqual(view.shape, (3, 3))
+                self.assertTrue(np.shares_memory(view, archive.points))
+                self.assertFalse(view.flags.writeable)
+                np.testing.assert_array_equal(view, archive.points[2:5, i])
+
+            for i in range(len(points)):
+                case_id, side, positions = archive.case(i)
+                self.assertEqual((case_id, side), (self.case_ids[i], self.sides[i]))
+                self.assertEqual(list(positions), [name for name, p in zip(landmark_names, placed[i]) if p])
+                for name, position in positions.items():
+                    self.assertEqual(position.dtype, np.float64)
+                    np.testing.assert_array_equal(position, points[i, landmark_names.index(name)].astype(dtype))
+
+    def test_round_trip(self):
+        for dtype in (np.float32, np.float64):
+            # The placed bitmap of 9 landmarks ends inside its second byte
+            for landmark_names in (LANDMARK_NAMES, LANDMARK_NAMES[:9]):
+                with self.subTest(dtype=dtype, n_landmarks=len(landmark_names)):
+                    self.check_archive(landmark_names, dtype)
+
+    def test_empty_archive(self):
+        write_archive(self.path, np.zeros((0, len(LANDMARK_NAMES), 3)), landmark_names=LANDMARK_NAMES)
+        with LandmarkArchive(self.path) as archive:
+            self.assertEqual(len(archive), 0)
+            self.assertEqual(archive.points.shape, (0, len(LANDMARK_NAMES), 3))
+            self.assertEqual(archive.placed.shape, (0, len(LANDMARK_NAMES)))
+
+    def test_csv_conversion_skips_invalid_files(self):
+        root = osp.join(self.directory.name, "cohort")
+        os.makedirs(osp.join(root, "left"))
+        names = list(LANDMARK_NAMES)
+        write_landmarks(osp.join(root, "left", "a.csv"), names, self.points[0], CsvFormat(';', ','))
+        write_landmarks(osp.join(root, "b_right.csv"), names[:10], self.points[1, :10])
+        write_landmarks(osp.join(root, "unknown.csv"), names + ["knee"], list(self.points[2]) + [(0.0, 0.0, 0.0)])
+        with open(osp.join(root, "notes.csv"), 'w') as f:
+            f.write("patient,comment\n1,none\n")
+        with open(osp.join(root, "broken.csv"), 'w') as f:
+            f.write("landmark name,x,y\na,1,2\n")
+
+        n_cases, skipped = csv_to_archive(root, self.path, landmark_names=LANDMARK_NAMES, dtype=np.float64)
+        self.assertEqual(n_cases, 2)
+        self.assertEqual(sorted(osp.basename(path) for path, reason in skipped), ["broken.csv", "notes.csv", "unknown.csv"])
+        self.assertIn("knee", dict(skipped)[osp.join(root, "unknown.csv")])
+        with LandmarkArchive(self.path) as archive:
+            self.assertEqual(archive.case_ids, ["b_right", "left/a"])
+            self.assertEqual(list(archive.sides), ["right", "left"])
+            self.assertEqual(archive.placed.sum(axis=1).tolist(), [10, len(names)])
+
+        written = archive_to_csv(self.path, osp.join(self.directory.name, "export"), ';')
+        self.assertEqual(len(written), 2)
+        for path, source in zip(written, (osp.join(root, "b_right.csv"), osp.join(root, "left", "a.csv"))):
+            exported, original = read_landmark_file(path), read_landmark_file(source)
+            self.assertEqual(list(exported), list(original))
+            for name in original:
+                np.testing.assert_array_equal(exported[name], original[name])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+'''
+Tests of the measurements of BoneAngleMeterCore. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "MeasurementTest.py"
+
+The batch evaluation (measure_batch) has to give the same numbers as the single case path (_measure), and
+both have to agree with the formulas of the module before the measurements were vectorized and fused.
+'''
+import math
+import os.path as osp
+import sys
+import unittest
+
+import numpy as np
+
+MODULE_DIR = osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__))))
+sys.path.insert(0, MODULE_DIR)
+sys.path.insert(0, osp.join(MODULE_DIR, "Benchmarks"))
+from BoneAngleMeterCore.helpers import fit_sphere
+from BoneAngleMeterCore.measurements import MEASUREMENTS
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases, point_dicts
+
+# Formulas of the original module, one function per measurement that returns the angle in degrees and
+# the orientation q whose sign selects the label
+def _project(normal, vector):
+    return vector - np.dot(normal, vector)/(np.linalg.norm(normal)**2) * normal
+
+def _angle(u, v):
+    return math.acos(np.dot(u, v)/(np.linalg.norm(u)*np.linalg.norm(v)))*180/math.pi
+
+def _plane_angle(normal, u, v, t_order=1):
+    u, v = _project(normal, u), _project(normal, v)
+    t = np.cross(u, v) if t_order == 1 else np.cross(v, u)
+    return _angle(u, v), np.dot(t, normal)
+
+def _baseline(name, p):
+    tibia_axis = p["proximal tibia midpoint"] - p["distal tibia midpoint"]
+    femur_axis = p["proximal femur midpoint"] - p["distal femur midpoint"]
+    cochlear = p["lateral cochlea"] - p["medial cochlea"]
+    tibial_condylar = p["condylus lateralis tibiae"] - p["condylus medialis tibiae"]
+    femoral_condylar = p["lateral femur condyle"] - p["medial femur condyle"]
+    if name == "Tibia Torsion":
+        return _plane_angle(tibia_axis, cochlear, tibial_condylar, t_order=2)
+    if name == "Varus Valgus Tibia":
+        return _plane_angle(np.cross(tibia_axis, tibial_condylar),
+                            p["medial cochlea articulation point tibia"] - p["lateral cochlea articulation point tibia"],
+                            p["medial condyle articulation point tibia"] - p["lateral condyle articulation point tibia"])
+    if name == "Tibiotalar Rotation":
+        return _plane_angle(tibia_axis, cochlear, p["lateral talus"] - p["medial talus"])
+    if name == "Femorotibial Rotation":
+        return _plane_angle(tibia_axis, femoral_condylar, tibial_condylar)
+    if name == "Varus Valgus Femur":
+        a, q = _plane_angle(np.cross(-femur_axis, femoral_condylar), femur_axis, femoral_condylar)
+        return a - 90, q
+    if name == "Antetorsion":
+        # The sphere fit itself is compared with scipy in SphereFitTest
+        center, radius = fit_sphere(np.array([p[f"point on femur head {i}"] for i in range(1, 6)]))
+        return _plane_angle(femur_axis, femoral_condylar, p["femur neck"] - center)
+    raise KeyError(name)
+
+def degenerate_cases():
+    '''
+    Cases in which one vector of every measurement vanishes, or the tibia or femur axis does
+    '''
+    points = synthetic_cases(4, seed=1)
+    index = {name: i for i, name in enumerate(LANDMARK_NAMES)}
+    for a, b in [("lateral cochlea", "medial cochlea"), ("lateral femur condyle", "medial femur condyle"),
+                 ("lateral talus", "medial talus"), ("femur neck", "point on femur head 1"),
+                 ("lateral cochlea articulation point tibia", "medial cochlea articulation point tibia")]:
+        points[0, index[a]] = points[0, index[b]]
+    points[1, index["proximal tibia midpoint"]] = points[1, index["distal tibia midpoint"]]
+    points[2, index["proximal femur midpoint"]] = points[2, index["distal femur midpoint"]]
+    points[3, index["condylus lateralis tibiae"]] = points[3, index["condylus medialis tibiae"]]
+    return points
+
+class MeasurementTest(unittest.TestCase):
+
+    def check(self, points):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self._check(points)
+
+    def _check(self, points):
+        for side in ("left", "right"):
+            for measurement in MEASUREMENTS:
+                m = measurement()
+                m.set_side(side)
+                angles, labels = m.measure_batch(points, LANDMARK_NAMES)
+                for i, point_dict in enumerate(point_dicts(points)):
+                    with self.subTest(side=side, measurement=m.name, case=i):
+                        angle, label = m._measure(point_dict)
+                        # The femur head of a single case is fitted on Python floats, which rounds differently
+                        np.testing.assert_allclose(angles[i], angle, rtol=0, atol=1e-9)
+                        self.assertEqual(labels[i], label)
+                        baseline_angle, q = _baseline(m.name, point_dict)
+                        np.testing.assert_allclose(angle, baseline_angle, rtol=0, atol=1e-6)
+                        self.assertEqual(label, m._label(q))
+
+    def test_synthetic_cases(self):
+        self.check(synthetic_cases(200))
+
+    def test_degenerate_cases(self):
+        points = degenerate_cases()
+        self.check(points)
+        # Tibia Torsion has a vanishing cochlear vector, tibia axis or tibial condylar vector in cases 0, 1, 3
+        m = MEASUREMENTS[0]()
+        m.set_side("right")
+        with np.errstate(invalid='ignore', divide='ignore'):
+            angles, labels = m.measure_batch(points, LANDMARK_NAMES)
+        self.assertTrue(np.isnan(angles[[0, 1, 3]]).all())
+        self.assertFalse(np.isnan(angles[2]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,172 @@
+'''
+Tests of the observer registry and the callback lists. They only need the standard library and also run
+without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "ObserverRegistryTest.py"
+'''
+import gc
+import os.path as osp
+import sys
+import unittest
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from Resources.observer_registry import CallbackList, ObserverRegistry
+
+class FakeVtkObject:
+    '''
+    The observer interface of vtkObject
+    '''
+    def __init__(self):
+        self.observers = {}
+        self._next_tag = 1
+
+    def AddObserver(self, event, callback):
+        tag = self._next_tag
+        self._next_tag += 1
+        self.observers[tag] = (event, callback)
+        return tag
+
+    def RemoveObserver(self, tag):
+        del self.observers[tag]
+
+    def InvokeEvent(self, event):
+        for observed_event, callback in list(self.observers.values()):
+            if observed_event == event:
+                callback(self, event)
+
+class Widget:
+
+    def __init__(self, calls):
+        self.calls = calls
+
+    def update(self, *args):
+        self.calls.append((self, args))
+
+class CallbackListTest(unittest.TestCase):
+
+    def test_bound_methods_are_dropped_with_their_object(self):
+        registry = ObserverRegistry()
+        callbacks = CallbackList(registry)
+        calls = []
+        widget = Widget(calls)
+        callbacks.add(widget.update)
+        callbacks.add(calls.append) # builtin methods are held by strong reference
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(registry.live_subscriptions, 2)
+
+        del widget
+        gc.collect()
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(len(callbacks._callbacks), 1)
+        self.assertEqual(registry.live_subscriptions, 1)
+        callbacks("x")
+        self.assertEqual(calls, ["x"])
+
+    def test_other_callables_are_kept(self):
+        calls = []
+        callbacks = CallbackList()
+        callbacks.add(lambda *args: calls.append(args))
+        gc.collect()
+        callbacks(1, 2)
+        self.assertEqual(calls, [(1, 2)])
+
+    def test_add_and_remove(self):
+        calls = []
+        widget = Widget(calls)
+        callbacks = CallbackList()
+        self.assertTrue(callbacks.add(widget.update))
+        self.assertFalse(callbacks.add(widget.update)) # a new bound method object of the same method
+        callbacks()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(callbacks.remove(widget.update))
+        self.assertFalse(callbacks.remove(widget.update))
+        callbacks()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(callbacks), 0)
+
+    def test_reentrancy(self):
+        calls = []
+        callbacks = CallbackList()
+
+        def late(*args):
+            calls.append("late")
+
+        def once(*args):
+            # Changes of the list during a call take effect from the next call on
+            calls.append("once")
+            callbacks.remove(once)
+            callbacks.add(late)
+
+        def nested(depth):
+            calls.append(("nested", depth))
+            if depth == 0:
+                callbacks(1)
+
+        callbacks.add(once)
+        callbacks.add(nested)
+        callbacks(0)
+        self.assertEqual(calls, ["once", ("nested", 0), ("nested", 1), "late"])
+        calls.clear()
+        callbacks(1)
+        self.assertEqual(calls, [("nested", 1), "late"])
+
+    def test_copies_start_without_callbacks(self):
+        from copy import deepcopy
+        registry = ObserverRegistry()
+        callbacks = CallbackList(registry)
+        callbacks.add(print)
+        copied = deepcopy(callbacks)
+        self.assertEqual(len(copied), 0)
+        copied.add(repr)
+        self.assertEqual(registry.live_subscriptions, 2)
+
+class ObserverRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = ObserverRegistry()
+        self.node = FakeVtkObject()
+        self.calls = []
+
+    def subscribe(self, owner, name, event="Modified"):
+        return self.registry.subscribe(owner, name, self.node, event,
+                                       lambda caller, event: self.calls.append((name, event)))
+
+    def test_subscribe_once(self):
+        owner = object()
+        self.subscribe(owner, "modified")
+        self.subscribe(owner, "modified")
+        self.assertEqual(len(self.node.observers), 1)
+        self.assertTrue(self.registry.is_subscribed(owner, "modified"))
+        self.node.InvokeEvent("Modified")
+        self.assertEqual(self.calls, [("modified", "Modified")])
+
+    def test_unsubscribe(self):
+        owner, other = object(), object()
+        self.subscribe(owner, "modified")
+        self.subscribe(owner, "ended", "End")
+        self.subscribe(other, "modified")
+        self.assertEqual(self.registry.live_subscriptions, 3)
+
+        self.registry.unsubscribe(owner, "ended")
+        self.registry.unsubscribe(owner, "ended") # unknown names are ignored
+        self.node.InvokeEvent("End")
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.registry.live_subscriptions, 2)
+
+        self.registry.unsubscribe(owner)
+        self.assertFalse(self.registry.is_subscribed(owner, "modified"))
+        self.assertTrue(self.registry.is_subscribed(other, "modified"))
+        self.assertEqual(len(self.node.observers), 1)
+        self.node.InvokeEvent("Modified")
+        self.assertEqual(len(self.calls), 1)
+
+    def test_unsubscribe_during_event(self):
+        owner = object()
+        self.registry.subscribe(owner, "once", self.node, "Modified",
+                                lambda caller, event: self.registry.unsubscribe(owner, "once"))
+        self.node.InvokeEvent("Modified")
+        self.node.InvokeEvent("Modified")
+        self.assertEqual(self.node.observers, {})
+        self.assertEqual(self.registry.live_subscriptions, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+'''
+Tests of the SegmentationCache. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "SegmentationCacheTest.py"
+'''
+import os
+import os.path as osp
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from Resources import segmentation_cache
+from Resources.segmentation_cache import SegmentationCache
+from Resources.threshold_engine import threshold_volume
+
+class SegmentationCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.voxels = np.random.default_rng(0).integers(-1000, 2000, size=(8, 16, 16)).astype(np.int16)
+
+    def test_mask(self):
+        cache = SegmentationCache()
+        key, mask = cache.mask("volume", self.voxels, 200, 1500)
+        np.testing.assert_array_equal(mask, (self.voxels >= 200) & (self.voxels <= 1500))
+        self.assertIs(cache.mask("volume", self.voxels, 200, 1500)[1], mask)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_volumes_are_thresholded_concurrently(self):
+        # Both jobs have to be inside threshold_volume at the same time, the barrier breaks otherwise
+        barrier = threading.Barrier(2, timeout=5)
+        def threshold(voxels, lower, upper, workers=None):
+            barrier.wait()
+            return threshold_volume(voxels, lower, upper, workers)
+        cache = SegmentationCache()
+        errors = []
+        def job(volume_key):
+            try:
+                cache.mask(volume_key, self.voxels, 200, 1500)
+            except threading.BrokenBarrierError as error:
+                errors.append(error)
+        with mock.patch.object(segmentation_cache, "threshold_volume", threshold):
+            threads = [threading.Thread(target=job, args=(volume_key,)) for volume_key in ("a", "b")]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+
+    def test_same_mask_is_computed_once(self):
+        started, release = threading.Event(), threading.Event()
+        calls = []
+        def threshold(voxels, lower, upper, workers=None):
+            calls.append((lower, upper))
+            started.set()
+            release.wait(5)
+            return threshold_volume(voxels, lower, upper, workers)
+        cache = SegmentationCache()
+        results = [None, None]
+        def job(i):
+            results[i] = cache.mask("volume", self.voxels, 200, 1500)[1]
+        with mock.patch.object(segmentation_cache, "threshold_volume", threshold):
+            first = threading.Thread(target=job, args=(0,))
+            first.start()
+            started.wait(5)
+            second = threading.Thread(target=job, args=(1,))
+            second.start()
+            release.set()
+            first.join()
+            second.join()
+        self.assertEqual(calls, [(200, 1500)])
+        self.assertIs(results[0], results[1])
+
+    def test_failed_mask_is_not_cached(self):
+        cache = SegmentationCache()
+        with mock.patch.object(segmentation_cache, "threshold_volume", side_effect=MemoryError):
+            with self.assertRaises(MemoryError):
+                cache.mask("volume", self.voxels, 200, 1500)
+        key, mask = cache.mask("volume", self.voxels, 200, 1500)
+        self.assertEqual(cache.misses, 2)
+
+    def test_narrower_range_is_derived_from_the_cached_mask(self):
+        # About 10% of the rows contain voxels of the cached range, so only those are thresholded again
+        voxels = np.random.default_rng(1).integers(-1000, 2000, size=(16, 32, 32)).astype(np.int16)
+        cache = SegmentationCache()
+        cache.mask("volume", voxels, 1990, 1999)
+        for lower, upper in [(1992, 1996), (1990, 1990), (1999, 1999), (1991, 1998)]:
+            with mock.patch.object(segmentation_cache, "threshold_volume", side_effect=AssertionError):
+                key, mask = cache.mask("volume", voxels, lower, upper)
+            self.assertEqual(mask.dtype, np.uint8)
+            np.testing.assert_array_equal(mask, threshold_volume(voxels, lower, upper))
+
+    def test_dense_superset_is_thresholded_again(self):
+        cache = SegmentationCache()
+        cache.mask("volume", self.voxels, 200, 1500)
+        with mock.patch.object(segmentation_cache, "threshold_volume", wraps=threshold_volume) as full:
+            key, mask = cache.mask("volume", self.voxels, 300, 1400)
+            cache.mask("other volume", self.voxels, 300, 1400)
+        self.assertEqual(full.call_count, 2)
+        np.testing.assert_array_equal(mask, (self.voxels >= 300) & (self.voxels <= 1400))
+
+    def test_least_recently_used_mask_is_evicted(self):
+        cache = SegmentationCache(memory_budget=2*self.voxels.size)
+        cache.mask("volume", self.voxels, 0, 100)
+        cache.mask("volume", self.voxels, 100, 200)
+        cache.mask("volume", self.voxels, 0, 100)
+        cache.mask("volume", self.voxels, 200, 300)
+        self.assertEqual(cache.memory_usage, 2*self.voxels.size)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        cache.mask("volume", self.voxels, 0, 100)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+        cache.mask("volume", self.voxels, 100, 200)
+        self.assertEqual((cache.hits, cache.misses), (2, 4))
+
+    def test_evicted_masks_are_spilled_to_disk(self):
+        packed_nbytes = (self.voxels.size + 7)//8
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SegmentationCache(memory_budget=self.voxels.size, disk_budget=packed_nbytes, cache_dir=directory)
+            first = cache.mask("volume", self.voxels, 0, 100)[1].copy()
+            second = cache.mask("volume", self.voxels, 100, 200)[1].copy()
+            self.assertEqual(len(os.listdir(directory)), 1)
+            self.assertEqual(cache.disk_usage, packed_nbytes)
+
+            # Reloading the first mask spills the second one, which leaves no room for the first on disk
+            with mock.patch.object(segmentation_cache, "threshold_volume", side_effect=AssertionError):
+                key, mask = cache.mask("volume", self.voxels, 0, 100)
+            np.testing.assert_array_equal(mask, first)
+            self.assertEqual((cache.hits, cache.misses), (1, 2))
+            self.assertEqual(len(os.listdir(directory)), 1)
+            np.testing.assert_array_equal(cache.mask("volume", self.voxels, 100, 200)[1], second)
+            self.assertEqual(cache.mask("volume", self.voxels, 0, 100)[1].sum(), first.sum())
+            self.assertEqual(cache.misses, 2)
+
+            # A mask that does not fit the disk budget is dropped
+            cache.disk_budget = packed_nbytes - 1
+            cache.mask("volume", self.voxels, 200, 300)
+            cache.mask("volume", self.voxels, 0, 100)
+            self.assertEqual(cache.misses, 4)
+            self.assertEqual(len(os.listdir(directory)), 1)
+
+            cache.disk_budget = packed_nbytes
+            cache.mask("volume", self.voxels, 300, 400)
+            self.assertEqual(len(os.listdir(directory)), 1)
+            cache.clear()
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_spilled_file_names_do_not_depend_on_the_session(self):
+        # hash() of a str differs between interpreters with different PYTHONHASHSEED
+        script = ("import os, sys, numpy as np; sys.path.insert(0, sys.argv[1]); "
+                  "from Resources.segmentation_cache import SegmentationCache; "
+                  "cache = SegmentationCache(memory_budget=64, disk_budget=64, cache_dir=sys.argv[2]); "
+                  "[cache.mask(('volume', 1), np.zeros((4, 4, 4), np.int16), i, i + 1) for i in range(2)]; "
+                  "print(os.listdir(sys.argv[2]))")
+        root = osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__))))
+        names = []
+        for seed in ("1", "2"):
+            with tempfile.TemporaryDirectory() as directory:
+                names.append(subprocess.run([sys.executable, "-c", script, root, directory], check=True,
+                                            capture_output=True, text=True, env=dict(os.environ, PYTHONHASHSEED=seed)).stdout)
+        self.assertEqual(names[0], names[1])
+        self.assertIn("mask_", names[0])
+
+    def test_surfaces(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = SegmentationCache(memory_budget=2*self.voxels.size, disk_budget=10*self.voxels.size,
+                                      cache_dir=directory)
+            key, mask = cache.mask("volume", self.voxels, 200, 1500)
+            self.assertIsNone(cache.surface(key, "vtk", 0.5))
+            surface = object()
+            cache.store_surface(key, "vtk", 0.5, surface, 1000)
+            self.assertIs(cache.surface(key, "vtk", 0.5 + 1e-9), surface)
+            self.assertIsNone(cache.surface(key, "vtk", 0.6))
+            self.assertIsNone(cache.surface(key, "slicer", 0.5))
+            self.assertEqual(cache.memory_usage, mask.nbytes + 1000)
+            self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+            # Evicted surfaces are dropped, only masks are written to disk
+            cache.mask("volume", self.voxels, 200, 1500)
+            cache.mask("volume", self.voxels, 0, 100)
+            self.assertIsNone(cache.surface(key, "vtk", 0.5))
+            self.assertEqual(os.listdir(directory), [])
+            self.assertEqual(cache.memory_usage, 2*self.voxels.size)
+
+if __name__ == '__main__':
+    unittest.main()
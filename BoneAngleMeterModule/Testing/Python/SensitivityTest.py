@@ -0,0 +1,123 @@
+'''
+Tests of the analytic derivatives of the measurements (sensitivity). They only need numpy and also run
+without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "SensitivityTest.py"
+
+The derivatives are compared with Richardson-extrapolated central differences, whose error is far below
+the tolerances away from a zero or straight angle.
+'''
+import os.path as osp
+import sys
+import types
+import unittest
+
+import numpy as np
+
+MODULE_DIR = osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__))))
+sys.path.insert(0, MODULE_DIR)
+sys.path.insert(0, osp.join(MODULE_DIR, "Benchmarks"))
+from BoneAngleMeterCore.geometry_graph import GeometryGraph
+from BoneAngleMeterCore.helpers import fit_sphere, sphere_center_jacobian
+from BoneAngleMeterCore.measurement_logic import AntetorsionMeasurement, TibiaTorsionMeasurement
+from BoneAngleMeterCore.measurements import MEASUREMENTS
+from synthetic_landmarks import LANDMARK_NAMES, synthetic_cases, point_dicts
+
+def richardson(f, step=1e-2):
+    # Central differences with steps h and h/2, extrapolated to remove the h**2 error term
+    return (4*f(step/2) - f(step))/3
+
+class SensitivityTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cases = synthetic_cases(12, seed=3)
+
+    def test_matches_finite_differences(self):
+        for measurement in MEASUREMENTS:
+            m = measurement()
+            for i, point_dict in enumerate(point_dicts(self.cases)):
+                with self.subTest(measurement=measurement.__name__, case=i):
+                    a, q = m._evaluate(point_dict)
+                    angle = a - m.SPEC.offset
+                    if min(angle, 180 - angle) < 0.5:
+                        continue # the differences straddle the kink, see test_zero_angle
+                    expected = richardson(lambda step: m.numerical_sensitivity(point_dict, step=step))
+                    np.testing.assert_allclose(m.sensitivity(point_dict), expected, rtol=0, atol=1e-6)
+
+    def test_stacked_cases(self):
+        for measurement in MEASUREMENTS:
+            m = measurement()
+            with self.subTest(measurement=measurement.__name__):
+                stacked = {name: self.cases[:, i] for i, name in enumerate(LANDMARK_NAMES)}
+                derivatives = m.sensitivity(stacked)
+                self.assertEqual(derivatives.shape, (len(self.cases), len(m.LANDMARK_NAMES), 3))
+                for case, point_dict in zip(derivatives, point_dicts(self.cases)):
+                    np.testing.assert_allclose(case, m.sensitivity(point_dict), rtol=0, atol=1e-9)
+
+    def test_sphere_center_jacobian(self):
+        points = self.cases[0, :5]
+        center, radius = fit_sphere(points)
+        jacobian = sphere_center_jacobian(points, center, radius)
+        self.assertEqual(jacobian.shape, (5, 3, 3))
+        for k in range(5):
+            for j in range(3):
+                def difference(step):
+                    shifted = points.copy()
+                    shifted[k, j] += step
+                    plus = fit_sphere(shifted)[0]
+                    shifted[k, j] -= 2*step
+                    return (plus - fit_sphere(shifted)[0])/(2*step)
+                np.testing.assert_allclose(jacobian[k, :, j], richardson(difference), rtol=0, atol=1e-6)
+
+    def test_geometry_graph(self):
+        # The nodes of a graph are not constants, unlike nodes given in a dictionary
+        point_dict = point_dicts(self.cases)[0]
+        graph = GeometryGraph([types.SimpleNamespace(name=name, revision=0, get_position=lambda p=p: p)
+                               for name, p in point_dict.items()])
+        m = AntetorsionMeasurement()
+        np.testing.assert_array_equal(m.sensitivity(graph), m.sensitivity(point_dict))
+
+    def test_given_femur_head_center(self):
+        m = AntetorsionMeasurement()
+        point_dict = point_dicts(self.cases)[0]
+        m.set_femur_head_center(fit_sphere(self.cases[0, :5])[0] + 1.0)
+        derivatives = m.sensitivity(point_dict)
+        np.testing.assert_array_equal(derivatives[:5], 0.0)
+        names = [name for name in m.LANDMARK_NAMES if name not in m.HEAD_POINT_NAMES]
+        expected = richardson(lambda step: m.numerical_sensitivity(point_dict, names, step=step))
+        np.testing.assert_allclose(m.sensitivity(point_dict, names), expected, rtol=0, atol=1e-6)
+
+    def test_zero_angle(self):
+        # The tibial condylar vector equals the cochlear vector, so the angle is 0 with q = 0 exactly
+        m = TibiaTorsionMeasurement()
+        point_dict = point_dicts(self.cases)[0]
+        point_dict["condylus medialis tibiae"] = point_dict["medial cochlea"]
+        point_dict["condylus lateralis tibiae"] = point_dict["lateral cochlea"]
+        a, q = m._evaluate(point_dict)
+        self.assertEqual((a - m.SPEC.offset, q), (0.0, 0.0))
+        kink = m.sensitivity(point_dict)
+        self.assertGreater(np.linalg.norm(kink), 1e-2)
+
+        # Rotating the cochlear vector within the plane crosses the kink
+        normal = point_dict["proximal tibia midpoint"] - point_dict["distal tibia midpoint"]
+        direction = np.cross(normal, point_dict["lateral cochlea"] - point_dict["medial cochlea"])
+        sides = {}
+        for sign in (1, -1):
+            shifted = dict(point_dict)
+            shifted["lateral cochlea"] = point_dict["lateral cochlea"] + sign*1e-6*direction/np.linalg.norm(direction)
+            a, q = m._evaluate(shifted)
+            sides[q > 0] = m.sensitivity(shifted)
+        # The derivatives at the kink are those of the side q > 0, with the same length as the other side
+        np.testing.assert_allclose(kink, sides[True], rtol=0, atol=1e-6)
+        np.testing.assert_allclose(kink, -sides[False], rtol=0, atol=1e-6)
+        self.assertAlmostEqual(m.error_budget(point_dict, 1.0)[0],
+                               float(np.linalg.norm(sides[False])), places=6)
+
+    def test_degenerate_vector(self):
+        m = TibiaTorsionMeasurement()
+        point_dict = point_dicts(self.cases)[0]
+        point_dict["condylus lateralis tibiae"] = point_dict["condylus medialis tibiae"]
+        self.assertTrue(np.isnan(m._evaluate(point_dict)[0]))
+        self.assertTrue(np.all(np.isnan(m.sensitivity(point_dict))))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+'''
+Tests of the session journal. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "SessionJournalTest.py"
+'''
+import os
+import os.path as osp
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from Resources.session_journal import SessionJournal, JOURNAL_EXTENSION
+
+NAMES = ("a", "b", "c")
+
+class SessionJournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = osp.join(self.directory.name, "case" + JOURNAL_EXTENSION)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reopen(self):
+        journal = SessionJournal(self.path, sync_interval=0, landmark_names=NAMES)
+        journal.append("left", "a", (1, 2, 3))
+        journal.append("left", "a", (4, 5, 6))
+        journal.append("right", "b", (7, 8, 9))
+        journal.close()
+        journal = SessionJournal(self.path, landmark_names=NAMES)
+        self.assertEqual({name: tuple(p) for name, p in journal.positions("left").items()}, {"a": (4, 5, 6)})
+        self.assertEqual({name: tuple(p) for name, p in journal.positions("right").items()}, {"b": (7, 8, 9)})
+        journal.close()
+
+    def test_discard(self):
+        journal = SessionJournal(self.path, sync_interval=0, landmark_names=NAMES)
+        journal.append("left", "a", (1, 2, 3))
+        journal.append("right", "b", (7, 8, 9))
+        journal.discard("left")
+        self.assertEqual(journal.positions("left"), {})
+        self.assertEqual(len(journal), 1)
+        journal.discard("right")
+        self.assertEqual(len(journal), 0)
+        journal.close()
+
+    def test_delete(self):
+        journal = SessionJournal(self.path, sync_interval=60, landmark_names=NAMES)
+        journal.append("left", "a", (1, 2, 3))
+        journal.delete()
+        self.assertFalse(osp.exists(self.path))
+        self.assertEqual(os.listdir(self.directory.name), [])
+        journal.close()
+
+if __name__ == '__main__':
+    unittest.main()
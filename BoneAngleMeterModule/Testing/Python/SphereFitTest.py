@@ -0,0 +1,63 @@
+'''
+Tests of the sphere fits of BoneAngleMeterCore. They only need numpy and also run without 3D Slicer:
+    python -m unittest discover -s Testing/Python -p "SphereFitTest.py"
+'''
+import os.path as osp
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+from BoneAngleMeterCore.helpers import fit_sphere, fit_sphere_algebraic
+
+def femur_heads(n, noise, seed=0):
+    '''
+    n sets of 5 points on the upper half of spheres with femur head radii, with Gaussian noise (mm)
+    '''
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0, 50, size=(n, 1, 3))
+    radii = rng.uniform(20, 28, size=(n, 1, 1))
+    directions = rng.normal(size=(n, 5, 3))
+    directions[..., 2] = np.abs(directions[..., 2])
+    directions /= np.linalg.norm(directions, axis=-1, keepdims=True)
+    points = centers + radii*directions + rng.normal(0, noise, size=(n, 5, 3))
+    return centers[:, 0], radii[:, 0, 0], points
+
+class SphereFitTest(unittest.TestCase):
+
+    def test_exact_points(self):
+        centers, radii, points = femur_heads(50, 0.0)
+        for fit in (fit_sphere_algebraic, fit_sphere):
+            fitted_centers, fitted_radii = fit(points)
+            np.testing.assert_allclose(fitted_centers, centers, atol=1e-9)
+            np.testing.assert_allclose(fitted_radii, radii, atol=1e-9)
+
+    def test_degenerate_set_does_not_change_the_others(self):
+        centers, radii, points = femur_heads(200, 1.0)
+        points[50, :, 2] = points[50, 0, 2] # coplanar
+        points[51] = points[51, 0]          # coincident
+        points[52, 0, 0] = np.nan           # missing landmark
+        for fit in (fit_sphere_algebraic, fit_sphere):
+            fitted_centers, fitted_radii = fit(points)
+            for i in range(len(points)):
+                center, radius = fit(points[i])
+                if i in (50, 51, 52):
+                    # Single degenerate sets are left to the stacked fit
+                    np.testing.assert_array_equal(fitted_centers[i], center)
+                    np.testing.assert_array_equal(fitted_radii[i], radius)
+                    continue
+                # A single set is fitted on Python floats, which rounds differently
+                np.testing.assert_allclose(fitted_centers[i], center, rtol=0, atol=1e-9)
+                np.testing.assert_allclose(fitted_radii[i], radius, rtol=0, atol=1e-9)
+            self.assertTrue(np.isnan(fitted_centers[52]).all())
+
+    def test_batch_shape(self):
+        _, _, points = femur_heads(6, 0.5)
+        centers, radii = fit_sphere(points.reshape(2, 3, 5, 3))
+        self.assertEqual(centers.shape, (2, 3, 3))
+        self.assertEqual(radii.shape, (2, 3))
+        np.testing.assert_array_equal(centers.reshape(6, 3), fit_sphere(points)[0])
+
+if __name__ == '__main__':
+    unittest.main()
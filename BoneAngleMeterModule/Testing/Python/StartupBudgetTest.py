@@ -0,0 +1,63 @@
+'''
+Startup cost of the module. Slicer imports BoneAngleMeterModule.py on every application start and runs
+setup() of its widget when the module is first opened. The tests need 3D Slicer, they run with ctest
+and are skipped in plain Python.
+'''
+import importlib
+import os.path as osp
+import sys
+import time
+import unittest
+
+sys.path.insert(0, osp.dirname(osp.dirname(osp.dirname(osp.abspath(__file__)))))
+try:
+    import qt, slicer
+except ImportError:
+    slicer = None
+
+IMPORT_BUDGET_MS = 100
+IMPORT_RUNS = 3
+PROJECT_PACKAGES = ("BoneAngleMeterModule", "Resources", "BoneAngleMeterCore")
+# Imported where they are first used, never by the import of the module or by setup()
+DEFERRED_MODULES = ("BoneAngleMeterCore.measurements", "BoneAngleMeterCore.helpers", "Resources.landmarks",
+                    "Resources.landmark_logic", "Resources.csv_codec", "Resources.session_journal",
+                    "Resources.segmentation_logic", "Resources.segmentation_cache", "Resources.threshold_engine")
+
+def forget_project_modules():
+    for name in list(sys.modules):
+        if name.split(".")[0] in PROJECT_PACKAGES:
+            del sys.modules[name]
+    importlib.invalidate_caches()
+
+def import_module():
+    forget_project_modules()
+    start = time.perf_counter()
+    module = importlib.import_module("BoneAngleMeterModule")
+    return module, time.perf_counter() - start
+
+@unittest.skipIf(slicer is None, "needs 3D Slicer")
+class StartupBudgetTest(unittest.TestCase):
+
+    def test_import_budget(self):
+        import_ms = min(import_module()[1] for _ in range(IMPORT_RUNS)) * 1000
+        self.assertLessEqual(import_ms, IMPORT_BUDGET_MS,
+                             f"import BoneAngleMeterModule takes {import_ms:.1f} ms")
+
+    def test_import_defers_modules(self):
+        import_module()
+        self.assertEqual([name for name in DEFERRED_MODULES if name in sys.modules], [])
+
+    def test_setup_defers_modules(self):
+        module, _ = import_module()
+        parent = slicer.qMRMLWidget()
+        parent.setLayout(qt.QVBoxLayout())
+        parent.setMRMLScene(slicer.mrmlScene)
+        widget = module.BoneAngleMeterModuleWidget(parent)
+        widget.setup()
+        try:
+            self.assertEqual([name for name in DEFERRED_MODULES if name in sys.modules], [])
+        finally:
+            widget.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()